@@ -1,7 +1,16 @@
 import csv
-import subprocess
 import os
 import glob
+import sys
+from pathlib import Path
+
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from workflow.profiling import profile_dir_from_argv, profiled
+from workflow.progress import Progress
+from workflow.runner import CommandRunner, ExecutableNotFound, Job, Quarantine, Step
+from workflow.runstate import RunState
+from workflow.tables import read_table, write_table, with_format, table_rows
 
 def add_id_column_to_cheese_file(target_folder):
     """
@@ -73,7 +82,28 @@ def add_id_column_to_cheese_file(target_folder):
         return None
 
 
-def process_smiles_file(target_folder, target_file):
+def build_scrub_command(smiles_string, sdf_output_filename, executable='scrub.py'):
+    """Command line of scrub.py: SMILES -> protonated 3D SDF"""
+    return [executable, smiles_string, '-o', sdf_output_filename]
+
+
+def build_mk_prepare_command(sdf_filename, pdbqt_output_filename, executable='mk_prepare_ligand.py'):
+    """Command line of mk_prepare_ligand.py: SDF -> PDBQT"""
+    return [executable, '-i', sdf_filename, '-o', pdbqt_output_filename]
+
+
+def print_id_list(title, ids, suffix='', limit=20):
+    """Print at most `limit` ligand ids of a report section"""
+    print(f"\n{title}")
+    print("-" * 70)
+    for ligand_id in ids[:limit]:
+        print(f"  • {ligand_id}{suffix}")
+    if len(ids) > limit:
+        print(f"  ... and {len(ids) - limit} more")
+
+
+def process_smiles_file(target_folder, target_file, metrics_path=None, progress_interval=10.0, state_path=None,
+                        workers=1, timeout=None, retries=0, quarantine_path=None, log_dir=None):
     """
     Process a CSV file containing SMILES strings through a two-step ligand preparation pipeline.
     
@@ -83,6 +113,17 @@ def process_smiles_file(target_folder, target_file):
     Args:
         target_folder (str): Path to the folder containing the CSV file
         target_file (str): Name of the CSV file to process
+        metrics_path (str): Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval (float): Seconds between two progress lines
+        state_path (str): Optional run-state database (see workflow/runstate.py). The ligands
+            of the CSV file are registered in it, only the ones not prepared yet are processed,
+            and each result is recorded in it instead of being checked on disk afterwards
+        workers (int): Number of ligands prepared at the same time
+        timeout (float): Maximum seconds of one scrub.py or mk_prepare_ligand.py call (None = no limit)
+        retries (int): Number of new attempts of a failed call
+        quarantine_path (str): Optional JSON file of the ligands that keep failing; they are
+            skipped after 3 failed runs (see workflow/runner.py)
+        log_dir (str): Optional folder keeping the output of the failed calls
     """
     
     csv_file_path = os.path.join(target_folder, target_file)
@@ -100,6 +141,63 @@ def process_smiles_file(target_folder, target_file):
     consecutive_empty_rows = 0
     MAX_CONSECUTIVE_EMPTY = 5  # Stop if we hit this many empty rows in a row
     all_processed_ids = []  # Track IDs we actually attempted to process
+    state = RunState(state_path) if state_path else None
+    progress = Progress("ligands-preparation", total=table_rows(csv_file_path), metrics_path=metrics_path,
+                        interval=progress_interval)
+    
+    runner = CommandRunner(workers, timeout, retries, log_dir=log_dir,
+                           quarantine=Quarantine(quarantine_path) if quarantine_path else None)
+    
+    def preparation_jobs(reader):
+        """One job (scrub.py then mk_prepare_ligand.py) per valid row, until too many empty rows"""
+        nonlocal processed_count, consecutive_empty_rows
+        for row in reader:
+            # Skip empty or malformed rows
+            if not row or len(row) < 2 or not row[0].strip() or not row[1].strip():
+                consecutive_empty_rows += 1
+                if consecutive_empty_rows >= MAX_CONSECUTIVE_EMPTY:
+                    print(f"\nEncountered {MAX_CONSECUTIVE_EMPTY} consecutive empty rows. Stopping processing.")
+                    return
+                continue
+            
+            smiles_string = row[0].strip()
+            ligand_id = row[1].strip()
+            
+            # Reset counter when we find valid data
+            consecutive_empty_rows = 0
+            processed_count += 1
+            all_processed_ids.append(ligand_id)  # Track this ID
+            if state is not None:
+                state.start('prepare', ligand_id)
+            
+            # Define output filenames
+            sdf_output_filename = f"{ligand_id}-prepared.sdf"
+            pdbqt_output_filename = f"{ligand_id}-prepared.pdbqt"
+            yield Job(ligand_id, [
+                Step("scrub.py", build_scrub_command(smiles_string, sdf_output_filename)),
+                Step("mk_prepare_ligand.py", build_mk_prepare_command(sdf_output_filename, pdbqt_output_filename))
+            ])
+    
+    def record(result):
+        nonlocal successful_conversions
+        ligand_id = result.key
+        for tool, seconds in result.step_seconds.items():
+            progress.add_time(tool, seconds)
+        if result.ok:
+            successful_conversions += 1
+        else:
+            # The error starts with the name of the tool that failed
+            print(f"  > ID {ligand_id}: {result.error}")
+            failed_conversions.append((ligand_id, result.error.splitlines()[0]))
+        if state is not None:
+            if result.ok:
+                state.finish('prepare', ligand_id,
+                             {'sdf': os.path.abspath(f"{ligand_id}-prepared.sdf"),
+                              'pdbqt': os.path.abspath(f"{ligand_id}-prepared.pdbqt")},
+                             result.seconds)
+            else:
+                state.fail('prepare', ligand_id, result.error.splitlines()[0], result.seconds)
+        progress.update(1, failed=int(not result.ok))
     
     try:
         with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
@@ -110,99 +208,24 @@ def process_smiles_file(target_folder, target_file):
             if header:
                 print(f"Header row: {header}\n")
             
-            # Process each subsequent row until the file ends or we hit too many empty rows
-            for row_num, row in enumerate(reader, start=2):
-                # Skip empty or malformed rows
-                if not row or len(row) < 2:
-                    consecutive_empty_rows += 1
-                    if consecutive_empty_rows >= MAX_CONSECUTIVE_EMPTY:
-                        print(f"\nEncountered {MAX_CONSECUTIVE_EMPTY} consecutive empty rows. Stopping processing.")
-                        break
-                    continue
-                
-                smiles_string = row[0].strip()
-                ligand_id = row[1].strip()
-                
-                # Skip rows where either SMILES or ligand_id is empty
-                if not smiles_string or not ligand_id:
-                    consecutive_empty_rows += 1
-                    if consecutive_empty_rows >= MAX_CONSECUTIVE_EMPTY:
-                        print(f"\nEncountered {MAX_CONSECUTIVE_EMPTY} consecutive empty rows. Stopping processing.")
-                        break
-                    continue
-                
-                # Reset counter when we find valid data
-                consecutive_empty_rows = 0
-                processed_count += 1
-                all_processed_ids.append(ligand_id)  # Track this ID
-                
-                # Progress indicator - just show count
-                print(f"[Ligand {processed_count}] Processing ID: {ligand_id}")
-                print(f"  SMILES: {smiles_string}")
-                
-                # Define output filenames
-                sdf_output_filename = f"{ligand_id}-prepared.sdf"
-                pdbqt_output_filename = f"{ligand_id}-prepared.pdbqt"
-                
-                scrub_success = False
-                
-                # --- STEP 1: Run scrub.py ---
-                try:
-                    print(f"  > Step 1: Running scrub.py...")
-                    command_scrub = ['scrub.py', smiles_string, '-o', sdf_output_filename]
-                    
-                    result_scrub = subprocess.run(
-                        command_scrub,
-                        capture_output=True, text=True, check=False
-                    )
-
-                    if result_scrub.returncode == 0:
-                        print(f"  > scrub.py SUCCESS. SDF file created: '{sdf_output_filename}'")
-                        scrub_success = True
-                    else: 
-                        print(f"  > scrub.py FAILED (Exit Code: {result_scrub.returncode}). Skipping Step 2.")
-                        print(f"  > Stderr from scrub.py: {result_scrub.stderr.strip()}")
-                        failed_conversions.append((ligand_id, "scrub.py failed"))
-                        
-                except FileNotFoundError:
-                    print(f"  > CRITICAL ERROR: 'scrub.py' not found. Check your PATH.")
-                    failed_conversions.append((ligand_id, "scrub.py not found"))
-                    break
-                except Exception as e:
-                    print(f"  > An unexpected error occurred during scrub.py execution: {e}")
-                    failed_conversions.append((ligand_id, f"scrub.py error: {e}"))
-       
-                # --- STEP 2: Run mk_prepare_ligand.py if scrub.py was successful ---
-                if scrub_success:
-                    try:
-                        print(f"  > Step 2: Running mk_prepare_ligand.py...")
-                        command_mk = ['mk_prepare_ligand.py', '-i', sdf_output_filename, '-o', pdbqt_output_filename]
-                        
-                        result_mk = subprocess.run(
-                            command_mk,
-                            capture_output=True, text=True, check=False
-                        )
-        
-                        if result_mk.returncode == 0:
-                            print(f"  > mk_prepare_ligand.py SUCCESS. PDBQT file created: '{pdbqt_output_filename}'")
-                            successful_conversions += 1
-                        else:
-                            print(f"  > mk_prepare_ligand.py FAILED (Exit Code: {result_mk.returncode}).")
-                            print(f"  > Stderr from mk_prepare_ligand.py: {result_mk.stderr.strip()}")
-                            failed_conversions.append((ligand_id, "mk_prepare_ligand.py failed"))
-                            
-                    except FileNotFoundError:
-                        print(f"  > CRITICAL ERROR: 'mk_prepare_ligand.py' not found. Check your PATH.")
-                        failed_conversions.append((ligand_id, "mk_prepare_ligand.py not found"))
-                        break
-                    except Exception as e:
-                        print(f"  > An unexpected error occurred during mk_prepare_ligand.py execution: {e}")
-                        failed_conversions.append((ligand_id, f"mk_prepare_ligand.py error: {e}"))
-                
-                print()  # Blank line between ligands
+            if state is not None:
+                # Register the list, then go through the ligands still to prepare only
+                added = state.register((row[1], row[0]) for row in reader
+                                       if len(row) >= 2 and row[0].strip() and row[1].strip())
+                progress.total = state.count_pending('prepare')
+                print(f"Run state {state_path}: {added} new ligands, {progress.total} to prepare\n")
+                reader = ([smiles, ligand_id] for ligand_id, smiles, _ in state.pending('prepare'))
             
+            # Process the rows until the file ends or we hit too many empty rows
+            counts = runner.run(preparation_jobs(reader), on_result=record)
+            if counts['quarantined']:
+                print(f"\nSkipped {counts['quarantined']} quarantined ligands (see {quarantine_path})")
+            
+    except ExecutableNotFound as e:
+        print(f"  > CRITICAL ERROR: {e}")
     except Exception as e:
         print(f"An error occurred while reading the CSV file: {e}")
+    progress.close()
 
     print("\n" + "="*70)
     print("--- PIPELINE VERIFICATION REPORT ---")
@@ -215,8 +238,9 @@ def process_smiles_file(target_folder, target_file):
     missing_sdf = []
     missing_pdbqt = []
     
-    # Check only the IDs we actually processed
-    for ligand_id in all_processed_ids:
+    # Check only the IDs we actually processed (the run state already
+    # recorded which of them succeeded, so the files are not checked again)
+    for ligand_id in all_processed_ids if state is None else []:
         sdf_file = f"{ligand_id}-prepared.sdf"
         pdbqt_file = f"{ligand_id}-prepared.pdbqt"
         
@@ -240,25 +264,17 @@ def process_smiles_file(target_folder, target_file):
         success_rate = (successful_conversions / len(all_processed_ids)) * 100
         print(f"\nSuccess rate:                     {success_rate:.1f}%")
     
-    # Detailed failure report
+    # Detailed failure report (the first ones; the progress line counts them all)
     if failed_conversions:
-        print(f"\n3. FAILED CONVERSIONS DETAILS:")
-        print("-" * 70)
-        for ligand_id, reason in failed_conversions:
-            print(f"  • ID {ligand_id}: {reason}")
+        print_id_list("3. FAILED CONVERSIONS DETAILS:",
+                      [f"ID {ligand_id}: {reason}" for ligand_id, reason in failed_conversions])
     
     # Missing files report
     if missing_sdf:
-        print(f"\n4. MISSING SDF FILES:")
-        print("-" * 70)
-        for ligand_id in missing_sdf:
-            print(f"  • {ligand_id}-prepared.sdf")
+        print_id_list("4. MISSING SDF FILES:", missing_sdf, "-prepared.sdf")
     
     if missing_pdbqt:
-        print(f"\n5. MISSING PDBQT FILES:")
-        print("-" * 70)
-        for ligand_id in missing_pdbqt:
-            print(f"  • {ligand_id}-prepared.pdbqt")
+        print_id_list("5. MISSING PDBQT FILES:", missing_pdbqt, "-prepared.pdbqt")
     
     # Final verdict
     print("\n" + "="*70)
@@ -272,23 +288,51 @@ def process_smiles_file(target_folder, target_file):
                     
 # --- Configuration Section ---
 TARGET_FOLDER = '.'
+
+# Also save the ligand list as "parquet" or "arrow" for the later steps ("csv" = list.csv only)
+TABLE_FORMAT = 'csv'
+
+# Live progress metrics (counts, rate, ETA, time in each tool), updated during the run
+METRICS_FILE = 'ligands-preparation-metrics.json'
+
+# Run-state database shared by the workflow steps (None = state kept in the file names only)
+STATE_DB = None
+
+# Ligands prepared at the same time, maximum seconds of one tool call and new attempts of a failed call
+WORKERS = 1
+TIMEOUT = 600
+RETRIES = 1
+
+# Ligands failing in 3 runs are skipped afterwards (None = always retried); logs of the failed calls
+QUARANTINE_FILE = 'ligands-preparation-quarantine.json'
+LOG_DIR = 'logs'
                 
 if __name__ == '__main__':
-    # Step 1: Find and process cheese*.csv file (add id-num column and save as list.csv)
-    print("="*70)
-    print("STEP 1: Looking for cheese*.csv file to create list.csv")
-    print("="*70 + "\n")
-    
-    result_file = add_id_column_to_cheese_file(TARGET_FOLDER)
-    
-    if not result_file:
-        print("ERROR: No cheese*.csv file found. Cannot proceed with pipeline.")
-        print("Please ensure there is a CSV file starting with 'cheese' in the folder.\n")
-        exit(1)
-    
-    # Step 2: Process the list.csv file through the ligand preparation pipeline
-    print("="*70)
-    print("STEP 2: Ligand Preparation Pipeline")
-    print("="*70 + "\n")
-    
-    process_smiles_file(TARGET_FOLDER, 'list.csv')
+    # python ligands-preparation.py --profile: timing breakdown in profiles/ (see workflow/profiling.py)
+    with profiled('ligands-preparation', profile_dir_from_argv()):
+        # Step 1: Find and process cheese*.csv file (add id-num column and save as list.csv)
+        print("="*70)
+        print("STEP 1: Looking for cheese*.csv file to create list.csv")
+        print("="*70 + "\n")
+    
+        result_file = add_id_column_to_cheese_file(TARGET_FOLDER)
+    
+        if not result_file:
+            print("ERROR: No cheese*.csv file found. Cannot proceed with pipeline.")
+            print("Please ensure there is a CSV file starting with 'cheese' in the folder.\n")
+            exit(1)
+    
+        if TABLE_FORMAT != 'csv':
+            list_path = os.path.join(TARGET_FOLDER, result_file)
+            columnar_path = with_format(list_path, TABLE_FORMAT)
+            write_table(read_table(list_path), columnar_path)
+            print(f"✓ Saved a {TABLE_FORMAT} copy of the ligand list to {columnar_path}\n")
+    
+        # Step 2: Process the list.csv file through the ligand preparation pipeline
+        print("="*70)
+        print("STEP 2: Ligand Preparation Pipeline")
+        print("="*70 + "\n")
+    
+        process_smiles_file(TARGET_FOLDER, 'list.csv', metrics_path=METRICS_FILE, state_path=STATE_DB,
+                            workers=WORKERS, timeout=TIMEOUT, retries=RETRIES, quarantine_path=QUARANTINE_FILE,
+                            log_dir=LOG_DIR)
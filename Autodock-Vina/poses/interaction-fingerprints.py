@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Interaction fingerprints of the docked poses, and the hinge filter.
+
+The Boltz pocket constraint names the key CDK2 residues, but nothing
+checks whether the docked poses make the hinge H-bonds of an ATP-site
+inhibitor. This step computes, for every mode of every <id>-vina-out.pdbqt,
+the contacts, H-bonds and aromatic stacking with each pocket residue
+(workflow/interactions.py), and writes:
+
+    interaction-fingerprints.csv: one row per pose (id-num, mode) with one
+        bool column per residue and interaction (contact_LEU83, hbond_LEU83,
+        aromatic_PHE80, ...) and hinge_hbond
+    list_with_affinities.csv: hinge_hbond (mode 1 H-bonds a hinge residue)
+        and hinge_modes (number of modes that do) added to the ranking table
+
+boltz-processing.py can then skip the ligands without a hinge H-bond
+(HINGE_TABLE), before spending Boltz time on them.
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rdkit import RDLogger
+
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from workflow.interactions import ReceptorPocket, read_pose_modes
+from workflow.progress import Progress
+from workflow.tables import TableWriter, read_table, write_table, with_format
+
+# Hinge residues of CDK2 (receptor numbering): the backbone of Glu81 and Leu83
+# makes the H-bonds of most ATP-competitive inhibitors
+HINGE_RESIDUES = ("GLU81", "LEU83")
+
+# Pocket of the worker processes, built once per process
+_pocket = None
+
+def _load_pocket(receptor_path, box_config):
+    global _pocket
+    RDLogger.DisableLog('rdApp.*')
+    _pocket = ReceptorPocket(receptor_path, box_config)
+
+def ligand_fingerprint(ligand_id, pose_path):
+    """
+    Fingerprints of all the modes of one ligand (in a worker process).
+
+    Returns:
+        tuple: (ligand_id, {interaction: bool array (modes, residues)} or None, error message or None)
+    """
+    try:
+        return ligand_id, _pocket.fingerprint(read_pose_modes(pose_path)), None
+    except (OSError, ValueError, KeyError) as e:
+        return ligand_id, None, str(e)
+
+def _ligand_fingerprint_star(arguments):
+    return ligand_fingerprint(*arguments)
+
+def fingerprint_columns(pocket):
+    """(interaction, residue index, column name) of every column of the fingerprint table"""
+    columns = [("contact", i, f"contact_{residue}") for i, residue in enumerate(pocket.residues)]
+    columns += [("hbond", i, f"hbond_{residue}") for i, residue in enumerate(pocket.residues)]
+    columns += [("aromatic", pocket.residue_index(residue), f"aromatic_{residue}")
+                for residue in pocket.aromatic_residues()]
+    return columns
+
+def fingerprint_rows(ligand_id, bits, columns, hinge):
+    """DataFrame with one row per mode of a ligand"""
+    n_modes = bits["contact"].shape[0]
+    rows = pd.DataFrame({"id-num": [ligand_id] * n_modes, "mode": np.arange(1, n_modes + 1)})
+    data = {name: bits[interaction][:, i] for interaction, i, name in columns}
+    data["hinge_hbond"] = bits["hbond"][:, hinge].any(axis=1)
+    return pd.concat([rows, pd.DataFrame(data)], axis=1)
+
+def compute_fingerprints(input_table, output_table, fingerprints_table, poses_dir, receptor_path, box_config,
+                         hinge_residues=HINGE_RESIDUES, workers=None, metrics_path=None, progress_interval=10.0,
+                         csv_copy=False):
+    """
+    Fingerprint every docked ligand of the ranking table and add the hinge columns to it.
+
+    Args:
+        input_table: Table with an 'id-num' column (e.g. list_with_affinities.csv)
+        output_table: Output table (can be the input table)
+        fingerprints_table: Output table with one row per pose and one column per residue bit
+        poses_dir: Folder of the <id>-vina-out.pdbqt files
+        receptor_path: Receptor PDBQT file the poses were docked in
+        box_config: Vina box configuration file (the residues in the box are fingerprinted)
+        hinge_residues: Residues (e.g. 'LEU83') whose H-bonds make a hinge binder
+        workers: Number of processes (None = all CPUs)
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+        csv_copy: Also save .csv copies when the outputs are columnar
+    """
+    df = read_table(input_table)
+    pocket = ReceptorPocket(receptor_path, box_config)
+    missing = [residue for residue in hinge_residues if residue not in pocket.residues]
+    if missing:
+        raise ValueError(f"Hinge residue(s) {', '.join(missing)} not in the box of {box_config}")
+    hinge = [pocket.residue_index(residue) for residue in hinge_residues]
+    columns = fingerprint_columns(pocket)
+    print(f"📄 Loaded {len(df)} ligands and {len(pocket.residues)} pocket residues "
+          f"({len(pocket.aromatic_residues())} aromatic)")
+
+    tasks = []
+    for ligand_id in df['id-num'].astype(str).str.strip():
+        pose_path = os.path.join(poses_dir, f"{ligand_id}-vina-out.pdbqt")
+        if os.path.exists(pose_path):
+            tasks.append((ligand_id, pose_path))
+    print(f"🔍 Fingerprinting the poses of {len(tasks)} docked ligands")
+
+    summary = {}
+    errors = {}
+    progress = Progress("interaction-fingerprints", total=len(tasks), metrics_path=metrics_path,
+                        interval=progress_interval)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_pocket,
+                             initargs=(receptor_path, box_config)) as executor, \
+            TableWriter(fingerprints_table, csv_copy=csv_copy) as writer:
+        buffer = []
+        for ligand_id, bits, error in executor.map(_ligand_fingerprint_star, tasks, chunksize=16):
+            if bits is None:
+                errors[ligand_id] = error
+            else:
+                rows = fingerprint_rows(ligand_id, bits, columns, hinge)
+                summary[ligand_id] = (bool(rows["hinge_hbond"].iloc[0]), int(rows["hinge_hbond"].sum()))
+                buffer.append(rows)
+                if len(buffer) == 1000:
+                    writer.write(pd.concat(buffer, ignore_index=True))
+                    buffer = []
+            progress.update(1, failed=int(bits is None))
+        if buffer:
+            writer.write(pd.concat(buffer, ignore_index=True))
+    progress.close()
+
+    for ligand_id, error in list(errors.items())[:20]:
+        print(f"⚠️  Ligand {ligand_id}: {error}")
+    if len(errors) > 20:
+        print(f"⚠️  ... and {len(errors) - 20} more")
+
+    ids = df['id-num'].astype(str).str.strip()
+    df['hinge_hbond'] = ids.map({ligand_id: values[0] for ligand_id, values in summary.items()})
+    df['hinge_modes'] = ids.map({ligand_id: values[1] for ligand_id, values in summary.items()}).astype("Int64")
+    write_table(df, output_table, csv_copy=csv_copy)
+
+    n_hinge = int((df['hinge_hbond'] == True).sum())
+    print(f"\n✅ Saved the fingerprints of {writer.rows} poses to {fingerprints_table}")
+    print(f"✅ Saved hinge_hbond and hinge_modes to {output_table}")
+    print(f"🔗 Mode 1 H-bonds the hinge ({', '.join(hinge_residues)}) for {n_hinge}/{len(summary)} ligands")
+    return df
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    # Ranking table made by ranking.py, with the hinge columns added in place
+    INPUT_TABLE = 'list_with_affinities.csv'
+    OUTPUT_TABLE = 'list_with_affinities.csv'
+
+    # One row per pose with the residue bits
+    FINGERPRINTS_TABLE = 'interaction-fingerprints.csv'
+
+    # Receptor and box of the docking
+    RECEPTOR = '../receptor/1H1Q-prepared.pdbqt'
+    BOX_CONFIG = '../receptor/1H1Q-prepared.box.txt'
+
+    # Processes (None = all CPUs)
+    WORKERS = None
+
+    # Output format: "csv", "parquet" or "arrow" (a .csv copy is kept if EXPORT_CSV)
+    TABLE_FORMAT = 'csv'
+    EXPORT_CSV = True
+
+    # Live progress metrics (counts, rate, ETA), updated during the run
+    METRICS_FILE = 'interaction-fingerprints-metrics.json'
+
+    # ===================================================================
+
+    # Run from the poses directory
+    compute_fingerprints(INPUT_TABLE, with_format(OUTPUT_TABLE, TABLE_FORMAT),
+                         with_format(FINGERPRINTS_TABLE, TABLE_FORMAT), '.', RECEPTOR, BOX_CONFIG,
+                         HINGE_RESIDUES, WORKERS, METRICS_FILE, csv_copy=EXPORT_CSV)
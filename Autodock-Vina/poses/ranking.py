@@ -5,9 +5,15 @@ Extract best affinity scores from AutoDock Vina output files and merge with liga
 
 import os
 import re
-import pandas as pd
+import sys
 from pathlib import Path
 
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from workflow.profiling import profile_dir_from_argv, profiled
+from workflow.runstate import RunState
+from workflow.tables import find_table, read_table, write_table, with_format
+
 def extract_best_affinity(file_path):
     """
     Extract the best (first) affinity value from a vina-score.txt file.
@@ -37,19 +43,25 @@ def extract_best_affinity(file_path):
         print(f"Error reading {file_path}: {e}")
         return None
 
-def process_vina_scores(poses_dir='poses', ligands_csv='ligands/list.csv', output_csv='ligands/list_with_affinities.csv'):
+def process_vina_scores(poses_dir='poses', ligands_csv='ligands/list.csv', output_csv='ligands/list_with_affinities.csv',
+                        csv_copy=False, state_path=None, ensemble_table=None):
     """
     Process all vina-score.txt files and merge with ligand CSV.
     
     Args:
         poses_dir: Directory containing the vina-score.txt files
-        ligands_csv: Path to the input CSV file
-        output_csv: Path to save the output CSV file
+        ligands_csv: Path to the input table (.csv, .parquet or .arrow)
+        output_csv: Path to save the output table (.csv, .parquet or .arrow)
+        csv_copy: Also save a .csv copy when the output is columnar
+        state_path: Optional run-state database (see workflow/runstate.py); the score
+            files of the docked ligands are taken from it instead of listing poses_dir
+        ensemble_table: Optional ensemble_affinities.csv of an ensemble docking (see
+            vina-batch.py); its aggregated affinities are used instead of the score files
     """
     
-    # Read the ligands CSV
+    # Read the ligands table
     print(f"Reading ligands data from: {ligands_csv}")
-    df = pd.read_csv(ligands_csv)
+    df = read_table(ligands_csv)
     
     # Check if 'id-num' column exists (second column should be the ID)
     if 'id-num' not in df.columns:
@@ -60,6 +72,36 @@ def process_vina_scores(poses_dir='poses', ligands_csv='ligands/list.csv', outpu
     
     print(f"Using '{id_column}' as the matching column")
     
+    if state_path and not ensemble_table:
+        artifacts = RunState(state_path).artifacts('dock')
+        if any('scores' in ligand_artifacts for ligand_artifacts in artifacts.values()):
+            # Ensemble docking: one score file per receptor, combined by vina-batch.py
+            ensemble_table = find_table(Path(poses_dir) / 'ensemble_affinities.csv')
+            if ensemble_table is None:
+                print(f"Error: the run state {state_path} holds an ensemble docking, but "
+                      f"{poses_dir}/ensemble_affinities.csv was not found. Set ENSEMBLE_TABLE "
+                      f"to the ensemble table of vina-batch.py")
+                return None
+    
+    if ensemble_table:
+        # Affinities already combined over the receptors by vina-batch.py
+        df_ensemble = read_table(ensemble_table, columns=['id-num', 'vina_affinity'])
+        print(f"Using the ensemble affinities of {len(df_ensemble)} ligands from {ensemble_table}")
+        affinities = dict(zip(df_ensemble['id-num'], df_ensemble['vina_affinity']))
+        return merge_affinities(df, id_column, affinities, output_csv, csv_copy)
+    
+    if state_path:
+        # Score files recorded by vina-batch.py
+        score_files = {ligand_id: artifacts['score']
+                       for ligand_id, artifacts in RunState(state_path).artifacts('dock').items()}
+        print(f"Found {len(score_files)} docked ligands in the run state {state_path}")
+        affinities = {}
+        for ligand_id, score_file in score_files.items():
+            affinity = extract_best_affinity(score_file)
+            if affinity is not None:
+                affinities[int(ligand_id) if ligand_id.isdigit() else ligand_id] = affinity
+        return merge_affinities(df, id_column, affinities, output_csv, csv_copy)
+    
     # Find all vina-score.txt files
     poses_path = Path(poses_dir)
     
@@ -98,6 +140,15 @@ def process_vina_scores(poses_dir='poses', ligands_csv='ligands/list.csv', outpu
             if affinity is not None:
                 affinities[file_num] = affinity
     
+    return merge_affinities(df, id_column, affinities, output_csv, csv_copy)
+
+def merge_affinities(df, id_column, affinities, output_csv, csv_copy=False):
+    """
+    Add the vina_affinity column to the ligand table, save it and print the statistics.
+    
+    Args:
+        affinities: {ligand id: best affinity}
+    """
     print(f"Successfully extracted {len(affinities)} affinity values")
     
     # Create a new column for affinities
@@ -111,7 +162,7 @@ def process_vina_scores(poses_dir='poses', ligands_csv='ligands/list.csv', outpu
         print(f"Missing IDs: {missing_ids[:10]}..." if len(missing_ids) > 10 else f"Missing IDs: {missing_ids}")
     
     # Save the merged data
-    df.to_csv(output_csv, index=False)
+    write_table(df, output_csv, csv_copy=csv_copy)
     print(f"\nResults saved to: {output_csv}")
     
     # Print summary statistics
@@ -134,27 +185,44 @@ def process_vina_scores(poses_dir='poses', ligands_csv='ligands/list.csv', outpu
     
     return df
 
+# --- Configuration Section ---
+# Output format of list_with_affinities: "csv", "parquet" or "arrow"
+TABLE_FORMAT = "csv"
+# Also save a .csv copy when TABLE_FORMAT is columnar
+EXPORT_CSV = True
+# Run-state database shared by the workflow steps, relative to Autodock-Vina (None = list the score files)
+STATE_DB = None
+# Affinities of an ensemble docking (vina-batch.py with RECEPTORS), relative to poses
+# (e.g. 'ensemble_affinities.csv'; None = single receptor, read the score files)
+ENSEMBLE_TABLE = None
+
 if __name__ == "__main__":
     # Since you're running from the poses directory, adjust paths
-    import sys
-    
     # Check if running from poses directory
     current_dir = os.path.basename(os.getcwd())
     
-    if current_dir == 'poses':
-        print("Running from poses directory")
-        df = process_vina_scores(
-            poses_dir='.',  # Current directory
-            ligands_csv='../ligands/list.csv',
-            output_csv='list_with_affinities.csv'  # Output in current (poses) directory
-        )
-    else:
-        print("Running from Autodock-Vina directory")
-        df = process_vina_scores(
-            poses_dir='poses',
-            ligands_csv='ligands/list.csv',
-            output_csv='poses/list_with_affinities.csv'
-        )
+    # python ranking.py --profile: timing breakdown in profiles/ (see workflow/profiling.py)
+    with profiled('ranking', profile_dir_from_argv()):
+        if current_dir == 'poses':
+            print("Running from poses directory")
+            df = process_vina_scores(
+                poses_dir='.',  # Current directory
+                ligands_csv='../ligands/list.csv',
+                output_csv=with_format('list_with_affinities.csv', TABLE_FORMAT),  # Output in current (poses) directory
+                csv_copy=EXPORT_CSV,
+                state_path=STATE_DB and os.path.join('..', STATE_DB),
+                ensemble_table=ENSEMBLE_TABLE
+            )
+        else:
+            print("Running from Autodock-Vina directory")
+            df = process_vina_scores(
+                poses_dir='poses',
+                ligands_csv='ligands/list.csv',
+                output_csv=with_format('poses/list_with_affinities.csv', TABLE_FORMAT),
+                csv_copy=EXPORT_CSV,
+                state_path=STATE_DB,
+                ensemble_table=ENSEMBLE_TABLE and os.path.join('poses', ENSEMBLE_TABLE)
+            )
     
     if df is not None:
         print("\n✓ Processing complete!")
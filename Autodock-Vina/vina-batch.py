@@ -5,16 +5,168 @@ Performs docking for multiple ligands and saves results organized in poses direc
 """
 
 import os
-import subprocess
+import shutil
+import sys
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.gridmaps import GridMapCache
+from workflow.profiling import profile_dir_from_argv, profiled
+from workflow.progress import Progress
+from workflow.runner import CommandRunner, ExecutableNotFound, Job, Quarantine, Step
+from workflow.runstate import RunState
+from workflow.scripts import load_script
+from workflow.tables import find_table, read_table, write_table
+
+# Affinities of the ensemble docking, in poses_dir
+ENSEMBLE_TABLE = 'ensemble_affinities.csv'
+
+def build_vina_command(receptor_path, ligand_path, config_path, output_pose, exhaustiveness=100,
+                       num_modes=20, cpu=None, vina_executable='vina', maps=None, scoring=None):
+    """
+    Build the vina command line for one ligand.
+    
+    Args:
+        cpu: Number of CPUs used by this vina run (None = all)
+        vina_executable: Name or path of the vina executable
+        maps: Prefix of precomputed grid maps (see workflow/gridmaps.py), used
+              instead of the receptor and box
+        scoring: Scoring function (None = vina default)
+    """
+    if maps is not None:
+        # The maps already hold the receptor and the box
+        target = ['--maps', maps]
+    else:
+        target = ['--receptor', receptor_path, '--config', config_path]
+    cmd = [
+        vina_executable,
+        *target,
+        '--ligand', ligand_path,
+        f'--exhaustiveness={exhaustiveness}',
+        '--out', output_pose,
+        '--num_modes', str(num_modes)
+    ]
+    if scoring is not None:
+        cmd += ['--scoring', scoring]
+    if cpu is not None:
+        cmd += ['--cpu', str(cpu)]
+    return cmd
+
+# Ways of combining the affinities of a ligand docked against several receptors
+ENSEMBLE_AGGREGATIONS = ("best", "mean", "boltzmann")
+
+# Gas constant in kcal/(mol K)
+GAS_CONSTANT = 0.0019872
+
+def aggregate_affinities(affinities, method="best", temperature=298.15):
+    """
+    Combine the affinities of each ligand over the receptors of an ensemble.
+    
+    Args:
+        affinities: DataFrame with one row per ligand and one column per receptor
+                    (NaN where the docking failed, ignored)
+        method: "best" (lowest affinity), "mean", or "boltzmann" (average weighted
+                by exp(-affinity / RT), which favours the best receptors)
+        temperature: Temperature of the Boltzmann weights (K)
+        
+    Returns:
+        Series: Aggregated affinity of each ligand
+    """
+    if method == "best":
+        return affinities.min(axis=1)
+    if method == "mean":
+        return affinities.mean(axis=1)
+    if method == "boltzmann":
+        # Shifted by the best affinity so that the exponentials cannot overflow
+        shifted = affinities.sub(affinities.min(axis=1), axis=0)
+        weights = np.exp(-shifted / (GAS_CONSTANT * temperature))
+        return (weights * affinities).sum(axis=1) / weights.sum(axis=1)
+    raise ValueError(f"Unknown aggregation '{method}' (use {', '.join(ENSEMBLE_AGGREGATIONS)})")
+
+def write_ensemble_table(score_files, output_path, method="best"):
+    """
+    Table of the per-receptor and aggregated affinities of an ensemble docking.
+    
+    Ligands already in an existing table and not docked again are kept.
+    
+    Args:
+        score_files: {ligand id: {receptor name: vina-score.txt path}}
+        output_path: Output table (.csv, .parquet or .arrow)
+        method: Aggregation (see aggregate_affinities)
+    """
+    ranking = load_script("Autodock-Vina/poses/ranking.py")
+    affinities = pd.DataFrame.from_dict(
+        {ligand_num: {name: ranking.extract_best_affinity(path) for name, path in files.items()}
+         for ligand_num, files in score_files.items()}, orient='index', dtype=float)
+    affinities = affinities.add_prefix('vina_')
+    
+    df = pd.DataFrame({'id-num': affinities.index})
+    df = pd.concat([df, affinities.reset_index(drop=True)], axis=1)
+    df['vina_affinity'] = aggregate_affinities(affinities, method).round(3).to_numpy()
+    # Ligands without any affinity have no best receptor (idxmin fails on all-NaN rows)
+    best_receptor = affinities.dropna(how='all').idxmin(axis=1).reindex(affinities.index)
+    df['best_receptor'] = best_receptor.str.removeprefix('vina_').to_numpy()
+    df['n_receptors'] = affinities.notna().sum(axis=1).to_numpy()
+    
+    if find_table(output_path) is not None:
+        previous = read_table(output_path)
+        previous['id-num'] = previous['id-num'].astype(str)
+        previous = previous[~previous['id-num'].isin(df['id-num'])]
+        df = pd.concat([previous, df], ignore_index=True)
+    write_table(df, output_path)
+    return df
+
+def copy_best_poses(df_ensemble, ligand_nums, poses_dir):
+    """
+    Copy the score and pose files of the best receptor of each ligand to poses_dir.
+    
+    The steps reading the poses (interaction-fingerprints.py, vina-rescore.py,
+    pose-agreement.py, rank-stability.py) look for poses/<id>-vina-*, as after a
+    single-receptor docking.
+    
+    Args:
+        df_ensemble: Table of write_ensemble_table, with the best_receptor column
+        ligand_nums: Ids of the ligands docked in this run
+        poses_dir: Folder holding one subfolder per receptor
+        
+    Returns:
+        int: Number of ligands whose files were copied
+    """
+    best_receptor = dict(zip(df_ensemble['id-num'].astype(str), df_ensemble['best_receptor']))
+    copied = 0
+    for ligand_num in ligand_nums:
+        receptor = best_receptor.get(str(ligand_num))
+        if not isinstance(receptor, str):
+            continue
+        for suffix in ("vina-score.txt", "vina-out.pdbqt"):
+            shutil.copyfile(os.path.join(poses_dir, receptor, f"{ligand_num}-{suffix}"),
+                            os.path.join(poses_dir, f"{ligand_num}-{suffix}"))
+        copied += 1
+    return copied
+
 def run_vina_docking(ligands_dir='ligands', 
                      receptor_dir='receptor',
                      receptor_name='1H1Q-prepared.pdbqt',
                      config_file='1H1Q-prepared.box.txt',
                      exhaustiveness=100,
                      num_modes=20,
-                     poses_dir='poses'):
+                     poses_dir='poses',
+                     metrics_path=None,
+                     progress_interval=10.0,
+                     state_path=None,
+                     grid_cache_dir=None,
+                     receptors=None,
+                     aggregation='best',
+                     workers=1,
+                     vina_cpu=None,
+                     timeout=None,
+                     retries=0,
+                     quarantine_path=None,
+                     log_dir=None):
     """
     Run AutoDock Vina docking for all ligands in the specified directory.
     
@@ -26,88 +178,198 @@ def run_vina_docking(ligands_dir='ligands',
         exhaustiveness: Exhaustiveness parameter for Vina
         num_modes: Number of binding modes to generate
         poses_dir: Directory to save output files and poses
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+        state_path: Optional run-state database (see workflow/runstate.py). The ligands prepared
+            and not docked yet are taken from it instead of listing ligands_dir
+        grid_cache_dir: Optional directory of cached receptor grid maps (see workflow/gridmaps.py);
+            the maps are computed once and every docking loads them instead of recomputing them
+        receptors: Optional ensemble of receptors, as (receptor file, box configuration file)
+            pairs in receptor_dir, replacing receptor_name and config_file. Each ligand is
+            docked against all of them (outputs in poses_dir/<receptor>/), and the affinities
+            are combined in poses_dir/ensemble_affinities.csv
+        aggregation: Combination of the ensemble affinities: "best", "mean" or "boltzmann"
+        workers: Number of vina runs at the same time
+        vina_cpu: CPUs of each vina run (None = all; use about cores / workers with several workers)
+        timeout: Maximum seconds of one vina run (None = no limit)
+        retries: Number of new attempts of a failed vina run
+        quarantine_path: Optional JSON file of the dockings that keep failing; they are
+            skipped after 3 failed runs (see workflow/runner.py)
+        log_dir: Optional folder keeping the output of the failed vina runs
     """
     
-    # Setup paths
-    receptor_path = os.path.join(receptor_dir, receptor_name)
-    config_path = os.path.join(receptor_dir, config_file)
-    
-    # Verify required files exist
-    if not os.path.exists(receptor_path):
-        print(f"Error: Receptor file not found: {receptor_path}")
+    # Setup paths (one target per receptor of the ensemble)
+    ensemble = receptors is not None
+    if not ensemble:
+        receptors = [(receptor_name, config_file)]
+    if aggregation not in ENSEMBLE_AGGREGATIONS:
+        print(f"Error: Unknown aggregation '{aggregation}' (use {', '.join(ENSEMBLE_AGGREGATIONS)})")
         return
+    targets = []
+    for receptor_file, box_file in receptors:
+        targets.append({
+            'name': Path(receptor_file).stem,
+            'receptor_path': os.path.join(receptor_dir, receptor_file),
+            'config_path': os.path.join(receptor_dir, box_file),
+            'poses_dir': os.path.join(poses_dir, Path(receptor_file).stem) if ensemble else poses_dir,
+            'maps': None
+        })
     
-    if not os.path.exists(config_path):
-        print(f"Error: Config file not found: {config_path}")
-        return
+    # Verify required files exist
+    for target in targets:
+        if not os.path.exists(target['receptor_path']):
+            print(f"Error: Receptor file not found: {target['receptor_path']}")
+            return
+        
+        if not os.path.exists(target['config_path']):
+            print(f"Error: Config file not found: {target['config_path']}")
+            return
     
     if not os.path.exists(ligands_dir):
         print(f"Error: Ligands directory not found: {ligands_dir}")
         return
     
-    # Create poses directory if it doesn't exist
-    os.makedirs(poses_dir, exist_ok=True)
-    
-    # Get all PDBQT ligand files and extract ligand numbers
-    ligand_files = sorted([f for f in os.listdir(ligands_dir) if f.endswith('-prepared.pdbqt')])
+    # Create poses directories if they don't exist
+    for target in targets:
+        os.makedirs(target['poses_dir'], exist_ok=True)
     
-    if not ligand_files:
-        print(f"Error: No ligand files found in {ligands_dir}")
-        return
+    # Grid maps of each receptor computed once (or found in the cache) for all the ligands
+    if grid_cache_dir:
+        cache = GridMapCache(grid_cache_dir)
+        for target in targets:
+            try:
+                target['maps'] = cache.maps_prefix(target['receptor_path'], target['config_path'])
+            except RuntimeError as e:
+                print(f"Error: {e}")
+                return
+            print(f"Using the grid maps {target['maps']}")
     
-    # Extract ligand info (number, full path)
-    ligand_info = []
-    for lf in ligand_files:
-        try:
-            ligand_num = lf.split('-')[0]
-            full_path = os.path.join(ligands_dir, lf)
-            ligand_info.append((ligand_num, full_path))
-        except:
-            print(f"Warning: Could not parse ligand number from {lf}")
-            continue
-    
-    print(f"Found {len(ligand_info)} ligand files")
+    state = RunState(state_path) if state_path else None
+    if state is not None:
+        # Ligands prepared (with their PDBQT file) and not docked yet
+        ligand_info = [(ligand_num, artifacts['pdbqt'])
+                       for ligand_num, _, artifacts in state.pending('dock', after='prepare')]
+        print(f"Run state {state_path}: {len(ligand_info)} ligands to dock")
+        if not ligand_info:
+            return
+    else:
+        # Get all PDBQT ligand files and extract ligand numbers
+        ligand_files = sorted([f for f in os.listdir(ligands_dir) if f.endswith('-prepared.pdbqt')])
+        
+        if not ligand_files:
+            print(f"Error: No ligand files found in {ligands_dir}")
+            return
+        
+        # Extract ligand info (number, full path)
+        ligand_info = []
+        for lf in ligand_files:
+            try:
+                ligand_num = lf.split('-')[0]
+                full_path = os.path.join(ligands_dir, lf)
+                ligand_info.append((ligand_num, full_path))
+            except:
+                print(f"Warning: Could not parse ligand number from {lf}")
+                continue
+        
+        print(f"Found {len(ligand_info)} ligand files")
+    if ensemble:
+        print(f"Ensemble of {len(targets)} receptors: {', '.join(target['name'] for target in targets)}"
+              f" ({len(ligand_info) * len(targets)} dockings, {aggregation} affinity)")
     print("Starting docking process...\n")
     
     # Track results
     successful = []
     failed = []
+    failed_dockings = 0
+    score_files = {}
+    progress = Progress("vina-batch", total=len(ligand_info) * len(targets), metrics_path=metrics_path,
+                        interval=progress_interval, unit="dockings" if ensemble else "ligands")
     
-    # Run Vina for each ligand
-    for ligand_num, ligand_path in ligand_info:
-        # Save output files in poses directory
-        output_file = os.path.join(poses_dir, f"{ligand_num}-vina-score.txt")
-        output_pose = os.path.join(poses_dir, f"{ligand_num}-vina-out.pdbqt")
-                     
-        print(f"Processing ligand {ligand_num}...")
-       
-        # Build the vina command
-        cmd = [
-            'vina',
-            '--receptor', receptor_path,
-            '--ligand', ligand_path,
-            '--config', config_path,
-            f'--exhaustiveness={exhaustiveness}',
-            '--out', output_pose,
-            '--num_modes', str(num_modes)
-        ]
-       
-        try:
-            # Run the command and redirect output to file
-            with open(output_file, 'w') as out_f:
-                result = subprocess.run(cmd, stdout=out_f, stderr=subprocess.PIPE,
-                                       text=True, check=True)
-
-            print(f"  ✓ Completed: {output_file}")
+    runner = CommandRunner(workers, timeout, retries, log_dir=log_dir,
+                           quarantine=Quarantine(quarantine_path) if quarantine_path else None)
+    outputs = {}
+    errors = {}
+    seconds = {}
+    
+    def docking_jobs():
+        """One vina run per ligand and receptor, all the receptors of a ligand before the next one"""
+        for ligand_num, ligand_path in ligand_info:
+            if state is not None:
+                state.start('dock', ligand_num)
+            outputs[ligand_num] = {}
+            errors[ligand_num] = []
+            seconds[ligand_num] = 0.0
+            for target in targets:
+                # Save output files in poses directory
+                output_file = os.path.join(target['poses_dir'], f"{ligand_num}-vina-score.txt")
+                output_pose = os.path.join(target['poses_dir'], f"{ligand_num}-vina-out.pdbqt")
+                
+                # Build the vina command (its output is streamed to the score file)
+                cmd = build_vina_command(target['receptor_path'], ligand_path, target['config_path'], output_pose,
+                                         exhaustiveness, num_modes, vina_cpu, maps=target['maps'])
+                key = f"{ligand_num}@{target['name']}" if ensemble else ligand_num
+                yield Job(key, [Step("vina", cmd, stdout=output_file)],
+                          data=(ligand_num, target['name'], output_file, output_pose))
+    
+    def record(result):
+        nonlocal failed_dockings
+        ligand_num, name, output_file, output_pose = result.job.data
+        progress.add_time("vina", result.step_seconds.get("vina", 0.0))
+        seconds[ligand_num] += result.seconds
+        if result.ok:
+            outputs[ligand_num][name] = (output_file, output_pose)
+            progress.update(1)
+        else:
+            print(f"  ✗ Failed: Ligand {ligand_num}" + (f" on {name}" if ensemble else ""))
+            print(f"    Error: {result.error}")
+            errors[ligand_num].append(result.error.splitlines()[0])
+            failed_dockings += 1
+            progress.update(1, failed=1)
+        if len(outputs[ligand_num]) + len(errors[ligand_num]) < len(targets):
+            return
+        
+        # A ligand is docked when at least one receptor of the ensemble worked
+        done = outputs.pop(ligand_num)
+        ligand_errors = errors.pop(ligand_num)
+        ligand_seconds = seconds.pop(ligand_num)
+        if done:
             successful.append(ligand_num)
-            
-        except subprocess.CalledProcessError as e:
-            print(f"  ✗ Failed: Ligand {ligand_num}")
-            print(f"    Error: {e.stderr}")
+            score_files[ligand_num] = {name: score for name, (score, _) in done.items()}
+        else:
             failed.append(ligand_num)
-        except FileNotFoundError:
-            print(f"  ✗ Error: 'vina' command not found. Make sure AutoDock Vina is installed and in your PATH")
-            return
+        if state is not None:
+            if not done:
+                state.fail('dock', ligand_num, ligand_errors[-1], ligand_seconds)
+            elif ensemble:
+                state.finish('dock', ligand_num,
+                             {'scores': {name: os.path.abspath(score) for name, (score, _) in done.items()},
+                              'poses': {name: os.path.abspath(pose) for name, (_, pose) in done.items()}},
+                             ligand_seconds)
+            else:
+                output_file, output_pose = done[targets[0]['name']]
+                state.finish('dock', ligand_num,
+                             {'score': os.path.abspath(output_file), 'pose': os.path.abspath(output_pose)},
+                             ligand_seconds)
+    
+    # Run Vina for each ligand, against every receptor in turn
+    try:
+        counts = runner.run(docking_jobs(), on_result=record)
+    except ExecutableNotFound:
+        print(f"  ✗ Error: 'vina' command not found. Make sure AutoDock Vina is installed and in your PATH")
+        progress.close("failed")
+        return
+    if counts['quarantined']:
+        print(f"\nSkipped {counts['quarantined']} quarantined dockings (see {quarantine_path})")
+
+    progress.close()
+    
+    if ensemble and score_files:
+        ensemble_path = os.path.join(poses_dir, ENSEMBLE_TABLE)
+        df_ensemble = write_ensemble_table(score_files, ensemble_path, aggregation)
+        print(f"\n✅ Saved the {aggregation} affinities of {len(df_ensemble)} ligands to {ensemble_path}")
+        print(df_ensemble['best_receptor'].value_counts().to_string())
+        copied = copy_best_poses(df_ensemble, score_files, poses_dir)
+        print(f"Copied the poses of the best receptor of {copied} ligands to {poses_dir}/<id>-vina-*")
 
     # Final verification and summary
     print(f"\n{'='*70}")
@@ -115,15 +377,21 @@ def run_vina_docking(ligands_dir='ligands',
     print(f"{'='*70}\n")
     
     # Count expected vs actual output files
-    expected_score_files = len(ligand_info)
-    expected_pose_files = len(ligand_info)
+    expected_score_files = len(ligand_info) * len(targets)
+    expected_pose_files = len(ligand_info) * len(targets)
     
-    actual_score_files = len([f for f in os.listdir(poses_dir) if f.endswith('-vina-score.txt')])
-    actual_pose_files = len([f for f in os.listdir(poses_dir) if f.endswith('-vina-out.pdbqt')])
+    if state is not None or ensemble:
+        # Files of this run
+        actual_score_files = actual_pose_files = expected_score_files - failed_dockings
+    else:
+        actual_score_files = len([f for f in os.listdir(poses_dir) if f.endswith('-vina-score.txt')])
+        actual_pose_files = len([f for f in os.listdir(poses_dir) if f.endswith('-vina-out.pdbqt')])
     
     print(f"Total ligands processed:     {len(ligand_info)}")
     print(f"Successful dockings:         {len(successful)}")
     print(f"Failed dockings:             {len(failed)}")
+    if ensemble:
+        print(f"Failed receptor dockings:    {failed_dockings}/{expected_score_files}")
     print(f"\nOutput files verification:")
     print(f"  Score files (.txt):        {actual_score_files}/{expected_score_files}")
     print(f"  Pose files (.pdbqt):       {actual_pose_files}/{expected_pose_files}")
@@ -132,7 +400,7 @@ def run_vina_docking(ligands_dir='ligands',
     print(f"\nSuccess rate:                {success_rate:.1f}%")
     
     if failed:
-        print(f"\nFailed ligands: {', '.join(failed)}")
+        print(f"\nFailed ligands: {', '.join(failed[:50])}" + (f" ... and {len(failed) - 50} more" if len(failed) > 50 else ""))
     
     print(f"\nAll outputs saved in: {os.path.abspath(poses_dir)}/")
     print(f"{'='*70}")
@@ -148,13 +416,44 @@ def run_vina_docking(ligands_dir='ligands',
     print(f"{'='*70}\n")
 
 if __name__ == "__main__":
-    # Run the docking with default parameters
-    run_vina_docking(
-        ligands_dir='ligands',
-        receptor_dir='receptor',
-        receptor_name='1H1Q-prepared.pdbqt',
-        config_file='1H1Q-prepared.box.txt',
-        exhaustiveness=100,
-        num_modes=20,
-        poses_dir='poses'
-    )
+    # Ensemble docking: several receptor conformations, as (receptor, box) pairs in
+    # receptor/, e.g. [('1H1Q-prepared.pdbqt', '1H1Q-prepared.box.txt'),
+    # ('1HCK-prepared.pdbqt', '1HCK-prepared.box.txt')]. None = only receptor_name
+    RECEPTORS = None
+    # Affinity of a ligand over the ensemble: "best", "mean" or "boltzmann"
+    AGGREGATION = 'best'
+    
+    # Vina runs at the same time (with VINA_CPU cores each), maximum seconds of one
+    # run and new attempts of a failed run
+    WORKERS = 1
+    VINA_CPU = None
+    TIMEOUT = 3600
+    RETRIES = 1
+    
+    # Dockings failing in 3 runs are skipped afterwards (None = always retried); logs of the failed runs
+    QUARANTINE_FILE = 'poses/vina-quarantine.json'
+    LOG_DIR = 'poses/logs'
+    
+    # Run the docking with default parameters (python vina-batch.py --profile: timing
+    # breakdown in profiles/, see workflow/profiling.py)
+    with profiled('vina-batch', profile_dir_from_argv()):
+        run_vina_docking(
+            ligands_dir='ligands',
+            receptor_dir='receptor',
+            receptor_name='1H1Q-prepared.pdbqt',
+            config_file='1H1Q-prepared.box.txt',
+            exhaustiveness=100,
+            num_modes=20,
+            poses_dir='poses',
+            metrics_path='vina-batch-metrics.json',
+            state_path=None,  # Run-state database shared by the workflow steps (see workflow/runstate.py)
+            grid_cache_dir=None,  # e.g. 'grid-maps': compute the receptor maps once (see workflow/gridmaps.py)
+            receptors=RECEPTORS,
+            aggregation=AGGREGATION,
+            workers=WORKERS,
+            vina_cpu=VINA_CPU,
+            timeout=TIMEOUT,
+            retries=RETRIES,
+            quarantine_path=QUARANTINE_FILE,
+            log_dir=LOG_DIR
+        )
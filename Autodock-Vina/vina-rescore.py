@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Rescoring of the docked poses with another scoring function.
+
+Trying the Vinardo or AutoDock4 scoring on the library used to mean docking
+it again. This step keeps the poses of poses/<id>-vina-out.pdbqt and, for
+every mode, computes the score of the chosen scoring function on the pose
+as it is (score only) and, optionally, after a local optimization in the
+receptor. It uses the Python bindings of AutoDock Vina (pip install vina)
+in long-lived worker processes: each worker sets up the receptor and the
+grid maps once, then scores the poses one after the other, which takes
+milliseconds per pose.
+
+The maps of vina and vinardo are computed by each worker, or once for all
+of them with grid_cache_dir (workflow/gridmaps.py). The ad4 scoring needs
+the AutoDock4 maps of the receptor written by autogrid4 (ad4_maps: prefix
+of the .map files).
+
+The outputs are:
+    rescored-poses.csv: one row per pose (id-num, mode, vina_affinity,
+        <scoring>_score and <scoring>_optimized)
+    list_with_affinities.csv: <scoring>_score (mode 1, score only),
+        <scoring>_optimized (mode 1 after the local optimization) and
+        <scoring>_best / <scoring>_best_mode (best over the modes) added
+        to the ranking table
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.gridmaps import DEFAULT_SPACING, GridMapCache, read_box
+from workflow.profiling import profile_dir_from_argv, profiled
+from workflow.progress import Progress
+from workflow.tables import TableWriter, read_table, write_table, with_format
+
+# Scoring functions of the Vina bindings
+SCORING_FUNCTIONS = ("vina", "vinardo", "ad4")
+
+# Scorer of the worker processes, built once per process
+_scorer = None
+
+def _vina():
+    """Import the Vina bindings only when the rescoring runs"""
+    try:
+        from vina import Vina
+    except ImportError:
+        raise ImportError("Rescoring needs the AutoDock Vina Python bindings - install with: pip install vina") from None
+    return Vina
+
+class PoseScorer:
+    """
+    Receptor set up once with a scoring function, scoring ligand poses.
+
+    Args:
+        receptor_path: Receptor PDBQT file
+        box_config: Vina box configuration file
+        scoring: 'vina', 'vinardo' or 'ad4'
+        maps_prefix: Prefix of precomputed maps (required for ad4), None = computed here
+        local_optimization: Also score the poses after a local optimization
+    """
+
+    def __init__(self, receptor_path, box_config, scoring="vinardo", maps_prefix=None, local_optimization=True):
+        if scoring not in SCORING_FUNCTIONS:
+            raise ValueError(f"Unknown scoring function '{scoring}'. Choose from: {', '.join(SCORING_FUNCTIONS)}")
+        if scoring == "ad4" and maps_prefix is None:
+            raise ValueError("The ad4 scoring needs the AutoDock4 maps of the receptor (autogrid4)")
+        self.local_optimization = local_optimization
+        self.vina = _vina()(sf_name=scoring, cpu=1, verbosity=0)
+        if maps_prefix is not None:
+            self.vina.load_maps(maps_prefix)
+        else:
+            box = read_box(box_config)
+            self.vina.set_receptor(str(receptor_path))
+            self.vina.compute_vina_maps(center=[box["center_x"], box["center_y"], box["center_z"]],
+                                        box_size=[box["size_x"], box["size_y"], box["size_z"]],
+                                        spacing=box.get("spacing", DEFAULT_SPACING))
+
+    def score(self, pose):
+        """
+        Scores of one pose (PDBQT string of a single ligand).
+
+        Returns:
+            tuple: (score only, score after the local optimization or NaN) in kcal/mol
+        """
+        self.vina.set_ligand_from_string(pose)
+        score = float(self.vina.score()[0])
+        optimized = float(self.vina.optimize()[0]) if self.local_optimization else np.nan
+        return score, optimized
+
+def read_pose_models(pose_path):
+    """
+    Modes of a Vina output file.
+
+    Returns:
+        tuple: (PDBQT string of every mode without its MODEL/ENDMDL lines, Vina affinity of every mode)
+    """
+    models = []
+    affinities = []
+    lines = []
+    with open(pose_path, 'r') as f:
+        for line in f:
+            if line.startswith("MODEL"):
+                lines = []
+            elif line.startswith("ENDMDL"):
+                models.append("".join(lines))
+            else:
+                if line.startswith("REMARK VINA RESULT:"):
+                    affinities.append(float(line.split()[3]))
+                lines.append(line)
+    if not models and lines:
+        # A single pose without MODEL records
+        models.append("".join(lines))
+    if not models:
+        raise ValueError(f"{pose_path} has no pose")
+    affinities += [np.nan] * (len(models) - len(affinities))
+    return models, affinities
+
+def _load_scorer(receptor_path, box_config, scoring, maps_prefix, local_optimization):
+    global _scorer
+    _scorer = PoseScorer(receptor_path, box_config, scoring, maps_prefix, local_optimization)
+
+def rescore_ligand(ligand_id, pose_path):
+    """
+    Rescore all the modes of one ligand (in a worker process).
+
+    Returns:
+        tuple: (ligand_id, (vina affinities, scores, optimized scores) or None, error message or None)
+    """
+    try:
+        models, affinities = read_pose_models(pose_path)
+        scores = [_scorer.score(model) for model in models]
+    except (OSError, ValueError, RuntimeError) as e:
+        return ligand_id, None, str(e)
+    return ligand_id, (affinities, [score for score, _ in scores], [optimized for _, optimized in scores]), None
+
+def _rescore_ligand_star(arguments):
+    return rescore_ligand(*arguments)
+
+def rescore_poses(input_table, output_table, poses_table, poses_dir, receptor_path, box_config, scoring="vinardo",
+                  local_optimization=True, grid_cache_dir=None, ad4_maps=None, workers=None, metrics_path=None,
+                  progress_interval=10.0, csv_copy=False):
+    """
+    Rescore the docked poses of every ligand of the ranking table and add the score columns to it.
+
+    Args:
+        input_table: Table with an 'id-num' column (e.g. list_with_affinities.csv)
+        output_table: Output table (can be the input table)
+        poses_table: Output table with one row per pose
+        poses_dir: Folder of the <id>-vina-out.pdbqt files
+        receptor_path: Receptor PDBQT file the poses were docked in
+        box_config: Vina box configuration file
+        scoring: 'vina', 'vinardo' or 'ad4'
+        local_optimization: Also score the poses after a local optimization
+        grid_cache_dir: Optional grid maps cache, so the vina/vinardo maps are computed once
+            (see workflow/gridmaps.py)
+        ad4_maps: Prefix of the autogrid4 maps of the receptor (required for ad4)
+        workers: Number of processes (None = all CPUs)
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+        csv_copy: Also save .csv copies when the outputs are columnar
+    """
+    df = read_table(input_table)
+    maps_prefix = ad4_maps if scoring == "ad4" else None
+    if scoring != "ad4" and grid_cache_dir:
+        maps_prefix = GridMapCache(grid_cache_dir).maps_prefix(receptor_path, box_config, scoring=scoring)
+    # Check the setup once before starting the workers
+    PoseScorer(receptor_path, box_config, scoring, maps_prefix, local_optimization)
+
+    tasks = []
+    for ligand_id in df['id-num'].astype(str).str.strip():
+        pose_path = os.path.join(poses_dir, f"{ligand_id}-vina-out.pdbqt")
+        if os.path.exists(pose_path):
+            tasks.append((ligand_id, pose_path))
+    print(f"🎯 Rescoring the poses of {len(tasks)}/{len(df)} docked ligands with {scoring}"
+          f"{' (score only and local optimization)' if local_optimization else ' (score only)'}")
+
+    score_column = f"{scoring}_score"
+    optimized_column = f"{scoring}_optimized"
+    summary = {}
+    errors = {}
+    n_poses = 0
+    progress = Progress("vina-rescore", total=len(tasks), metrics_path=metrics_path, interval=progress_interval)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_scorer,
+                             initargs=(receptor_path, box_config, scoring, maps_prefix, local_optimization)) as executor, \
+            TableWriter(poses_table, csv_copy=csv_copy) as writer:
+        buffer = []
+        for ligand_id, values, error in executor.map(_rescore_ligand_star, tasks, chunksize=16):
+            if values is None:
+                errors[ligand_id] = error
+            else:
+                affinities, scores, optimized = values
+                rows = pd.DataFrame({"id-num": ligand_id, "mode": np.arange(1, len(scores) + 1),
+                                     "vina_affinity": affinities, score_column: scores})
+                if local_optimization:
+                    rows[optimized_column] = optimized
+                # The best mode is judged on the optimized scores when there are some
+                best_values = np.asarray(optimized if local_optimization else scores)
+                best = int(np.nanargmin(best_values)) if not np.isnan(best_values).all() else 0
+                summary[ligand_id] = (scores[0], optimized[0], best_values[best], best + 1)
+                n_poses += len(scores)
+                buffer.append(rows)
+                if len(buffer) == 1000:
+                    writer.write(pd.concat(buffer, ignore_index=True))
+                    buffer = []
+            progress.update(1, failed=int(values is None))
+        if buffer:
+            writer.write(pd.concat(buffer, ignore_index=True))
+    progress.close()
+
+    for ligand_id, error in list(errors.items())[:20]:
+        print(f"⚠️  Ligand {ligand_id}: {error}")
+    if len(errors) > 20:
+        print(f"⚠️  ... and {len(errors) - 20} more")
+
+    ids = df['id-num'].astype(str).str.strip()
+    df[score_column] = ids.map({ligand_id: values[0] for ligand_id, values in summary.items()})
+    if local_optimization:
+        df[optimized_column] = ids.map({ligand_id: values[1] for ligand_id, values in summary.items()})
+    df[f"{scoring}_best"] = ids.map({ligand_id: values[2] for ligand_id, values in summary.items()})
+    df[f"{scoring}_best_mode"] = ids.map({ligand_id: values[3] for ligand_id, values in summary.items()}).astype("Int64")
+    write_table(df, output_table, csv_copy=csv_copy)
+
+    print(f"\n✅ Saved the {scoring} scores of {n_poses} poses to {poses_table}")
+    print(f"✅ Saved {score_column}{f', {optimized_column}' if local_optimization else ''}, {scoring}_best "
+          f"and {scoring}_best_mode to {output_table}")
+    if summary:
+        scored = df[df[score_column].notna()]
+        if 'vina_affinity' in scored.columns and len(scored) > 1:
+            correlation = scored['vina_affinity'].corr(scored[score_column], method='spearman')
+            print(f"📊 Spearman correlation of vina_affinity and {score_column} (mode 1): {correlation:.3f}")
+    return df
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    # Ranking table made by ranking.py, with the score columns added in place
+    INPUT_TABLE = 'poses/list_with_affinities.csv'
+    OUTPUT_TABLE = 'poses/list_with_affinities.csv'
+
+    # One row per pose with its scores
+    POSES_TABLE = 'poses/rescored-poses.csv'
+
+    # Receptor and box of the docking
+    RECEPTOR = 'receptor/1H1Q-prepared.pdbqt'
+    BOX_CONFIG = 'receptor/1H1Q-prepared.box.txt'
+
+    # Scoring function: "vina", "vinardo" or "ad4", and whether the poses are also
+    # scored after a local optimization in the receptor
+    SCORING = 'vinardo'
+    LOCAL_OPTIMIZATION = True
+
+    # Maps of vina/vinardo computed once for all the workers (None = by each worker), and
+    # prefix of the autogrid4 maps for ad4 (e.g. 'receptor/1H1Q-prepared')
+    GRID_CACHE_DIR = 'receptor/grid-maps'
+    AD4_MAPS = None
+
+    # Processes (None = all CPUs)
+    WORKERS = None
+
+    # Output format: "csv", "parquet" or "arrow" (a .csv copy is kept if EXPORT_CSV)
+    TABLE_FORMAT = 'csv'
+    EXPORT_CSV = True
+
+    # Live progress metrics (counts, rate, ETA), updated during the run
+    METRICS_FILE = 'vina-rescore-metrics.json'
+
+    # ===================================================================
+
+    # Run from the Autodock-Vina directory (python vina-rescore.py --profile: timing
+    # breakdown in profiles/, see workflow/profiling.py)
+    with profiled('vina-rescore', profile_dir_from_argv()):
+        rescore_poses(INPUT_TABLE, with_format(OUTPUT_TABLE, TABLE_FORMAT), with_format(POSES_TABLE, TABLE_FORMAT),
+                      'poses', RECEPTOR, BOX_CONFIG, SCORING, LOCAL_OPTIMIZATION, GRID_CACHE_DIR, AD4_MAPS,
+                      WORKERS, METRICS_FILE, csv_copy=EXPORT_CSV)
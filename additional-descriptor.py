@@ -1,117 +1,186 @@
+import collections
+import gzip
+import itertools
+import json
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-from rdkit import Chem
-from rdkit.Chem import Descriptors, QED, Crippen, Lipinski, rdMolDescriptors
+import rdkit
+from rdkit import Chem, RDConfig
+from rdkit.Chem import Descriptors, QED, Crippen, Lipinski, rdFingerprintGenerator, rdMolDescriptors
 from rdkit.Chem import AllChem
 import warnings
 warnings.filterwarnings('ignore')
 
-# DeepChem imports (will be checked for availability)
-try:
-    import deepchem as dc
-    from deepchem.feat import MolecularFeaturizer
-    DEEPCHEM_AVAILABLE = True
-    print("✓ DeepChem is available")
-except ImportError:
-    DEEPCHEM_AVAILABLE = False
-    print("⚠ DeepChem not available - install with: pip install deepchem --break-system-packages")
+from workflow.descriptor_cache import DescriptorCache
+from workflow.profiling import profile_dir_from_argv, profiled
+from workflow.progress import Progress
+from workflow.rules import apply_rules, load_rules
+from workflow.tables import TableWriter, iter_table_chunks, read_table, table_format, table_rows, unified_schema, write_table
+
+# DeepChem pulls in heavy ML frameworks: it is only imported when an ADMET
+# model needs its fingerprints, and the featurizer is created once per process
+_admet_featurizer = None
+
+def get_admet_featurizer():
+    """
+    Circular fingerprint featurizer (1024 bits) of the ADMET models.
+
+    DeepChem is imported and the featurizer built on the first call only;
+    later calls in the same process reuse it.
+
+    Returns:
+        The DeepChem featurizer, or None if DeepChem is not installed
+    """
+    global _admet_featurizer
+    if _admet_featurizer is None:
+        try:
+            import deepchem as dc
+        except ImportError:
+            print("⚠ DeepChem not available - install with: pip install deepchem --break-system-packages")
+            _admet_featurizer = False  # Do not try again in this process
+        else:
+            _admet_featurizer = dc.feat.CircularFingerprint(size=1024)
+    return _admet_featurizer or None
+
+class MoleculeDescriptors:
+    """
+    Shared state of one molecule for all the property groups.
+
+    The SMILES is parsed once, and every RDKit descriptor is computed at most
+    once per molecule: the first property group that asks for MolWt, TPSA,
+    etc. computes it, and the others reuse the memoized value.
+    """
+
+    def __init__(self, smiles):
+        self.smiles = smiles
+        self._values = {}
+        # Set in batches by score_synthetic_accessibility
+        self.sa_score = None
+        try:
+            self.mol = Chem.MolFromSmiles(smiles)
+        except Exception as e:
+            print(f"Error processing SMILES {smiles}: {e}")
+            self.mol = None
+
+    def get(self, descriptor):
+        """
+        Value of a descriptor function of the molecule (e.g. Descriptors.MolWt).
+
+        Functions are memoized by identity, so aliases such as
+        Descriptors.NumHDonors and Lipinski.NumHDonors are computed once.
+        """
+        if descriptor not in self._values:
+            self._values[descriptor] = descriptor(self.mol)
+        return self._values[descriptor]
+
+    def canonical_smiles(self):
+        """Canonical SMILES (the descriptor cache key), or None if the SMILES is invalid"""
+        return self.get(Chem.MolToSmiles) if self.mol is not None else None
+
+    def qed_properties(self):
+        """
+        QED.properties, reusing the memoized MolWt, MolLogP, NumHDonors and TPSA.
 
-def calculate_lipinski_properties(smiles):
+        QED removes explicit hydrogens first, so molecules that have some
+        fall back to QED.properties to keep exactly the same values.
+        """
+        mol = self.mol
+        if any(atom.GetAtomicNum() == 1 for atom in mol.GetAtoms()):
+            return QED.properties(mol)
+        return QED.QEDproperties(
+            MW=self.get(Descriptors.MolWt),
+            ALOGP=self.get(Descriptors.MolLogP),
+            HBA=sum(len(mol.GetSubstructMatches(pattern)) for pattern in QED.Acceptors
+                    if mol.HasSubstructMatch(pattern)),
+            HBD=self.get(Descriptors.NumHDonors),
+            PSA=self.get(Descriptors.TPSA),
+            ROTB=rdMolDescriptors.CalcNumRotatableBonds(mol, rdMolDescriptors.NumRotatableBondsOptions.Strict),
+            AROM=len(Chem.GetSSSR(Chem.DeleteSubstructs(Chem.Mol(mol), QED.AliphaticRings))),
+            ALERTS=sum(1 for alert in QED.StructuralAlerts if mol.HasSubstructMatch(alert))
+        )
+
+def as_molecule(molecule):
+    """Accept either a SMILES string or an already parsed MoleculeDescriptors"""
+    if isinstance(molecule, MoleculeDescriptors):
+        return molecule
+    return MoleculeDescriptors(molecule)
+
+def has_basic_nitrogen(mol):
+    """Simplified basic nitrogen check: any N carrying a hydrogen"""
+    for atom in mol.GetAtoms():
+        if atom.GetSymbol() == 'N' and atom.GetTotalNumHs() > 0:
+            return True
+    return False
+
+def count_stereo_centers(mol):
+    return len(Chem.FindMolChiralCenters(mol, includeUnassigned=True))
+
+def calculate_lipinski_properties(molecule):
     """
     Calculate Lipinski's Rule of 5 properties from SMILES.
+
+    The violations and pass/fail columns are added by the property rules.
     """
     try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
+        molecule = as_molecule(molecule)
+        if molecule.mol is None:
             return {
                 'molecular_weight': None,
                 'logP': None,
                 'num_h_donors': None,
                 'num_h_acceptors': None,
-                'num_rotatable_bonds': None,
-                'lipinski_violations': None,
-                'lipinski_pass': None
+                'num_rotatable_bonds': None
             }
         
-        mw = Descriptors.MolWt(mol)
-        logp = Descriptors.MolLogP(mol)
-        hbd = Descriptors.NumHDonors(mol)
-        hba = Descriptors.NumHAcceptors(mol)
-        rotatable_bonds = Descriptors.NumRotatableBonds(mol)
-        
-        violations = 0
-        if mw > 500:
-            violations += 1
-        if logp > 5:
-            violations += 1
-        if hbd > 5:
-            violations += 1
-        if hba > 10:
-            violations += 1
-        
-        passes = violations <= 1
-        
         return {
-            'molecular_weight': round(mw, 2),
-            'logP': round(logp, 2),
-            'num_h_donors': hbd,
-            'num_h_acceptors': hba,
-            'num_rotatable_bonds': rotatable_bonds,
-            'lipinski_violations': violations,
-            'lipinski_pass': 'Yes' if passes else 'No'
+            'molecular_weight': molecule.get(Descriptors.MolWt),
+            'logP': molecule.get(Descriptors.MolLogP),
+            'num_h_donors': molecule.get(Descriptors.NumHDonors),
+            'num_h_acceptors': molecule.get(Descriptors.NumHAcceptors),
+            'num_rotatable_bonds': molecule.get(Descriptors.NumRotatableBonds)
         }
     except Exception as e:
-        print(f"Error processing SMILES {smiles}: {e}")
+        print(f"Error processing SMILES {molecule.smiles}: {e}")
         return {
             'molecular_weight': None,
             'logP': None,
             'num_h_donors': None,
             'num_h_acceptors': None,
-            'num_rotatable_bonds': None,
-            'lipinski_violations': None,
-            'lipinski_pass': None
+            'num_rotatable_bonds': None
         }
 
-def calculate_qed_score(smiles):
+def calculate_qed_score(molecule):
     """
     Calculate Quantitative Estimation of Drug-likeness (QED) score.
+
+    The classification is added by the property rules.
     """
     try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
-            return {
-                'qed_score': None,
-                'qed_classification': 'N/A'
-            }
-        
-        qed_score = QED.qed(mol)
+        molecule = as_molecule(molecule)
+        if molecule.mol is None:
+            return {'qed_score': None}
         
-        if qed_score >= 0.7:
-            classification = 'Excellent'
-        elif qed_score >= 0.5:
-            classification = 'Good'
-        elif qed_score >= 0.3:
-            classification = 'Moderate'
-        else:
-            classification = 'Poor'
-        
-        return {
-            'qed_score': round(qed_score, 3),
-            'qed_classification': classification
-        }
+        return {'qed_score': QED.qed(molecule.mol, qedProperties=molecule.qed_properties())}
     except Exception as e:
-        print(f"Error calculating QED for SMILES {smiles}: {e}")
-        return {
-            'qed_score': None,
-            'qed_classification': 'N/A'
-        }
+        print(f"Error calculating QED for SMILES {molecule.smiles}: {e}")
+        return {'qed_score': None}
 
-def calculate_kinase_relevant_properties(smiles):
+def calculate_kinase_relevant_properties(molecule):
     """
     Calculate additional properties relevant for kinase inhibitors binding to ATP pocket.
+
+    The custom kinase-likeness score is added by the property rules.
     """
     try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
+        molecule = as_molecule(molecule)
+        if molecule.mol is None:
             return {
                 'tpsa': None,
                 'num_aromatic_rings': None,
@@ -122,56 +191,23 @@ def calculate_kinase_relevant_properties(smiles):
                 'num_hbd_lipinski': None,
                 'molar_refractivity': None,
                 'num_aliphatic_rings': None,
-                'num_saturated_rings': None,
-                'kinase_score': None
+                'num_saturated_rings': None
             }
         
-        tpsa = Descriptors.TPSA(mol)
-        num_aromatic_rings = Descriptors.NumAromaticRings(mol)
-        num_heteroatoms = Descriptors.NumHeteroatoms(mol)
-        num_rings = Descriptors.RingCount(mol)
-        num_aliphatic_rings = Descriptors.NumAliphaticRings(mol)
-        num_saturated_rings = Descriptors.NumSaturatedRings(mol)
-        fraction_csp3 = Descriptors.FractionCSP3(mol)
-        num_hba_lipinski = Lipinski.NumHAcceptors(mol)
-        num_hbd_lipinski = Lipinski.NumHDonors(mol)
-        molar_refractivity = Crippen.MolMR(mol)
-        
-        # Custom kinase-likeness score
-        kinase_score = 0
-        mw = Descriptors.MolWt(mol)
-        hbd = Descriptors.NumHDonors(mol)
-        hba = Descriptors.NumHAcceptors(mol)
-        rotatable = Descriptors.NumRotatableBonds(mol)
-        
-        if 300 <= mw <= 500:
-            kinase_score += 2
-        if 2 <= num_aromatic_rings <= 4:
-            kinase_score += 2
-        if 40 <= tpsa <= 100:
-            kinase_score += 2
-        if 1 <= hbd <= 4:
-            kinase_score += 2
-        if 3 <= hba <= 7:
-            kinase_score += 2
-        if 2 <= rotatable <= 6:
-            kinase_score += 1
-        
         return {
-            'tpsa': round(tpsa, 2),
-            'num_aromatic_rings': num_aromatic_rings,
-            'num_heteroatoms': num_heteroatoms,
-            'num_rings': num_rings,
-            'fraction_csp3': round(fraction_csp3, 3),
-            'num_hba_lipinski': num_hba_lipinski,
-            'num_hbd_lipinski': num_hbd_lipinski,
-            'molar_refractivity': round(molar_refractivity, 2),
-            'num_aliphatic_rings': num_aliphatic_rings,
-            'num_saturated_rings': num_saturated_rings,
-            'kinase_score': kinase_score
+            'tpsa': molecule.get(Descriptors.TPSA),
+            'num_aromatic_rings': molecule.get(Descriptors.NumAromaticRings),
+            'num_heteroatoms': molecule.get(Descriptors.NumHeteroatoms),
+            'num_rings': molecule.get(Descriptors.RingCount),
+            'fraction_csp3': molecule.get(Descriptors.FractionCSP3),
+            'num_hba_lipinski': molecule.get(Lipinski.NumHAcceptors),
+            'num_hbd_lipinski': molecule.get(Lipinski.NumHDonors),
+            'molar_refractivity': molecule.get(Crippen.MolMR),
+            'num_aliphatic_rings': molecule.get(Descriptors.NumAliphaticRings),
+            'num_saturated_rings': molecule.get(Descriptors.NumSaturatedRings)
         }
     except Exception as e:
-        print(f"Error calculating kinase properties for SMILES {smiles}: {e}")
+        print(f"Error calculating kinase properties for SMILES {molecule.smiles}: {e}")
         return {
             'tpsa': None,
             'num_aromatic_rings': None,
@@ -182,51 +218,130 @@ def calculate_kinase_relevant_properties(smiles):
             'num_hbd_lipinski': None,
             'molar_refractivity': None,
             'num_aliphatic_rings': None,
-            'num_saturated_rings': None,
-            'kinase_score': None
+            'num_saturated_rings': None
         }
 
-def calculate_synthetic_accessibility(smiles):
+# Fragment contributions of the Ertl & Schuffenhauer SA score, shipped with RDKit
+SA_FRAGMENT_SCORES = os.path.join(RDConfig.RDContribDir, 'SA_Score', 'fpscores.pkl.gz')
+
+# Fragments are the radius-2 Morgan environments; unknown ones score -4
+SA_UNKNOWN_FRAGMENT_SCORE = -4.0
+_sa_fragment_generator = rdFingerprintGenerator.GetMorganGenerator(radius=2)
+
+# Loaded fragment tables of this process, by file
+_sa_fragment_scores = {}
+
+def load_sa_fragment_scores(path=SA_FRAGMENT_SCORES):
+    """
+    Fragment score table of the SA score, loaded once per process.
+
+    The pickle lists [score, fragment id, fragment id, ...] rows. It is kept
+    as two arrays sorted by fragment id (uint32 ids, float32 scores), a few
+    MB instead of a dict of 700k Python objects.
+
+    Returns:
+        tuple: (fragment ids, scores), or None if the file is missing
+    """
+    path = str(path)
+    if path not in _sa_fragment_scores:
+        try:
+            with gzip.open(path, 'rb') as f:
+                rows = pickle.load(f)
+        except FileNotFoundError:
+            print(f"⚠ SA fragment scores not found at {path} - sa_score is left empty")
+            _sa_fragment_scores[path] = None  # Do not try again in this process
+        else:
+            ids = np.fromiter((fragment for row in rows for fragment in row[1:]), dtype=np.uint32)
+            scores = np.fromiter((row[0] for row in rows for _ in row[1:]), dtype=np.float32)
+            order = np.argsort(ids)
+            _sa_fragment_scores[path] = (ids[order], scores[order])
+    return _sa_fragment_scores[path]
+
+def score_synthetic_accessibility(molecules, fragment_scores_path=SA_FRAGMENT_SCORES):
+    """
+    Ertl SA score (1 = easy, 10 = hard) of many parsed molecules at once.
+
+    The fragments of the whole batch are looked up in the fragment table
+    with one searchsorted call; the complexity penalties reuse the memoized
+    stereo, bridgehead and spiro counts. Same formula as RDKit's
+    Contrib/SA_Score/sascorer.py. The scores are also stored in the
+    sa_score attribute of each molecule.
+
+    Args:
+        molecules: MoleculeDescriptors with a valid mol
+
+    Returns:
+        ndarray: SA scores, or None if the fragment table is missing
+    """
+    table = load_sa_fragment_scores(fragment_scores_path)
+    if table is None or not molecules:
+        return None
+    fragment_ids, fragment_scores = table
+
+    ids, counts, lengths = [], [], []
+    for molecule in molecules:
+        fragments = _sa_fragment_generator.GetSparseCountFingerprint(molecule.mol).GetNonzeroElements()
+        ids.extend(fragments.keys())
+        counts.extend(fragments.values())
+        lengths.append(len(fragments))
+    ids = np.array(ids, dtype=np.uint32)
+    counts = np.array(counts, dtype=np.float64)
+    lengths = np.array(lengths)
+
+    # Fragment score: count-weighted mean contribution of the fragments
+    found = np.minimum(np.searchsorted(fragment_ids, ids), len(fragment_ids) - 1)
+    contributions = np.where(fragment_ids[found] == ids, fragment_scores[found], SA_UNKNOWN_FRAGMENT_SCORE)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    score1 = np.add.reduceat(contributions * counts, starts) / np.add.reduceat(counts, starts)
+
+    # Complexity penalties (size, stereo centers, spiro, bridgeheads, macrocycles)
+    n_atoms = np.array([molecule.mol.GetNumAtoms() for molecule in molecules], dtype=np.float64)
+    n_stereo = np.array([molecule.get(count_stereo_centers) for molecule in molecules])
+    n_spiro = np.array([molecule.get(rdMolDescriptors.CalcNumSpiroAtoms) for molecule in molecules])
+    n_bridgehead = np.array([molecule.get(rdMolDescriptors.CalcNumBridgeheadAtoms) for molecule in molecules])
+    has_macrocycle = np.array([any(len(ring) > 8 for ring in molecule.mol.GetRingInfo().AtomRings())
+                               for molecule in molecules])
+    score2 = -(n_atoms ** 1.005 - n_atoms + np.log10(n_stereo + 1) + np.log10(n_spiro + 1)
+               + np.log10(n_bridgehead + 1) + np.where(has_macrocycle, np.log10(2), 0.0))
+
+    # Symmetric molecules (fewer distinct fragments than atoms) are easier
+    score3 = np.where(n_atoms > lengths, np.log(n_atoms / lengths) * 0.5, 0.0)
+
+    # Scale the raw score between 1 and 10, smoothing the hard end
+    sa_scores = 11.0 - (score1 + score2 + score3 + 4.0 + 1) / 6.5 * 9.0
+    sa_scores = np.where(sa_scores > 8.0, 8.0 + np.log(np.maximum(sa_scores - 8.0, 1e-12)), sa_scores)
+    sa_scores = np.clip(sa_scores, 1.0, 10.0)
+
+    for molecule, sa_score in zip(molecules, sa_scores):
+        molecule.sa_score = float(sa_score)
+    return sa_scores
+
+def calculate_synthetic_accessibility(molecule):
     """
     Calculate Synthetic Accessibility Score.
+
+    Molecules already scored in a batch (see featurize_chunk) reuse their
+    score; others are scored alone. The category is added by the property rules.
     """
     try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
-            return {'sa_score': None, 'sa_category': 'N/A'}
-        
-        try:
-            sa_score = rdMolDescriptors.CalcSyntheticAccessibility(mol)
-        except:
-            sa_score = None
+        molecule = as_molecule(molecule)
+        if molecule.mol is None or molecule.mol.GetNumAtoms() == 0:
+            return {'sa_score': None}
         
-        if sa_score is not None:
-            if sa_score <= 3:
-                category = 'Easy'
-            elif sa_score <= 5:
-                category = 'Moderate'
-            elif sa_score <= 7:
-                category = 'Challenging'
-            else:
-                category = 'Difficult'
-            
-            return {
-                'sa_score': round(sa_score, 2),
-                'sa_category': category
-            }
-        else:
-            return {'sa_score': None, 'sa_category': 'N/A'}
-            
+        if molecule.sa_score is None:
+            score_synthetic_accessibility([molecule])
+        return {'sa_score': molecule.sa_score}
     except Exception as e:
-        return {'sa_score': None, 'sa_category': 'N/A'}
+        print(f"Error calculating SA score for SMILES {molecule.smiles}: {e}")
+        return {'sa_score': None}
 
-def calculate_additional_descriptors(smiles):
+def calculate_additional_descriptors(molecule):
     """
     Calculate additional molecular descriptors useful for drug discovery.
     """
     try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
+        molecule = as_molecule(molecule)
+        if molecule.mol is None:
             return {
                 'num_stereo_centers': None,
                 'formal_charge': None,
@@ -236,12 +351,12 @@ def calculate_additional_descriptors(smiles):
                 'bertz_complexity': None
             }
         
-        num_stereo_centers = len(Chem.FindMolChiralCenters(mol, includeUnassigned=True))
-        formal_charge = Chem.GetFormalCharge(mol)
-        num_sp3_carbons = rdMolDescriptors.CalcNumAliphaticCarbocycles(mol)
-        num_bridgehead = rdMolDescriptors.CalcNumBridgeheadAtoms(mol)
-        num_spiro = rdMolDescriptors.CalcNumSpiroAtoms(mol)
-        bertz = Descriptors.BertzCT(mol)
+        num_stereo_centers = molecule.get(count_stereo_centers)
+        formal_charge = molecule.get(Chem.GetFormalCharge)
+        num_sp3_carbons = molecule.get(rdMolDescriptors.CalcNumAliphaticCarbocycles)
+        num_bridgehead = molecule.get(rdMolDescriptors.CalcNumBridgeheadAtoms)
+        num_spiro = molecule.get(rdMolDescriptors.CalcNumSpiroAtoms)
+        bertz = molecule.get(Descriptors.BertzCT)
         
         return {
             'num_stereo_centers': num_stereo_centers,
@@ -249,10 +364,10 @@ def calculate_additional_descriptors(smiles):
             'num_sp3_carbons': num_sp3_carbons,
             'num_bridgehead_atoms': num_bridgehead,
             'num_spiro_atoms': num_spiro,
-            'bertz_complexity': round(bertz, 2)
+            'bertz_complexity': bertz
         }
     except Exception as e:
-        print(f"Error calculating additional descriptors for SMILES {smiles}: {e}")
+        print(f"Error calculating additional descriptors for SMILES {molecule.smiles}: {e}")
         return {
             'num_stereo_centers': None,
             'formal_charge': None,
@@ -262,311 +377,635 @@ def calculate_additional_descriptors(smiles):
             'bertz_complexity': None
         }
 
-def calculate_deepchem_properties(smiles):
+def calculate_admet_properties(molecule):
     """
-    Calculate ADMET properties using DeepChem models.
-    
-    Properties predicted:
+    Structural flags used by the heuristic ADMET rules (RDKit only).
+
+    The ADMET columns themselves are computed by the "admet" property rules
+    from the descriptors of the other groups:
     - Solubility (LogS): Water solubility in log mol/L
     - CYP P450 inhibition: Drug-drug interaction potential
     - hERG liability: Cardiac toxicity risk
     - Blood-Brain Barrier (BBB) permeability
     - Clearance: How quickly drug is eliminated
     """
-    if not DEEPCHEM_AVAILABLE:
-        return {
-            'solubility_logs': None,
-            'solubility_class': 'N/A',
-            'bbb_permeability': None,
-            'cyp3a4_inhibitor': None,
-            'herg_liability': None,
-            'clearance_pred': None
-        }
-    
     try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
-            return {
-                'solubility_logs': None,
-                'solubility_class': 'N/A',
-                'bbb_permeability': None,
-                'cyp3a4_inhibitor': None,
-                'herg_liability': None,
-                'clearance_pred': None
-            }
-        
-        results = {
-            'solubility_logs': None,
-            'solubility_class': 'N/A',
-            'bbb_permeability': None,
-            'cyp3a4_inhibitor': None,
-            'herg_liability': None,
-            'clearance_pred': None
-        }
-        
-        # Try to load and use pre-trained DeepChem models
-        # Note: These require downloading models, which may not work in all environments
-        try:
-            # Solubility prediction (ESOL model)
-            from deepchem.molnet import load_delaney
-            featurizer = dc.feat.CircularFingerprint(size=1024)
-            features = featurizer.featurize([smiles])
-            
-            # Estimate solubility using simple RDKit descriptors as fallback
-            # LogS = 0.5 - 0.01*MW - logP (simplified ESOL equation)
-            mw = Descriptors.MolWt(mol)
-            logp = Descriptors.MolLogP(mol)
-            logs_estimate = 0.5 - 0.01*mw - logp
-            
-            results['solubility_logs'] = round(logs_estimate, 2)
-            
-            # Classify solubility
-            if logs_estimate >= -1:
-                sol_class = 'Highly soluble'
-            elif logs_estimate >= -3:
-                sol_class = 'Soluble'
-            elif logs_estimate >= -5:
-                sol_class = 'Moderately soluble'
-            else:
-                sol_class = 'Poorly soluble'
-            
-            results['solubility_class'] = sol_class
-            
-        except Exception as e:
-            print(f"  Note: Solubility estimation failed, using simplified model")
-            pass
-        
-        # Blood-Brain Barrier permeability estimation
-        # Simple rule: BBB+ if TPSA < 90 and MW < 450
-        try:
-            tpsa = Descriptors.TPSA(mol)
-            mw = Descriptors.MolWt(mol)
-            
-            if tpsa < 90 and mw < 450:
-                results['bbb_permeability'] = 'Likely'
-            elif tpsa < 120 and mw < 500:
-                results['bbb_permeability'] = 'Uncertain'
-            else:
-                results['bbb_permeability'] = 'Unlikely'
-        except:
-            pass
-        
-        # CYP3A4 inhibition risk (simple heuristic)
-        # Higher MW and lipophilicity increase CYP inhibition risk
-        try:
-            mw = Descriptors.MolWt(mol)
-            logp = Descriptors.MolLogP(mol)
-            
-            if mw > 400 and logp > 3:
-                results['cyp3a4_inhibitor'] = 'High risk'
-            elif mw > 350 and logp > 2:
-                results['cyp3a4_inhibitor'] = 'Moderate risk'
-            else:
-                results['cyp3a4_inhibitor'] = 'Low risk'
-        except:
-            pass
-        
-        # hERG liability (cardiac toxicity)
-        # High risk if: basic nitrogen + aromatic rings + logP > 3
-        try:
-            logp = Descriptors.MolLogP(mol)
-            aromatic_rings = Descriptors.NumAromaticRings(mol)
-            
-            # Check for basic nitrogen (simplified)
-            has_basic_n = False
-            for atom in mol.GetAtoms():
-                if atom.GetSymbol() == 'N' and atom.GetTotalNumHs() > 0:
-                    has_basic_n = True
-                    break
-            
-            if has_basic_n and aromatic_rings >= 2 and logp > 3:
-                results['herg_liability'] = 'High risk'
-            elif aromatic_rings >= 2 and logp > 2:
-                results['herg_liability'] = 'Moderate risk'
-            else:
-                results['herg_liability'] = 'Low risk'
-        except:
-            pass
-        
-        # Clearance prediction (simplified)
-        # Lower MW and more polar = faster clearance
-        try:
-            mw = Descriptors.MolWt(mol)
-            tpsa = Descriptors.TPSA(mol)
-            
-            clearance_score = (500 - mw) / 100 + tpsa / 50
-            
-            if clearance_score > 4:
-                results['clearance_pred'] = 'Fast'
-            elif clearance_score > 2:
-                results['clearance_pred'] = 'Moderate'
-            else:
-                results['clearance_pred'] = 'Slow'
-        except:
-            pass
-        
-        return results
+        molecule = as_molecule(molecule)
+        if molecule.mol is None:
+            return {'has_basic_nitrogen': None}
         
+        return {'has_basic_nitrogen': molecule.get(has_basic_nitrogen)}
     except Exception as e:
-        print(f"Error calculating DeepChem properties for SMILES {smiles}: {e}")
-        return {
-            'solubility_logs': None,
-            'solubility_class': 'N/A',
-            'bbb_permeability': None,
-            'cyp3a4_inhibitor': None,
-            'herg_liability': None,
-            'clearance_pred': None
-        }
+        print(f"Error calculating ADMET properties for SMILES {molecule.smiles}: {e}")
+        return {'has_basic_nitrogen': None}
 
-# Load the best 10 molecules
-df_best10 = pd.read_csv('list-best10.csv')
+# Property groups, all computed from the same parsed molecule
+PROPERTY_GROUPS = [
+    calculate_lipinski_properties,
+    calculate_qed_score,
+    calculate_kinase_relevant_properties,
+    calculate_synthetic_accessibility,
+    calculate_additional_descriptors
+]
 
-print(f"📄 Loaded {len(df_best10)} molecules from list-best10.csv\n")
+# Optional ADMET group (solubility, BBB, CYP3A4, hERG, clearance)
+ADMET_GROUPS = [calculate_admet_properties]
 
-# Calculate properties for each molecule
-lipinski_results = []
-qed_results = []
-kinase_results = []
-sa_results = []
-additional_results = []
-deepchem_results = []
+# Scores and classifications computed from the descriptors: the "properties"
+# rules (Lipinski, QED class, kinase score, SA category) and the "admet"
+# rules (heuristic ADMET columns). See workflow/rules.py for the format.
+PROPERTY_RULES = Path(__file__).with_name('property-rules.json')
 
-for idx, row in df_best10.iterrows():
-    smiles = row['smiles']
-    print(f"Processing molecule {idx+1}/{len(df_best10)}...")
-    
-    props = calculate_lipinski_properties(smiles)
-    lipinski_results.append(props)
-    
-    qed = calculate_qed_score(smiles)
-    qed_results.append(qed)
-    
-    kinase = calculate_kinase_relevant_properties(smiles)
-    kinase_results.append(kinase)
-    
-    sa = calculate_synthetic_accessibility(smiles)
-    sa_results.append(sa)
-    
-    additional = calculate_additional_descriptors(smiles)
-    additional_results.append(additional)
-    
-    # DeepChem ADMET predictions
-    if DEEPCHEM_AVAILABLE:
-        deepchem = calculate_deepchem_properties(smiles)
-        deepchem_results.append(deepchem)
-
-# Create DataFrames
-df_lipinski = pd.DataFrame(lipinski_results)
-df_qed = pd.DataFrame(qed_results)
-df_kinase = pd.DataFrame(kinase_results)
-df_sa = pd.DataFrame(sa_results)
-df_additional = pd.DataFrame(additional_results)
-
-# Combine with original data
-dataframes_to_concat = [
-    df_best10.reset_index(drop=True), 
-    df_lipinski, 
-    df_qed,
-    df_kinase,
-    df_sa,
-    df_additional
+# Loaded rule files of this process, by file
+_property_rules = {}
+
+def get_property_rules(rules_path=None):
+    """Rule file of the scores and classifications, read once per process"""
+    rules_path = str(rules_path or PROPERTY_RULES)
+    if rules_path not in _property_rules:
+        _property_rules[rules_path] = load_rules(rules_path)
+    return _property_rules[rules_path]
+
+def classify_properties(df_properties, admet=True, rules_path=None, skip=()):
+    """
+    Add the score and classification columns to a descriptor table.
+
+    All the rows are evaluated at once (vectorized), so a whole table can be
+    reclassified under new thresholds without recomputing any descriptor.
+
+    Args:
+        df_properties: Descriptor table (one row per molecule)
+        admet: Also evaluate the "admet" rules
+        rules_path: Rule file (default: property-rules.json)
+        skip: Names of rules not to evaluate
+    """
+    rules = get_property_rules(rules_path)
+    sections = [rules['properties']] + ([rules['admet']] if admet else [])
+    for section in sections:
+        df_properties = apply_rules(df_properties, section, only=[name for name in section if name not in skip])
+    return df_properties
+
+# ADMET columns that a locally stored model can predict instead of the
+# heuristic rules. Regression models predict the value itself; classifiers
+# give the probability of the first label, mapped to the labels with the
+# thresholds below (>= high: first label, >= low: second, else third).
+ADMET_ENDPOINTS = {
+    'solubility_logs': None,
+    'bbb_permeability': ('Likely', 'Uncertain', 'Unlikely'),
+    'cyp3a4_inhibitor': ('High risk', 'Moderate risk', 'Low risk'),
+    'herg_liability': ('High risk', 'Moderate risk', 'Low risk'),
+    'clearance_pred': ('Fast', 'Moderate', 'Slow')
+}
+ADMET_PROBABILITY_THRESHOLDS = (0.7, 0.3)
+
+# Loaded model bundles of this process, by file
+_admet_models = {}
+
+def load_admet_models(model_path):
+    """
+    Load a local ADMET model bundle once per process (no download).
+
+    The bundle is a pickled dict:
+        'models': {column: model} for columns of ADMET_ENDPOINTS. Models
+                  follow the scikit-learn API (predict for solubility_logs,
+                  predict_proba for the classification columns)
+        'fingerprint': Whether the input starts with the 1024-bit circular
+                       fingerprint of get_admet_featurizer (default True)
+        'descriptors': Names of RDKit Descriptors functions appended to
+                       the input, in order (default none)
+    """
+    model_path = str(model_path)
+    if model_path not in _admet_models:
+        with open(model_path, 'rb') as f:
+            bundle = pickle.load(f)
+        unknown = set(bundle['models']) - set(ADMET_ENDPOINTS)
+        if unknown:
+            raise ValueError(f"{model_path}: no ADMET column named {', '.join(sorted(unknown))}")
+        _admet_models[model_path] = bundle
+    return _admet_models[model_path]
+
+def build_admet_matrix(molecules, bundle):
+    """
+    Input matrix of the ADMET models for all the (valid) molecules at once.
+
+    Returns:
+        ndarray: One row per molecule, or None if the fingerprints are needed
+                 and DeepChem is not installed
+    """
+    blocks = []
+    if bundle.get('fingerprint', True):
+        featurizer = get_admet_featurizer()
+        if featurizer is None:
+            return None
+        blocks.append(np.asarray(featurizer.featurize([molecule.mol for molecule in molecules]), dtype=float))
+
+    descriptor_names = bundle.get('descriptors', [])
+    if descriptor_names:
+        functions = [getattr(Descriptors, name) for name in descriptor_names]
+        blocks.append(np.array([[molecule.get(function) for function in functions] for molecule in molecules],
+                               dtype=float))
+    return np.hstack(blocks)
+
+def predict_admet(df_properties, molecules, model_path, rules_path=None):
+    """
+    Replace the heuristic ADMET columns by the predictions of local models.
+
+    The input matrix of the whole chunk is built once and every model scores
+    it in a single call. Columns without a model, and molecules that could
+    not be parsed, keep the heuristic values.
+
+    Args:
+        df_properties: Property table of the chunk (one row per molecule)
+        molecules: MoleculeDescriptors of the same rows
+        model_path: Pickled model bundle (see load_admet_models)
+        rules_path: Rule file of the solubility classes (default: property-rules.json)
+    """
+    bundle = load_admet_models(model_path)
+    valid = np.array([molecule.mol is not None for molecule in molecules], dtype=bool)
+    if not valid.any():
+        return df_properties
+
+    X = build_admet_matrix([molecule for molecule in molecules if molecule.mol is not None], bundle)
+    if X is None:
+        print("⚠ ADMET models need the DeepChem fingerprints - keeping the heuristic ADMET columns")
+        return df_properties
+
+    high, low = ADMET_PROBABILITY_THRESHOLDS
+    for column, model in bundle['models'].items():
+        labels = ADMET_ENDPOINTS[column]
+        if labels is None:
+            df_properties[column] = df_properties[column].astype('float64')
+            df_properties.loc[valid, column] = model.predict(X)
+            continue
+
+        probability = model.predict_proba(X)[:, 1]
+        df_properties[f'{column}_probability'] = np.nan
+        df_properties.loc[valid, f'{column}_probability'] = np.round(probability, 3)
+        df_properties.loc[valid, column] = np.where(probability >= high, labels[0],
+                                                    np.where(probability >= low, labels[1], labels[2]))
+
+    # The solubility class follows the predicted LogS
+    if 'solubility_logs' in bundle['models']:
+        df_properties = apply_rules(df_properties, get_property_rules(rules_path)['admet'], only=['solubility_class'])
+    return df_properties
+
+# Bump when a property formula changes: cached values of older versions are then ignored
+DESCRIPTOR_SET_VERSION = 3
+
+# Open descriptor caches of this process, by file
+_descriptor_caches = {}
+
+def get_descriptor_cache(cache_path, admet=True, max_entries=1000000):
+    """
+    Persistent descriptor cache of this process for the selected property groups.
+
+    The cache namespace contains the RDKit version, DESCRIPTOR_SET_VERSION
+    and the property groups, so values computed differently are never reused.
+    """
+    groups = PROPERTY_GROUPS + (ADMET_GROUPS if admet else [])
+    namespace = (f"rdkit-{rdkit.__version__}/v{DESCRIPTOR_SET_VERSION}/"
+                 + ",".join(group.__name__ for group in groups))
+    key = (str(cache_path), namespace)
+    if key not in _descriptor_caches:
+        _descriptor_caches[key] = DescriptorCache(cache_path, namespace, max_entries)
+    return _descriptor_caches[key]
+
+# Count properties stay integers even when a molecule could not be parsed,
+# so every chunk of a large run has the same column types
+INTEGER_PROPERTIES = [
+    'num_h_donors', 'num_h_acceptors', 'num_rotatable_bonds', 'lipinski_violations',
+    'num_aromatic_rings', 'num_heteroatoms', 'num_rings', 'num_hba_lipinski', 'num_hbd_lipinski',
+    'num_aliphatic_rings', 'num_saturated_rings', 'kinase_score', 'num_stereo_centers',
+    'formal_charge', 'num_sp3_carbons', 'num_bridgehead_atoms', 'num_spiro_atoms'
 ]
+FLOAT_PROPERTIES = [
+    'molecular_weight', 'logP', 'qed_score', 'tpsa', 'fraction_csp3', 'molar_refractivity',
+    'sa_score', 'bertz_complexity', 'solubility_logs'
+]
+BOOLEAN_PROPERTIES = ['has_basic_nitrogen']
+
+# Decimals kept in the output table. The rules classify the exact values,
+# the rounding is only applied when the table is written.
+ROUNDED_PROPERTIES = {
+    'molecular_weight': 2, 'logP': 2, 'qed_score': 3, 'tpsa': 2, 'fraction_csp3': 3,
+    'molar_refractivity': 2, 'sa_score': 2, 'bertz_complexity': 2, 'solubility_logs': 2
+}
+
+# Column order of the output table (columns of custom rules come after)
+PROPERTY_COLUMNS = [
+    'molecular_weight', 'logP', 'num_h_donors', 'num_h_acceptors', 'num_rotatable_bonds',
+    'lipinski_violations', 'lipinski_pass',
+    'qed_score', 'qed_classification',
+    'tpsa', 'num_aromatic_rings', 'num_heteroatoms', 'num_rings', 'fraction_csp3', 'num_hba_lipinski',
+    'num_hbd_lipinski', 'molar_refractivity', 'num_aliphatic_rings', 'num_saturated_rings', 'kinase_score',
+    'sa_score', 'sa_category',
+    'num_stereo_centers', 'formal_charge', 'num_sp3_carbons', 'num_bridgehead_atoms', 'num_spiro_atoms',
+    'bertz_complexity',
+    'has_basic_nitrogen', 'solubility_logs', 'solubility_class', 'bbb_permeability', 'cyp3a4_inhibitor',
+    'herg_liability', 'clearance_pred'
+]
+
+def cast_properties(df_properties):
+    """Fixed column types (integers stay integers with missing values)"""
+    dtypes = {column: 'Int64' for column in INTEGER_PROPERTIES if column in df_properties}
+    dtypes.update({column: 'float64' for column in FLOAT_PROPERTIES if column in df_properties})
+    dtypes.update({column: 'boolean' for column in BOOLEAN_PROPERTIES if column in df_properties})
+    return df_properties.astype(dtypes)
+
+def format_properties(df_properties, leading=()):
+    """Types, rounding and column order of the output table (leading columns first)"""
+    df_properties = cast_properties(df_properties)
+    df_properties = df_properties.round({column: decimals for column, decimals in ROUNDED_PROPERTIES.items()
+                                         if column in df_properties})
+    known = list(leading) + [column for column in PROPERTY_COLUMNS if column in df_properties]
+    others = [column for column in df_properties if column not in known]
+    return df_properties[known + others]
+
+def featurize_molecule(molecule, admet=True):
+    """
+    All property groups of one molecule (the SMILES is parsed once).
+
+    Only the descriptors are computed here; the scores and classifications
+    are added over the whole chunk by classify_properties.
+    """
+    molecule = as_molecule(molecule)
+    props = {}
+    for calculate_group in PROPERTY_GROUPS + (ADMET_GROUPS if admet else []):
+        props.update(calculate_group(molecule))
+    return props
+
+def featurize_chunk(df_chunk, verbose=False, admet=True, cache_path=None, cache_max_entries=1000000,
+                    admet_model_path=None, rules_path=None):
+    """
+    Add the properties of every molecule to a chunk of the ranked list.
+
+    Args:
+        df_chunk: DataFrame with a 'smiles' column
+        verbose: Print one line per molecule
+        admet: Also add the ADMET columns
+        cache_path: Optional SQLite descriptor cache; only the molecules
+                    missing from it are computed
+        cache_max_entries: Maximum number of molecules kept in the cache
+        admet_model_path: Optional local ADMET model bundle, scored in one
+                          batch over the chunk (see predict_admet)
+        rules_path: Rule file of the scores and classifications
+                    (default: property-rules.json)
+
+    Returns:
+        DataFrame: The input columns followed by the property columns
+    """
+    molecules = [MoleculeDescriptors(smiles) for smiles in df_chunk['smiles']]
+    keys = [molecule.canonical_smiles() for molecule in molecules]
+
+    cached = {}
+    cache = None
+    if cache_path is not None:
+        cache = get_descriptor_cache(cache_path, admet, cache_max_entries)
+        cached = cache.get_many([key for key in keys if key is not None])
+
+    # SA scores of the molecules to compute, in one batch
+    pending = {key: molecule for molecule, key in zip(molecules, keys)
+               if key is not None and key not in cached and molecule.mol.GetNumAtoms() > 0}
+    score_synthetic_accessibility(list(pending.values()))
+
+    property_results = []
+    computed = {}
+    for position, (molecule, key) in enumerate(zip(molecules, keys)):
+        if verbose:
+            print(f"Processing molecule {position+1}/{len(df_chunk)}...")
+        if key in cached:
+            props = cached[key]
+        elif key in computed:
+            props = computed[key]
+        else:
+            props = featurize_molecule(molecule, admet)
+            if key is not None:
+                computed[key] = props
+        property_results.append(props)
+
+    if cache is not None:
+        cache.put_many(computed)
+
+    df_properties = classify_properties(cast_properties(pd.DataFrame(property_results)), admet, rules_path)
+    if admet and admet_model_path is not None:
+        df_properties = predict_admet(df_properties, molecules, admet_model_path, rules_path)
+    return pd.concat([df_chunk.reset_index(drop=True), format_properties(df_properties)], axis=1)
+
+def print_property_categories(admet=True):
+    """Print the list of the property columns added to the candidates"""
+    print(f"\n📊 Property Categories Added:")
+    print("   ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+    print("   🔹 Lipinski Properties:")
+    print("      • molecular_weight, logP, H-donors/acceptors")
+    print("      • rotatable_bonds, violations, pass/fail")
+    print("\n   🔹 Drug-likeness:")
+    print("      • qed_score, qed_classification")
+    print("\n   🔹 Kinase-Specific Properties:")
+    print("      • TPSA (polar surface area)")
+    print("      • aromatic_rings (ATP pocket binding)")
+    print("      • heteroatoms (hinge H-bonding)")
+    print("      • ring counts, Fsp3")
+    print("      • molar_refractivity")
+    print("      • kinase_score (custom scoring)")
+    print("\n   🔹 Synthetic Accessibility:")
+    print("      • sa_score, sa_category")
+    print("\n   🔹 Additional Descriptors:")
+    print("      • stereo_centers, formal_charge")
+    print("      • structural complexity indices")
+
+    if admet:
+        print("\n   🔹 ADMET Properties (heuristic rules):")
+        print("      • solubility_logs, solubility_class")
+        print("      • bbb_permeability (CNS penetration)")
+        print("      • cyp3a4_inhibitor (drug-drug interactions)")
+        print("      • herg_liability (cardiac toxicity)")
+        print("      • clearance_pred (elimination rate)")
+
+def print_summary(df_candidates):
+    """Print the analysis summary of the featurized candidates"""
+    print(f"\n{'='*50}")
+    print(f"{'ANALYSIS SUMMARY':^50}")
+    print(f"{'='*50}")
+
+    print(f"\n🎯 Drug-likeness:")
+    print(f"   Lipinski pass: {(df_candidates['lipinski_pass'] == 'Yes').sum()}/{len(df_candidates)}")
+    print(f"   Average QED: {df_candidates['qed_score'].mean():.3f}")
+    print(f"   QED ≥ 0.7 (Excellent): {(df_candidates['qed_score'] >= 0.7).sum()}/{len(df_candidates)}")
 
-if DEEPCHEM_AVAILABLE and deepchem_results:
-    df_deepchem = pd.DataFrame(deepchem_results)
-    dataframes_to_concat.append(df_deepchem)
-
-df_candidates = pd.concat(dataframes_to_concat, axis=1)
-
-# Save to CSV
-df_candidates.to_csv('candidates.csv', index=False)
-
-print(f"\n✅ Saved {len(df_candidates)} candidates to 'candidates.csv'")
-print(f"\n📊 Property Categories Added:")
-print("   ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-print("   🔹 Lipinski Properties:")
-print("      • molecular_weight, logP, H-donors/acceptors")
-print("      • rotatable_bonds, violations, pass/fail")
-print("\n   🔹 Drug-likeness:")
-print("      • qed_score, qed_classification")
-print("\n   🔹 Kinase-Specific Properties:")
-print("      • TPSA (polar surface area)")
-print("      • aromatic_rings (ATP pocket binding)")
-print("      • heteroatoms (hinge H-bonding)")
-print("      • ring counts, Fsp3")
-print("      • molar_refractivity")
-print("      • kinase_score (custom scoring)")
-print("\n   🔹 Synthetic Accessibility:")
-print("      • sa_score, sa_category")
-print("\n   🔹 Additional Descriptors:")
-print("      • stereo_centers, formal_charge")
-print("      • structural complexity indices")
-
-if DEEPCHEM_AVAILABLE:
-    print("\n   🔹 ADMET Properties (DeepChem):")
-    print("      • solubility_logs, solubility_class")
-    print("      • bbb_permeability (CNS penetration)")
-    print("      • cyp3a4_inhibitor (drug-drug interactions)")
-    print("      • herg_liability (cardiac toxicity)")
-    print("      • clearance_pred (elimination rate)")
-
-# Enhanced Summary
-print(f"\n{'='*50}")
-print(f"{'ANALYSIS SUMMARY':^50}")
-print(f"{'='*50}")
-
-print(f"\n🎯 Drug-likeness:")
-print(f"   Lipinski pass: {(df_lipinski['lipinski_pass'] == 'Yes').sum()}/{len(df_candidates)}")
-print(f"   Average QED: {df_qed['qed_score'].mean():.3f}")
-print(f"   QED ≥ 0.7 (Excellent): {(df_qed['qed_score'] >= 0.7).sum()}/{len(df_candidates)}")
-
-print(f"\n🧬 Kinase-Specific Metrics:")
-print(f"   Avg aromatic rings: {df_kinase['num_aromatic_rings'].mean():.1f}")
-print(f"   Avg TPSA: {df_kinase['tpsa'].mean():.1f} A")
-print(f"   TPSA in ideal range (40-100): {((df_kinase['tpsa'] >= 40) & (df_kinase['tpsa'] <= 100)).sum()}/{len(df_candidates)}")
-print(f"   Avg kinase score: {df_kinase['kinase_score'].mean():.1f}/11")
-print(f"   High kinase score (≥8): {(df_kinase['kinase_score'] >= 8).sum()}/{len(df_candidates)}")
-
-if df_sa['sa_score'].notna().any():
-    print(f"\n🔬 Synthetic Accessibility:")
-    print(f"   Avg SA score: {df_sa['sa_score'].mean():.2f} (1=easy, 10=hard)")
-    print(f"   Easy to synthesize (≤3): {(df_sa['sa_score'] <= 3).sum()}/{len(df_candidates)}")
-
-if DEEPCHEM_AVAILABLE and deepchem_results:
-    print(f"\n💊 ADMET Profile:")
-    df_dc = pd.DataFrame(deepchem_results)
+    print(f"\n🧬 Kinase-Specific Metrics:")
+    print(f"   Avg aromatic rings: {df_candidates['num_aromatic_rings'].mean():.1f}")
+    print(f"   Avg TPSA: {df_candidates['tpsa'].mean():.1f} A")
+    print(f"   TPSA in ideal range (40-100): {((df_candidates['tpsa'] >= 40) & (df_candidates['tpsa'] <= 100)).sum()}/{len(df_candidates)}")
+    print(f"   Avg kinase score: {df_candidates['kinase_score'].mean():.1f}/11")
+    print(f"   High kinase score (≥8): {(df_candidates['kinase_score'] >= 8).sum()}/{len(df_candidates)}")
+
+    if df_candidates['sa_score'].notna().any():
+        print(f"\n🔬 Synthetic Accessibility:")
+        print(f"   Avg SA score: {df_candidates['sa_score'].mean():.2f} (1=easy, 10=hard)")
+        print(f"   Easy to synthesize (≤3): {(df_candidates['sa_score'] <= 3).sum()}/{len(df_candidates)}")
+
+    if 'solubility_class' in df_candidates and len(df_candidates) > 0:
+        print(f"\n💊 ADMET Profile:")
     
-    if df_dc['solubility_logs'].notna().any():
-        print(f"   Avg solubility (LogS): {df_dc['solubility_logs'].mean():.2f}")
-        print(f"   Soluble compounds: {(df_dc['solubility_class'].isin(['Highly soluble', 'Soluble'])).sum()}/{len(df_candidates)}")
+        if df_candidates['solubility_logs'].notna().any():
+            print(f"   Avg solubility (LogS): {df_candidates['solubility_logs'].mean():.2f}")
+            print(f"   Soluble compounds: {(df_candidates['solubility_class'].isin(['Highly soluble', 'Soluble'])).sum()}/{len(df_candidates)}")
     
-    if df_dc['bbb_permeability'].notna().any():
-        print(f"   BBB permeability (Likely): {(df_dc['bbb_permeability'] == 'Likely').sum()}/{len(df_candidates)}")
+        if df_candidates['bbb_permeability'].notna().any():
+            print(f"   BBB permeability (Likely): {(df_candidates['bbb_permeability'] == 'Likely').sum()}/{len(df_candidates)}")
     
-    if df_dc['cyp3a4_inhibitor'].notna().any():
-        print(f"   CYP3A4 low risk: {(df_dc['cyp3a4_inhibitor'] == 'Low risk').sum()}/{len(df_candidates)}")
+        if df_candidates['cyp3a4_inhibitor'].notna().any():
+            print(f"   CYP3A4 low risk: {(df_candidates['cyp3a4_inhibitor'] == 'Low risk').sum()}/{len(df_candidates)}")
     
-    if df_dc['herg_liability'].notna().any():
-        print(f"   hERG low risk: {(df_dc['herg_liability'] == 'Low risk').sum()}/{len(df_candidates)}")
-
-print(f"\n📋 Top 3 candidates by kinase score:")
-if 'id-num' in df_candidates.columns:
-    top_candidates = df_candidates.nlargest(3, 'kinase_score')
-    for idx, row in top_candidates.iterrows():
-        print(f"\n   ID: {int(row['id-num'])}")
-        print(f"      Kinase score: {row['kinase_score']}, QED: {row['qed_score']:.3f}")
-        print(f"      TPSA: {row['tpsa']:.1f}, Aromatic rings: {row['num_aromatic_rings']}")
+        if df_candidates['herg_liability'].notna().any():
+            print(f"   hERG low risk: {(df_candidates['herg_liability'] == 'Low risk').sum()}/{len(df_candidates)}")
+
+    print(f"\n📋 Top 3 candidates by kinase score:")
+    if 'id-num' in df_candidates.columns:
+        top_candidates = df_candidates.nlargest(3, 'kinase_score')
+        for idx, row in top_candidates.iterrows():
+            print(f"\n   ID: {int(row['id-num'])}")
+            print(f"      Kinase score: {row['kinase_score']}, QED: {row['qed_score']:.3f}")
+            print(f"      TPSA: {row['tpsa']:.1f}, Aromatic rings: {row['num_aromatic_rings']}")
         
-        if DEEPCHEM_AVAILABLE and 'solubility_class' in row:
-            print(f"      Solubility: {row['solubility_class']}, hERG: {row['herg_liability']}")
-else:
-    top_candidates = df_candidates.nlargest(3, 'kinase_score')
-    for idx, row in top_candidates.iterrows():
-        print(f"\n   Index: {idx}")
-        print(f"      Kinase score: {row['kinase_score']}, QED: {row['qed_score']:.3f}")
-        print(f"      TPSA: {row['tpsa']:.1f}, Aromatic rings: {row['num_aromatic_rings']}")
+            if 'solubility_class' in row:
+                print(f"      Solubility: {row['solubility_class']}, hERG: {row['herg_liability']}")
+    else:
+        top_candidates = df_candidates.nlargest(3, 'kinase_score')
+        for idx, row in top_candidates.iterrows():
+            print(f"\n   Index: {idx}")
+            print(f"      Kinase score: {row['kinase_score']}, QED: {row['qed_score']:.3f}")
+            print(f"      TPSA: {row['tpsa']:.1f}, Aromatic rings: {row['num_aromatic_rings']}")
         
-        if DEEPCHEM_AVAILABLE and 'solubility_class' in row:
-            print(f"      Solubility: {row['solubility_class']}, hERG: {row['herg_liability']}")
+            if 'solubility_class' in row:
+                print(f"      Solubility: {row['solubility_class']}, hERG: {row['herg_liability']}")
+
+    print(f"\n{'='*50}")
+
+def compute_descriptors(input_table, output_table, admet=True, cache_path=None, cache_max_entries=1000000,
+                        admet_model_path=None, rules_path=None):
+    """
+    Featurize a (small) ranked list in memory and print the full analysis.
+
+    Args:
+        input_table: Table with a 'smiles' column (.csv, .parquet or .arrow)
+        output_table: Output table (.csv, .parquet or .arrow)
+        admet: Also add the ADMET columns
+        cache_path: Optional SQLite descriptor cache (see featurize_chunk)
+        cache_max_entries: Maximum number of molecules kept in the cache
+        admet_model_path: Optional local ADMET model bundle (see predict_admet)
+        rules_path: Rule file of the scores and classifications (default: property-rules.json)
+    """
+    df_input = read_table(input_table)
+    print(f"📄 Loaded {len(df_input)} molecules from {input_table}\n")
+
+    df_candidates = featurize_chunk(df_input, verbose=True, admet=admet, cache_path=cache_path,
+                                    cache_max_entries=cache_max_entries, admet_model_path=admet_model_path,
+                                    rules_path=rules_path)
+    if cache_path is not None:
+        cache = get_descriptor_cache(cache_path, admet, cache_max_entries)
+        print(f"\n🗄️  Descriptor cache: {cache.hits} molecules reused, {cache.misses} computed ({cache_path})")
+    write_table(df_candidates, output_table)
+
+    print(f"\n✅ Saved {len(df_candidates)} candidates to '{output_table}'")
+    print_property_categories(admet)
+    print_summary(df_candidates)
+    return df_candidates
+
+def reclassify_table(input_table, output_table, admet=True, rules_path=None):
+    """
+    Re-evaluate the scores and classifications of a featurized table.
+
+    No descriptor is recomputed: the rules are applied to the values stored
+    in the table (rounded as written). ADMET labels predicted by a model
+    (with a <column>_probability column) are kept.
+
+    Args:
+        input_table: Table written by this script (e.g. candidates.csv)
+        output_table: Output table (can be the same file)
+        admet: Also re-evaluate the "admet" rules
+        rules_path: Rule file (default: property-rules.json)
+    """
+    df_candidates = read_table(input_table)
+    rule_names = [name for section in get_property_rules(rules_path).values() for name in section]
+    leading = [column for column in df_candidates
+               if column not in PROPERTY_COLUMNS and column not in rule_names and not column.endswith('_probability')]
+    predicted = [column for column in ADMET_ENDPOINTS if f'{column}_probability' in df_candidates]
+    start = time.perf_counter()
+    df_candidates = classify_properties(cast_properties(df_candidates), admet, rules_path, skip=predicted)
+    print(f"🔁 Reclassified {len(df_candidates)} molecules in {time.perf_counter() - start:.3f} s "
+          f"with {rules_path or PROPERTY_RULES}")
+    df_candidates = format_properties(df_candidates, leading)
+    write_table(df_candidates, output_table)
+    print(f"✅ Saved {len(df_candidates)} candidates to '{output_table}'")
+    print_summary(df_candidates)
+    return df_candidates
+
+def save_checkpoint(checkpoint_path, state):
+    """Write the checkpoint atomically, so an interruption never leaves it half written"""
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+
+def load_checkpoint(checkpoint_path, input_table, output_table, chunksize):
+    """Checkpoint of an interrupted run with the same settings, or None"""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as f:
+        state = json.load(f)
+    if (state.get('input'), state.get('output'), state.get('chunksize')) != (str(input_table), str(output_table), chunksize):
+        print(f"⚠️  Ignoring {checkpoint_path}: it belongs to a run with other settings")
+        return None
+    return state
+
+def compute_descriptors_parallel(input_table, output_table, chunksize=1000, workers=None,
+                                 checkpoint_path=None, csv_copy=False, admet=True, cache_path=None,
+                                 cache_max_entries=1000000, admet_model_path=None, rules_path=None,
+                                 metrics_path=None, progress_interval=10.0):
+    """
+    Featurize a large ranked list in chunks over a process pool.
+
+    Chunks are featurized in parallel and written in input order as soon as
+    they are done, so memory stays bounded whatever the size of the list.
+    After each chunk a checkpoint is saved; an interrupted run started again
+    with the same settings resumes after the last written chunk. A CSV
+    output is appended to directly, a columnar output is written as one
+    part file per chunk and assembled at the end.
+
+    Args:
+        input_table: Table with a 'smiles' column (.csv, .parquet or .arrow)
+        output_table: Output table (.csv, .parquet or .arrow)
+        chunksize: Number of molecules per task
+        workers: Number of processes (default: number of CPUs)
+        checkpoint_path: JSON checkpoint (default: <output_table>.checkpoint.json)
+        csv_copy: Also save a .csv copy when the output is columnar
+        admet: Also add the ADMET columns
+        cache_path: Optional SQLite descriptor cache shared by the processes
+        cache_max_entries: Maximum number of molecules kept in the cache
+        admet_model_path: Optional local ADMET model bundle (see predict_admet)
+        rules_path: Rule file of the scores and classifications (default: property-rules.json)
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+
+    Returns:
+        int: Number of molecules written
+    """
+    workers = workers or os.cpu_count() or 1
+    checkpoint_path = checkpoint_path or f"{output_table}.checkpoint.json"
+    columnar = table_format(output_table) != 'csv'
+    parts_dir = f"{output_table}.parts"
+
+    state = load_checkpoint(checkpoint_path, input_table, output_table, chunksize)
+    if state is None:
+        state = {'input': str(input_table), 'output': str(output_table), 'chunksize': chunksize,
+                 'chunks_done': 0, 'rows_done': 0, 'output_bytes': 0}
+        if columnar:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+        elif os.path.exists(output_table):
+            os.remove(output_table)
+    else:
+        print(f"🔁 Resuming after {state['chunks_done']} chunks ({state['rows_done']} molecules)")
+
+    # Drop whatever was written after the last checkpoint
+    if columnar:
+        os.makedirs(parts_dir, exist_ok=True)
+        for name in os.listdir(parts_dir):
+            if int(name.split('-')[1].split('.')[0]) >= state['chunks_done']:
+                os.remove(os.path.join(parts_dir, name))
+    elif os.path.exists(output_table):
+        os.truncate(output_table, state['output_bytes'])
+
+    print(f"⚙️  Featurizing {input_table} in chunks of {chunksize} molecules with {workers} processes")
+    chunks = itertools.islice(iter_table_chunks(input_table, chunksize), state['chunks_done'], None)
+    progress = Progress("additional-descriptor", total=table_rows(input_table) - state['rows_done'],
+                        metrics_path=metrics_path, interval=progress_interval, unit="molecules")
+
+    def write_chunk(df_done):
+        if columnar:
+            part_path = os.path.join(parts_dir, f"part-{state['chunks_done']:06d}{Path(output_table).suffix}")
+            write_table(df_done, part_path)
+        else:
+            df_done.to_csv(output_table, mode='a', header=state['chunks_done'] == 0, index=False)
+            state['output_bytes'] = os.path.getsize(output_table)
+
+        state['chunks_done'] += 1
+        state['rows_done'] += len(df_done)
+        save_checkpoint(checkpoint_path, state)
+        progress.update(len(df_done), chunks=1)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # A few chunks per process in flight: enough to keep every core busy,
+        # few enough to bound the memory. Results are written in input order.
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(featurize_chunk, chunk, False, admet, cache_path, cache_max_entries,
+                                           admet_model_path, rules_path))
+            if len(pending) >= 2 * workers:
+                write_chunk(pending.popleft().result())
+        while pending:
+            write_chunk(pending.popleft().result())
+    progress.close()
+
+    # Assemble the part files into the final table
+    if columnar:
+        part_paths = [os.path.join(parts_dir, name) for name in sorted(os.listdir(parts_dir))]
+        # A chunk of invalid SMILES has all-missing columns: take the types of the other parts
+        with TableWriter(output_table, csv_copy=csv_copy, schema=unified_schema(part_paths)) as writer:
+            for part_path in part_paths:
+                writer.write(read_table(part_path))
+        shutil.rmtree(parts_dir)
 
-print(f"\n{'='*50}")
+    os.remove(checkpoint_path)
+    print(f"\n✅ Saved {state['rows_done']} candidates to '{output_table}'")
+    print_property_categories(admet)
+    return state['rows_done']
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    # Ranked list to featurize: list-best10.csv, or list-sorted.csv for the whole library
+    INPUT_TABLE = 'list-best10.csv'
+
+    # Output table (.csv, .parquet or .arrow)
+    OUTPUT_TABLE = 'candidates.csv'
+
+    # Featurize in chunks over a process pool (resumes from a checkpoint if interrupted)
+    PARALLEL = False
+    WORKERS = None  # None = all the CPUs
+    CHUNK_SIZE = 1000
+    METRICS_FILE = 'additional-descriptor-metrics.json'  # Live progress of the parallel run
+
+    # Add the ADMET columns (solubility, BBB, CYP3A4, hERG, clearance)
+    ADMET_PROPERTIES = True
+
+    # Descriptors already computed in earlier runs are reused (None = no cache)
+    DESCRIPTOR_CACHE = 'descriptor-cache.sqlite'
+    CACHE_MAX_ENTRIES = 1000000
+
+    # Local ADMET model bundle (pickle) replacing the heuristic ADMET rules, or None
+    ADMET_MODEL = None
+
+    # Thresholds, weights and labels of the scores and classifications
+    PROPERTY_RULES_FILE = 'property-rules.json'
+
+    # Only re-evaluate the rules on an existing OUTPUT_TABLE (no descriptor is recomputed)
+    RECLASSIFY_ONLY = False
+
+    # ===================================================================
+
+    # python additional-descriptor.py --profile: timing breakdown in profiles/ (see workflow/profiling.py)
+    with profiled('additional-descriptor', profile_dir_from_argv()):
+        if RECLASSIFY_ONLY:
+            reclassify_table(OUTPUT_TABLE, OUTPUT_TABLE, admet=ADMET_PROPERTIES, rules_path=PROPERTY_RULES_FILE)
+        elif PARALLEL:
+            compute_descriptors_parallel(INPUT_TABLE, OUTPUT_TABLE, chunksize=CHUNK_SIZE, workers=WORKERS,
+                                         admet=ADMET_PROPERTIES, cache_path=DESCRIPTOR_CACHE,
+                                         cache_max_entries=CACHE_MAX_ENTRIES, admet_model_path=ADMET_MODEL,
+                                         rules_path=PROPERTY_RULES_FILE, metrics_path=METRICS_FILE)
+        else:
+            compute_descriptors(INPUT_TABLE, OUTPUT_TABLE, admet=ADMET_PROPERTIES, cache_path=DESCRIPTOR_CACHE,
+                                cache_max_entries=CACHE_MAX_ENTRIES, admet_model_path=ADMET_MODEL,
+                                rules_path=PROPERTY_RULES_FILE)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Synthetic ligand libraries for the workflow benchmarks.
+
+The SMILES are enumerated from kinase-like templates (a bicyclic core with
+an aniline and an amine side chain, like the CDK2 hits of list.csv), so
+every molecule is valid and drug-sized, and any number of them can be made
+without network access. The other helpers write, directly and in the same
+formats, the files a workflow step would have produced (prepared ligands,
+Vina scores, Boltz results, merged tables), so each step can be benchmarked
+at a size its upstream step is too slow to reach with the stand-ins.
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.tables import write_table
+
+# Bicyclic cores: {amine} and {aryl} are replaced by the side chains
+CORES = [
+    "{amine}c1nc(N{aryl})c2cnn(C)c2n1",
+    "{amine}c1nc(N{aryl})c2ccccc2n1",
+    "{amine}c1nc(N{aryl})c2nccnc2n1",
+    "{amine}c1nc(N{aryl})c2[nH]cnc2n1",
+    "{amine}c1nc(N{aryl})c2cc[nH]c2n1",
+    "{amine}c1nc(N{aryl})c2sccc2n1",
+    "{amine}c1nc(N{aryl})c2ccncc2n1",
+    "{amine}c1nc(N{aryl})c2cn[nH]c2n1",
+    "{amine}c1nc(N{aryl})c2occc2n1",
+    "{amine}c1nc(N{aryl})c2ncccc2n1",
+    "{amine}c1ncc(F)c(N{aryl})n1",
+    "{amine}c1ncc(Cl)c(N{aryl})n1",
+    "{amine}c1ncc(C)c(N{aryl})n1",
+    "{amine}c1ncc(C#N)c(N{aryl})n1",
+    "{amine}c1ncc(C(F)(F)F)c(N{aryl})n1",
+]
+
+# Amine side chains (bonded to the core by their last atom)
+AMINES = [
+    "CN", "CCN", "CCCN", "CCCCN", "CC(C)CN", "CC(C)CCN", "COCCN", "COCCCN", "OCCN", "OCCCN",
+    "CN(C)CCN", "CN(C)CCCN", "C1CCC(CN)CC1", "C1CCOC1CN", "C1CCOCC1CN", "c1ccccc1CN",
+    "c1ccncc1CN", "C1CC1N", "C1CCC1N", "C1CCCC1N", "C1CCCCC1N", "N#CCCN", "CC(O)CN",
+    "CSCCN", "FCCN", "FC(F)CN", "CC(C)(C)N", "CC(C)N", "CCC(C)N", "C1COCCN1", "C1CCNCC1",
+    "C1CN(C)CCN1", "OC1CCN(CC1)", "CC(=O)NCCN", "NC(=O)CN", "CS(=O)(=O)CCN", "C1CC1CN",
+    "C1CCN(C1)CCN", "c1ccoc1CN", "c1ccsc1CN",
+]
+
+# Substituents of the aniline (ortho, meta, para positions)
+SUBSTITUENTS = ["", "F", "Cl", "Br", "C", "OC", "C(F)(F)F", "C#N", "O", "N(C)C", "C(N)=O", "S(C)(=O)=O"]
+
+def aryl_smiles(ortho, meta, para):
+    """Aniline ring (ring label 9, free of the labels used by the cores)"""
+    branch = lambda substituent: f"({substituent})" if substituent else ""
+    return f"c9c{branch(ortho)}c{branch(meta)}c{branch(para)}cc9"
+
+def library_size_limit():
+    """Number of distinct SMILES the templates can make"""
+    return len(CORES) * len(AMINES) * len(SUBSTITUENTS) ** 3
+
+def generate_smiles(n_ligands, seed=0):
+    """
+    Enumerate n_ligands distinct SMILES.
+
+    The template combinations are drawn without replacement in a random (but
+    seeded) order, so the first molecules of a large library already cover
+    all the cores and side chains.
+    """
+    n_subst = len(SUBSTITUENTS)
+    combinations = library_size_limit()
+    if n_ligands > combinations:
+        raise ValueError(f"The templates make at most {combinations} molecules")
+
+    order = np.random.default_rng(seed).permutation(combinations)[:n_ligands]
+    core, rest = np.divmod(order, len(AMINES) * n_subst ** 3)
+    amine, rest = np.divmod(rest, n_subst ** 3)
+    ortho, rest = np.divmod(rest, n_subst ** 2)
+    meta, para = np.divmod(rest, n_subst)
+
+    aryls = [aryl_smiles(o, m, p) for o in SUBSTITUENTS for m in SUBSTITUENTS for p in SUBSTITUENTS]
+    aryl_index = (ortho * n_subst + meta) * n_subst + para
+    return [CORES[c].format(amine=AMINES[a], aryl=aryls[r])
+            for c, a, r in zip(core.tolist(), amine.tolist(), aryl_index.tolist())]
+
+def make_library(n_ligands, seed=0):
+    """Ligand table with the columns of list.csv (smiles, id-num, then the database columns)"""
+    smiles = generate_smiles(n_ligands, seed)
+    similarity = np.random.default_rng(seed + 1).uniform(0.6, 1.0, n_ligands).round(5)
+    return pd.DataFrame({
+        "smiles": smiles,
+        "id-num": np.arange(n_ligands),
+        "id": [f"SYNTH-{i}" for i in range(n_ligands)],
+        "database": "SYNTHETIC",
+        "db_id": np.arange(n_ligands),
+        "similarity": similarity
+    })
+
+def synthetic_values(ids, low, high, salt):
+    """Deterministic pseudo-random values of the given ligand ids"""
+    ids = np.asarray(ids, dtype=np.uint64)
+    mixed = (ids + np.uint64(salt)) * np.uint64(0x9E3779B97F4A7C15)
+    mixed ^= mixed >> np.uint64(31)
+    return low + (high - low) * (mixed % np.uint64(1 << 24)).astype(float) / (1 << 24)
+
+def add_vina_affinities(df):
+    """Same table with a vina_affinity column (what ranking.py adds)"""
+    df = df.copy()
+    df["vina_affinity"] = synthetic_values(df["id-num"], -11.0, -5.0, 1).round(3)
+    return df
+
+def add_boltz_affinities(df):
+    """Same table with the three Boltz columns (what boltz-predictions.py adds)"""
+    df = df.copy()
+    pred_value = synthetic_values(df["id-num"], -1.5, 1.5, 2)
+    df["boltz_affinity_kcalmol"] = (6 - pred_value) * 1.364
+    df["avg_affinity_pred_value"] = pred_value
+    df["avg_affinity_probability_binary"] = 1 / (1 + np.exp(2 * pred_value))
+    return df
+
+def write_prepared_ligands(ligands_dir, df):
+    """<id>-prepared.pdbqt files like the mk_prepare_ligand.py stand-in writes them"""
+    os.makedirs(ligands_dir, exist_ok=True)
+    for smiles, id_num in zip(df["smiles"], df["id-num"]):
+        with open(os.path.join(ligands_dir, f"{id_num}-prepared.pdbqt"), 'w') as f:
+            f.write(f"REMARK SMILES {smiles}\nROOT\nENDROOT\nTORSDOF 0\n")
+
+def write_vina_scores(poses_dir, df):
+    """<id>-vina-score.txt files in the format of the Vina score table"""
+    os.makedirs(poses_dir, exist_ok=True)
+    affinities = add_vina_affinities(df)["vina_affinity"]
+    for id_num, affinity in zip(df["id-num"], affinities):
+        with open(os.path.join(poses_dir, f"{id_num}-vina-score.txt"), 'w') as f:
+            f.write("mode |   affinity | dist from best mode\n"
+                    "     | (kcal/mol) | rmsd l.b.| rmsd u.b.\n"
+                    "-----+------------+----------+----------\n"
+                    f"   1  {affinity:>11.3f}          0          0\n")
+
+def write_boltz_results(results_dir, df):
+    """boltz_results_<id>/predictions/<id>/affinity_<id>.json files like Boltz writes them"""
+    pred_values = add_boltz_affinities(df)["avg_affinity_pred_value"]
+    for id_num, value in zip(df["id-num"], pred_values):
+        predictions_dir = Path(results_dir) / f"boltz_results_{id_num}" / "predictions" / str(id_num)
+        predictions_dir.mkdir(parents=True, exist_ok=True)
+        affinity = {}
+        for suffix in ["", "1", "2"]:
+            affinity[f"affinity_pred_value{suffix}"] = value
+            affinity[f"affinity_probability_binary{suffix}"] = 1 / (1 + np.exp(2 * value))
+        with open(predictions_dir / f"affinity_{id_num}.json", 'w') as f:
+            json.dump(affinity, f, indent=4)
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    # Number of ligands and output table (.csv, .parquet or .arrow)
+    N_LIGANDS = 1000
+    OUTPUT_TABLE = 'synthetic-list.csv'
+
+    # Seed of the enumeration order
+    SEED = 0
+
+    # ===================================================================
+
+    write_table(make_library(N_LIGANDS, SEED), OUTPUT_TABLE)
+    print(f"✅ Saved {N_LIGANDS} synthetic ligands to {OUTPUT_TABLE}")
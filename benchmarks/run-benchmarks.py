@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the workflow scripts.
+
+Every step (ligands-preparation.py, vina-batch.py, ranking.py,
+boltz-processing.py, boltz-predictions.py, sorting.py and
+additional-descriptor.py) is run on synthetic libraries of increasing size,
+with stand-ins of scrub.py, mk_prepare_ligand.py, vina and boltz (see
+stand-ins/), so the numbers measure the workflow itself and everything runs
+offline on a CPU. Each step runs in its own process, in a copy of the
+folder layout of the repository, and its throughput (ligands/s) and peak
+memory are compared with the baselines stored in baselines.json.
+
+A step is skipped at the sizes above its limit (STAGE_LIMITS): the steps
+that start one external program per ligand spend most of their time in
+process start-up, which is the same at every size. When the step before it
+did not run, the inputs of a step are written directly by
+generate-library.py.
+"""
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Shared helpers of the workflow live in the repository root
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+from workflow.scripts import load_script
+from workflow.tables import write_table
+
+library = load_script("benchmarks/generate-library.py")
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+STAND_INS_DIR = BENCHMARKS_DIR / "stand-ins"
+
+# Steps in workflow order: (script, function, arguments, working folder in the copy of the layout)
+STAGES = {
+    "ligands-preparation": ("Autodock-Vina/ligands/ligands-preparation.py", "process_smiles_file",
+                            {"target_folder": ".", "target_file": "list.csv"}, "Autodock-Vina/ligands"),
+    "vina-batch": ("Autodock-Vina/vina-batch.py", "run_vina_docking",
+                   {"ligands_dir": "ligands", "receptor_dir": "receptor", "receptor_name": "1H1Q-prepared.pdbqt",
+                    "config_file": "1H1Q-prepared.box.txt", "exhaustiveness": 8, "num_modes": 9,
+                    "poses_dir": "poses"}, "Autodock-Vina"),
+    "ranking": ("Autodock-Vina/poses/ranking.py", "process_vina_scores",
+                {"poses_dir": "poses", "ligands_csv": "ligands/list.csv",
+                 "output_csv": "poses/list_with_affinities.csv"}, "Autodock-Vina"),
+    "boltz-processing": ("boltz/boltz-processing.py", "process_ligands",
+                         {"csv_path": "../Autodock-Vina/ligands/list.csv", "output_dir": "boltz-configurations-files",
+                          "results_dir": "boltz-results", "use_msa_server": False}, "boltz"),
+    "boltz-predictions": ("boltz/boltz-predictions.py", "analyze_boltz_results",
+                          {"results_dir": "boltz-results", "csv_path": "../Autodock-Vina/poses/list_with_affinities.csv",
+                           "output_path": "list_with_affinities_boltz.csv"}, "boltz"),
+    "sorting": ("sorting.py", "sort_candidates",
+                {"input_csv": "boltz/list_with_affinities_boltz.csv", "sorted_csv": "list-sorted.csv",
+                 "best_csv": "list-best10.csv"}, "."),
+    "additional-descriptor": ("additional-descriptor.py", "compute_descriptors_parallel",
+                              {"input_table": "list-sorted.csv", "output_table": "candidates.csv"}, "."),
+}
+
+def write_stage_inputs(stage, work_dir, df_library, ran):
+    """
+    Write the inputs of a step whose upstream step did not run at this size.
+
+    Args:
+        stage: Name of the step
+        work_dir: Copy of the folder layout
+        df_library: Synthetic ligand list
+        ran: Names of the steps that already ran successfully at this size
+    """
+    vina_dir = work_dir / "Autodock-Vina"
+    boltz_dir = work_dir / "boltz"
+    with_affinities = lambda: library.add_boltz_affinities(library.add_vina_affinities(df_library))
+
+    if stage == "vina-batch" and "ligands-preparation" not in ran:
+        library.write_prepared_ligands(vina_dir / "ligands", df_library)
+    elif stage == "ranking" and "vina-batch" not in ran:
+        library.write_vina_scores(vina_dir / "poses", df_library)
+    elif stage == "boltz-predictions":
+        if "boltz-processing" not in ran:
+            library.write_boltz_results(boltz_dir / "boltz-results", df_library)
+        if "ranking" not in ran:
+            write_table(library.add_vina_affinities(df_library), vina_dir / "poses" / "list_with_affinities.csv")
+    elif stage == "sorting" and "boltz-predictions" not in ran:
+        write_table(with_affinities(), boltz_dir / "list_with_affinities_boltz.csv")
+    elif stage == "additional-descriptor" and "sorting" not in ran:
+        write_table(with_affinities(), work_dir / "list-sorted.csv")
+
+def prepare_work_dir(work_dir, n_ligands, seed=0):
+    """Fresh copy of the folder layout with a synthetic list.csv and a placeholder receptor"""
+    if work_dir.exists():
+        shutil.rmtree(work_dir)
+    for folder in ["Autodock-Vina/ligands", "Autodock-Vina/receptor", "Autodock-Vina/poses", "boltz"]:
+        (work_dir / folder).mkdir(parents=True)
+
+    df_library = library.make_library(n_ligands, seed)
+    write_table(df_library, work_dir / "Autodock-Vina" / "ligands" / "list.csv")
+
+    receptor_dir = work_dir / "Autodock-Vina" / "receptor"
+    (receptor_dir / "1H1Q-prepared.pdbqt").touch()
+    shutil.copy(REPO_ROOT / "Autodock-Vina" / "receptor" / "1H1Q-prepared.box.txt", receptor_dir)
+    return df_library
+
+def measure_call(script, function, kwargs, result_path):
+    """
+    Run one function of a workflow script and save its wall time and peak memory.
+
+    Called in a fresh process by run_stage, so the peak memory is the one of this step only.
+    """
+    module = load_script(script)
+    start = time.perf_counter()
+    getattr(module, function)(**kwargs)
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS; the
+    # children are the worker processes of the step (not their sum)
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    with open(result_path, 'w') as f:
+        json.dump({"seconds": seconds, "peak_memory_mb": peak / unit}, f)
+
+def run_stage(stage, work_dir, latencies):
+    """
+    Run one step in a child process (stand-ins first in the PATH).
+
+    Returns:
+        dict: seconds and peak_memory_mb, or None if the step failed (see its log)
+    """
+    script, function, kwargs, cwd = STAGES[stage]
+    log_path = work_dir / "logs" / f"{stage}.log"
+    result_path = work_dir / "logs" / f"{stage}.json"
+    log_path.parent.mkdir(exist_ok=True)
+
+    code = (f"import sys; sys.path.insert(0, {str(REPO_ROOT)!r}); "
+            f"from workflow.scripts import load_script; "
+            f"load_script('benchmarks/run-benchmarks.py').measure_call("
+            f"{script!r}, {function!r}, {kwargs!r}, {str(result_path)!r})")
+    env = dict(os.environ, PATH=f"{STAND_INS_DIR}{os.pathsep}{os.environ.get('PATH', '')}")
+    env.update({name: str(value) for name, value in latencies.items()})
+
+    with open(log_path, 'w') as log:
+        result = subprocess.run([sys.executable, "-c", code], cwd=work_dir / cwd, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+    if result.returncode != 0 or not result_path.exists():
+        return None
+    with open(result_path, 'r') as f:
+        return json.load(f)
+
+def load_baselines(path):
+    if not Path(path).exists():
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f).get("stages", {})
+
+def save_baselines(path, df_results):
+    """Store the measured numbers as the new baselines (other stages and sizes are kept)"""
+    baselines = load_baselines(path)
+    for row in df_results[df_results["seconds"].notna()].itertuples(index=False):
+        baselines.setdefault(row.stage, {})[str(row.ligands)] = {
+            "ligands_per_s": round(row.ligands_per_s, 2),
+            "peak_memory_mb": round(row.peak_memory_mb, 1)
+        }
+    with open(path, 'w') as f:
+        json.dump({"python": sys.version.split()[0], "stages": baselines}, f, indent=2)
+        f.write("\n")
+
+def compare_with_baseline(row, baseline, tolerance, memory_slack_mb, min_seconds):
+    """Status of one measurement: ok, slower, more memory, no baseline"""
+    if baseline is None:
+        return "no baseline"
+    status = []
+    # The throughput of very short runs is mostly timer noise
+    if row["seconds"] >= min_seconds and row["ligands_per_s"] < baseline["ligands_per_s"] * (1 - tolerance):
+        status.append("slower")
+    if row["peak_memory_mb"] > baseline["peak_memory_mb"] * (1 + tolerance) + memory_slack_mb:
+        status.append("more memory")
+    return ", ".join(status) or "ok"
+
+def run_benchmarks(sizes, stage_limits, runs_dir, baselines_path, latencies, tolerance=0.25,
+                   memory_slack_mb=20, min_seconds=0.5, stages=None, seed=0):
+    """
+    Run every step at every library size and compare with the baselines.
+
+    Args:
+        sizes: Numbers of ligands of the synthetic libraries
+        stage_limits: {step: largest size it runs at} (missing = no limit)
+        runs_dir: Folder of the working copies, logs and results table
+        baselines_path: JSON file of the baselines
+        latencies: Environment variables of the stand-ins (e.g. STANDIN_VINA_LATENCY)
+        tolerance: Relative loss of throughput (or gain of memory) reported as a regression
+        memory_slack_mb: Memory increase always accepted (interpreter noise on small runs)
+        min_seconds: Runs shorter than this are only checked for memory
+        stages: Names of the steps to run (default: all)
+        seed: Seed of the synthetic libraries
+
+    Returns:
+        DataFrame: One row per step and size
+    """
+    baselines = load_baselines(baselines_path)
+    stages = stages or list(STAGES)
+    rows = []
+
+    for n_ligands in sizes:
+        print(f"\n{'='*70}\n📦 {n_ligands} ligands\n{'='*70}")
+        work_dir = Path(runs_dir) / str(n_ligands)
+        df_library = prepare_work_dir(work_dir, n_ligands, seed)
+        ran = set()
+
+        for stage in stages:
+            row = {"stage": stage, "ligands": n_ligands, "seconds": None, "ligands_per_s": None,
+                   "peak_memory_mb": None}
+            if n_ligands > stage_limits.get(stage, n_ligands):
+                row["status"] = "skipped"
+                print(f"  ⏭️  {stage:<22} skipped (limit {stage_limits[stage]})")
+                rows.append(row)
+                continue
+
+            write_stage_inputs(stage, work_dir, df_library, ran)
+            measured = run_stage(stage, work_dir, latencies)
+            if measured is None:
+                row["status"] = "error"
+                print(f"  ❌ {stage:<22} failed, see {work_dir / 'logs' / (stage + '.log')}")
+                rows.append(row)
+                continue
+
+            ran.add(stage)
+            row.update(measured)
+            row["ligands_per_s"] = n_ligands / measured["seconds"]
+            baseline = baselines.get(stage, {}).get(str(n_ligands))
+            row["baseline_ligands_per_s"] = baseline["ligands_per_s"] if baseline else None
+            row["baseline_peak_memory_mb"] = baseline["peak_memory_mb"] if baseline else None
+            row["status"] = compare_with_baseline(row, baseline, tolerance, memory_slack_mb, min_seconds)
+            print(f"  {'✅' if row['status'] in ('ok', 'no baseline') else '⚠️ '} {stage:<22} "
+                  f"{row['seconds']:>9.2f} s {row['ligands_per_s']:>11.1f} ligands/s "
+                  f"{row['peak_memory_mb']:>8.1f} MB  {row['status']}")
+            rows.append(row)
+
+    df_results = pd.DataFrame(rows)
+    write_table(df_results, Path(runs_dir) / "benchmark-results.csv")
+    return df_results
+
+def print_report(df_results, runs_dir):
+    print(f"\n{'='*70}\nBENCHMARK SUMMARY\n{'='*70}")
+    columns = ["stage", "ligands", "seconds", "ligands_per_s", "baseline_ligands_per_s", "peak_memory_mb",
+               "baseline_peak_memory_mb", "status"]
+    print(df_results.reindex(columns=columns).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+    regressions = df_results[df_results["status"].str.contains("slower|memory|error")]
+    print(f"\n📄 Results saved to {Path(runs_dir) / 'benchmark-results.csv'}")
+    if len(regressions):
+        print(f"⚠️  {len(regressions)} regression(s) or error(s) against the baselines")
+    else:
+        print("✅ No regression against the baselines")
+    return len(regressions) == 0
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your benchmark settings here
+    # ===================================================================
+
+    # Library sizes (number of ligands)
+    SIZES = [1000, 100000, 1000000]
+
+    # Largest size of each step: the steps starting one stand-in per ligand
+    # are limited to 1000 ligands, the ones reading one file per ligand to 100k
+    STAGE_LIMITS = {
+        "ligands-preparation": 1000,
+        "vina-batch": 1000,
+        "ranking": 100000,
+        "boltz-processing": 1000,
+        "boltz-predictions": 100000,
+        "sorting": 1000000,
+        "additional-descriptor": 100000
+    }
+
+    # Latency of the stand-ins in seconds (0 = measure the overhead of the workflow only)
+    LATENCIES = {
+        "STANDIN_SCRUB_LATENCY": 0,
+        "STANDIN_MK_PREPARE_LATENCY": 0,
+        "STANDIN_VINA_LATENCY": 0,
+        "STANDIN_VINA_GRID_LATENCY": 0,
+        "STANDIN_BOLTZ_LATENCY": 0
+    }
+
+    # Working copies, logs and benchmark-results.csv
+    RUNS_DIR = BENCHMARKS_DIR / "runs"
+
+    # Baselines and regression thresholds
+    BASELINES = BENCHMARKS_DIR / "baselines.json"
+    TOLERANCE = 0.25
+    MEMORY_SLACK_MB = 20
+    MIN_SECONDS = 0.5
+
+    # Save the measured numbers as the new baselines
+    UPDATE_BASELINES = False
+
+    # ===================================================================
+
+    df_results = run_benchmarks(SIZES, STAGE_LIMITS, RUNS_DIR, BASELINES, LATENCIES, TOLERANCE, MEMORY_SLACK_MB,
+                                MIN_SECONDS)
+    passed = print_report(df_results, RUNS_DIR)
+    if UPDATE_BASELINES:
+        save_baselines(BASELINES, df_results)
+        print(f"💾 Baselines updated in {BASELINES}")
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Stand-in for `mk_prepare_ligand.py` (Meeko) used to benchmark the workflow offline.
+
+Only `mk_prepare_ligand.py -i <in.sdf> -o <out.pdbqt>` is supported. The
+PDBQT keeps the SMILES in a REMARK line, like Meeko does, and has no atoms.
+
+Environment variables:
+    STANDIN_MK_PREPARE_LATENCY: Seconds of sleep per molecule (default 0)
+    STANDIN_MK_PREPARE_FAIL_IDS: Comma separated ligand ids that exit with an error
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+def smiles_from_sdf(sdf_path):
+    """SMILES property written by the scrub.py stand-in"""
+    with open(sdf_path, 'r') as f:
+        lines = f.read().splitlines()
+    for i, line in enumerate(lines[:-1]):
+        if line.startswith(">") and "<SMILES>" in line:
+            return lines[i + 1].strip()
+    return ""
+
+def main():
+    parser = argparse.ArgumentParser(prog="mk_prepare_ligand.py")
+    parser.add_argument("-i", "--mol", required=True)
+    parser.add_argument("-o", "--out", required=True)
+    args, _ = parser.parse_known_args()
+
+    ligand_id = Path(args.out).name.split("-")[0]
+    if ligand_id in os.environ.get("STANDIN_MK_PREPARE_FAIL_IDS", "").split(","):
+        print(f"stand-in mk_prepare_ligand.py: simulated failure for {ligand_id}", file=sys.stderr)
+        return 1
+
+    time.sleep(float(os.environ.get("STANDIN_MK_PREPARE_LATENCY", "0")))
+
+    with open(args.out, 'w') as f:
+        f.write(f"REMARK SMILES {smiles_from_sdf(args.mol)}\nROOT\nENDROOT\nTORSDOF 0\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Stand-in for `scrub.py` (molscrub) used to benchmark the workflow offline.
+
+Only `scrub.py <smiles> -o <out.sdf>` is supported. The SDF holds one record
+without coordinates and the SMILES as a property, which is all the stand-in
+of mk_prepare_ligand.py needs.
+
+Environment variables:
+    STANDIN_SCRUB_LATENCY: Seconds of sleep per molecule (default 0)
+    STANDIN_SCRUB_FAIL_IDS: Comma separated ligand ids that exit with an error
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+def main():
+    parser = argparse.ArgumentParser(prog="scrub.py")
+    parser.add_argument("smiles")
+    parser.add_argument("-o", "--out", required=True)
+    args, _ = parser.parse_known_args()
+
+    # Output files are named <id>-prepared.sdf by ligands-preparation.py
+    ligand_id = Path(args.out).name.split("-")[0]
+    if ligand_id in os.environ.get("STANDIN_SCRUB_FAIL_IDS", "").split(","):
+        print(f"stand-in scrub.py: simulated failure for {ligand_id}", file=sys.stderr)
+        return 1
+
+    time.sleep(float(os.environ.get("STANDIN_SCRUB_LATENCY", "0")))
+
+    with open(args.out, 'w') as f:
+        f.write(f"_i0\n     stand-in       3D\n\n"
+                f"  0  0  0  0  0  0  0  0  0  0999 V2000\nM  END\n"
+                f">  <SMILES>\n{args.smiles}\n\n$$$$\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Boltz sampling-parameter benchmark.
+
+Runs a reference subset of ligands over a grid of Boltz sampling parameters,
+records wall time and peak memory per ligand, and measures how well the
+ranking of boltz_affinity_kcalmol agrees with the highest-fidelity setting.
+The cheapest setting within the requested tolerance is recommended.
+"""
+
+import itertools
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.scripts import load_script
+
+boltz_processing = load_script("boltz/boltz-processing.py")
+boltz_predictions = load_script("boltz/boltz-predictions.py")
+
+def setting_tag(setting):
+    """Short folder-friendly name of a sampling setting"""
+    return (f"r{setting['recycling_steps']}-s{setting['sampling_steps']}"
+            f"-d{setting['diffusion_samples']}-x{setting['step_scale']}")
+
+def setting_cost(setting):
+    """Nominal sampling cost, used to pick the highest-fidelity setting"""
+    return (1 + setting["recycling_steps"]) * setting["sampling_steps"] * setting["diffusion_samples"]
+
+def select_reference_ligands(csv_path, reference_size):
+    """
+    Pick an evenly spaced subset of the ligand list.
+
+    Args:
+        csv_path: Path to the ligand CSV (smiles, id-num)
+        reference_size: Number of ligands to keep
+    """
+    df = pd.read_csv(csv_path, usecols=["smiles", "id-num"])
+    if reference_size >= len(df):
+        return df
+    positions = np.linspace(0, len(df) - 1, reference_size).round().astype(int)
+    return df.iloc[np.unique(positions)].reset_index(drop=True)
+
+def run_and_measure(cmd, log_path):
+    """
+    Run one command and measure its wall time and peak resident memory.
+
+    Returns:
+        tuple: (return_code, wall_time_s, max_rss_mb)
+    """
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    max_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return process.returncode, wall_time, max_rss_mb
+
+def spearman(a, b):
+    """Spearman rank correlation of two aligned Series (NaN pairs dropped)"""
+    mask = a.notna() & b.notna()
+    if mask.sum() < 2:
+        return np.nan
+    return a[mask].rank().corr(b[mask].rank())
+
+def top_k_agreement(a, b, k):
+    """Fraction of the top-k ligands of `b` that are also in the top-k of `a`"""
+    k = min(k, a.notna().sum(), b.notna().sum())
+    if k == 0:
+        return np.nan
+    # Higher boltz_affinity_kcalmol means better binding
+    top_a = set(a.nlargest(k).index)
+    top_b = set(b.nlargest(k).index)
+    return len(top_a & top_b) / k
+
+def benchmark_sampling_parameters(csv_path, benchmark_dir, parameter_grid, reference_size=20,
+                                  reference_setting=None, top_k=5, min_spearman=0.9,
+                                  min_top_k_agreement=0.8, boltz_executable="boltz",
+                                  use_msa_server=True):
+    """
+    Run the reference ligands over every combination of the parameter grid.
+
+    Args:
+        csv_path: Path to the ligand CSV (smiles, id-num)
+        benchmark_dir: Directory for YAML files, Boltz outputs and benchmark tables
+        parameter_grid: Dict mapping each sampling parameter to the values to try
+        reference_size: Number of ligands in the reference subset
+        reference_setting: Setting used as ground truth (default: most expensive in the grid)
+        top_k: Size of the top-K set compared against the reference
+        min_spearman: Minimum Spearman correlation accepted for a recommendation
+        min_top_k_agreement: Minimum top-K overlap accepted for a recommendation
+        boltz_executable: Name or path of the boltz executable (or a stand-in)
+        use_msa_server: Whether to request MSAs from the remote server
+
+    Returns:
+        tuple: (per-ligand runs DataFrame, per-setting summary DataFrame, recommended setting or None)
+    """
+    benchmark_path = Path(benchmark_dir)
+    yaml_dir = benchmark_path / "configurations"
+    yaml_dir.mkdir(parents=True, exist_ok=True)
+
+    ligands = select_reference_ligands(csv_path, reference_size)
+    print(f"📄 Reference subset: {len(ligands)} ligands from {csv_path}")
+
+    # YAML files do not depend on the sampling parameters, write them once
+    for row in ligands.itertuples(index=False):
+        with open(yaml_dir / f"{row[1]}.yaml", 'w') as yaml_file:
+            yaml_file.write(boltz_processing.create_yaml_content(row[0]))
+
+    names = list(parameter_grid)
+    settings = [dict(zip(names, values)) for values in itertools.product(*parameter_grid.values())]
+    if reference_setting is None:
+        reference_setting = max(settings, key=setting_cost)
+    elif reference_setting not in settings:
+        settings.append(reference_setting)
+    print(f"🎯 Reference setting: {setting_tag(reference_setting)}")
+    print(f"🔁 Benchmarking {len(settings)} settings x {len(ligands)} ligands\n")
+
+    runs = []
+    for setting in settings:
+        tag = setting_tag(setting)
+        results_dir = benchmark_path / tag
+        results_dir.mkdir(exist_ok=True)
+        print(f"▶ Setting {tag}")
+
+        for id_num in ligands["id-num"]:
+            yaml_path = yaml_dir / f"{id_num}.yaml"
+            cmd = boltz_processing.build_boltz_command(yaml_path, results_dir, setting,
+                                                       boltz_executable, use_msa_server)
+            try:
+                return_code, wall_time, max_rss_mb = run_and_measure(cmd, results_dir / f"{id_num}.log")
+            except FileNotFoundError:
+                print(f"❌ Error: '{boltz_executable}' command not found")
+                return None, None, None
+
+            affinity = np.nan
+            json_path = results_dir / f"boltz_results_{id_num}" / "predictions" / str(id_num) / f"affinity_{id_num}.json"
+            if return_code == 0 and json_path.exists():
+                affinity = boltz_predictions.read_affinity_json(json_path)[0]
+            else:
+                print(f"   ⚠️  Ligand {id_num} failed (return code {return_code})")
+
+            runs.append({**setting, "setting": tag, "id-num": id_num, "return_code": return_code,
+                         "wall_time_s": wall_time, "max_rss_mb": max_rss_mb,
+                         "boltz_affinity_kcalmol": affinity})
+
+        done = [r for r in runs if r["setting"] == tag]
+        print(f"   {np.mean([r['wall_time_s'] for r in done]):.2f} s/ligand, "
+              f"peak {max(r['max_rss_mb'] for r in done):.0f} MB")
+
+    df_runs = pd.DataFrame(runs)
+    df_runs.to_csv(benchmark_path / "benchmark-runs.csv", index=False)
+
+    # ------------------------------------------------------------
+    # Ranking fidelity against the reference setting
+    # ------------------------------------------------------------
+    affinities = df_runs.pivot(index="id-num", columns="setting", values="boltz_affinity_kcalmol")
+    reference = affinities[setting_tag(reference_setting)]
+
+    summary = []
+    for setting in settings:
+        tag = setting_tag(setting)
+        done = df_runs[df_runs["setting"] == tag]
+        summary.append({
+            **setting,
+            "setting": tag,
+            "succeeded": int((done["return_code"] == 0).sum()),
+            "mean_wall_time_s": done["wall_time_s"].mean(),
+            "total_wall_time_s": done["wall_time_s"].sum(),
+            "max_rss_mb": done["max_rss_mb"].max(),
+            "spearman_vs_reference": spearman(affinities[tag], reference),
+            f"top{top_k}_agreement": top_k_agreement(affinities[tag], reference, top_k)
+        })
+    df_summary = pd.DataFrame(summary).sort_values("mean_wall_time_s", kind="stable").reset_index(drop=True)
+    df_summary["within_tolerance"] = (
+        (df_summary["succeeded"] == len(ligands)) &
+        (df_summary["spearman_vs_reference"] >= min_spearman) &
+        (df_summary[f"top{top_k}_agreement"] >= min_top_k_agreement)
+    )
+    df_summary.to_csv(benchmark_path / "benchmark-summary.csv", index=False)
+
+    pd.set_option('display.width', None)
+    print("\n=== BENCHMARK SUMMARY (cheapest first) ===")
+    print(df_summary[["setting", "succeeded", "mean_wall_time_s", "max_rss_mb",
+                      "spearman_vs_reference", f"top{top_k}_agreement", "within_tolerance"]].to_string(index=False))
+
+    accepted = df_summary[df_summary["within_tolerance"]]
+    if accepted.empty:
+        print("\n⚠️  No setting stays within the tolerance, keep the reference setting")
+        return df_runs, df_summary, None
+
+    best = accepted.iloc[0]
+    recommended = {name: best[name] for name in names}
+    speedup = df_summary.set_index("setting").loc[setting_tag(reference_setting), "mean_wall_time_s"] / best["mean_wall_time_s"]
+    print(f"\n✅ Recommended setting: {best['setting']} ({speedup:.1f}x faster than the reference, "
+          f"Spearman={best['spearman_vs_reference']:.3f}, top-{top_k}={best[f'top{top_k}_agreement']:.2f})")
+    for name, value in recommended.items():
+        print(f"   --{name} {value}")
+    print(f"\n📁 Tables saved in: {benchmark_path}/")
+    return df_runs, df_summary, recommended
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths and grid here
+    # ===================================================================
+
+    # Path to the input CSV file containing ligands
+    CSV_FILE = "../Autodock-Vina/ligands/list.csv"
+
+    # Directory for benchmark YAML files, Boltz outputs and result tables
+    BENCHMARK_DIR = "boltz-benchmark"
+
+    # Values to try for each sampling parameter
+    PARAMETER_GRID = {
+        "recycling_steps": [1, 3],
+        "sampling_steps": [25, 50, 200],
+        "diffusion_samples": [1, 3],
+        "step_scale": [1.2]
+    }
+
+    # Number of ligands in the reference subset and the ranking tolerance
+    REFERENCE_SIZE = 20
+    TOP_K = 5
+    MIN_SPEARMAN = 0.9
+    MIN_TOP_K_AGREEMENT = 0.8
+
+    # Use "../benchmarks/stand-ins/boltz" and USE_MSA_SERVER = False to run offline
+    BOLTZ_EXECUTABLE = "boltz"
+    USE_MSA_SERVER = True
+
+    # ===================================================================
+
+    benchmark_sampling_parameters(CSV_FILE, BENCHMARK_DIR, PARAMETER_GRID,
+                                  reference_size=REFERENCE_SIZE, top_k=TOP_K,
+                                  min_spearman=MIN_SPEARMAN,
+                                  min_top_k_agreement=MIN_TOP_K_AGREEMENT,
+                                  boltz_executable=BOLTZ_EXECUTABLE,
+                                  use_msa_server=USE_MSA_SERVER)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Boltz output compaction and retention policy.
+
+Extracts the affinity and confidence summary of every boltz_results_<id>
+folder into one consolidated table (boltz-summary.csv) and then archives or
+prunes the bulky per-ligand artifacts. Structures are kept only for the
+top-N ligands by boltz_affinity_kcalmol. boltz-predictions.py reads the
+consolidated table, so the merge step keeps working on compacted results.
+"""
+
+import glob
+import json
+import os
+import shutil
+import sys
+import tarfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.scripts import load_script
+
+# Name of the consolidated table written inside the results directory
+SUMMARY_FILE = "boltz-summary.csv"
+
+CONFIDENCE_METRICS = ["confidence_score", "ptm", "iptm", "ligand_iptm", "complex_plddt",
+                      "complex_iplddt", "complex_pde", "complex_ipde"]
+
+boltz_predictions = load_script("boltz/boltz-predictions.py")
+
+def folder_size(path):
+    """Total size in bytes and number of files below a folder"""
+    total_bytes = 0
+    total_files = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total_bytes += os.path.getsize(os.path.join(root, name))
+            total_files += 1
+    return total_bytes, total_files
+
+def summarize_result_folder(folder_path, idx):
+    """
+    Read the affinity and confidence JSON files of one boltz_results_<id> folder.
+
+    Returns:
+        dict: One summary row, or None if the affinity file is missing or invalid
+    """
+    predictions_dir = os.path.join(folder_path, "predictions", str(idx))
+    json_path = os.path.join(predictions_dir, f"affinity_{idx}.json")
+    if not os.path.exists(json_path):
+        return None
+
+    try:
+        with open(json_path, "r") as f:
+            row = {"id-num": idx, **json.load(f)}
+        boltz_kcalmol, mean_pred_value, mean_prob_binary = boltz_predictions.read_affinity_json(json_path)
+    except (KeyError, json.JSONDecodeError) as e:
+        print(f"⚠️  Skipping {json_path}: {e}")
+        return None
+
+    row["boltz_affinity_kcalmol"] = boltz_kcalmol
+    row["avg_affinity_pred_value"] = mean_pred_value
+    row["avg_affinity_probability_binary"] = mean_prob_binary
+
+    # Confidence of every diffusion sample: keep the mean and the best model
+    confidences = []
+    for confidence_path in sorted(glob.glob(os.path.join(predictions_dir, f"confidence_{idx}_model_*.json"))):
+        with open(confidence_path, "r") as f:
+            confidences.append(json.load(f))
+
+    if confidences:
+        for metric in CONFIDENCE_METRICS:
+            values = [c[metric] for c in confidences if metric in c]
+            row[f"mean_{metric}"] = np.mean(values) if values else np.nan
+        scores = [c.get("confidence_score", np.nan) for c in confidences]
+        row["best_model"] = int(np.nanargmax(scores))
+        row["best_confidence_score"] = np.nanmax(scores)
+    return row
+
+def prune_folder(folder_path, idx, keep_structures):
+    """
+    Remove the bulky artifacts of one result folder.
+
+    When keep_structures is True, the predicted structures (.cif) and the
+    affinity/confidence JSON files are kept; everything else is removed.
+    Otherwise the whole folder is removed.
+    """
+    if not keep_structures:
+        shutil.rmtree(folder_path)
+        return
+
+    for name in os.listdir(folder_path):
+        if name != "predictions":
+            path = os.path.join(folder_path, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    predictions_dir = os.path.join(folder_path, "predictions", str(idx))
+    for name in os.listdir(predictions_dir):
+        if not (name.endswith(".cif") or name.endswith(".json")):
+            os.remove(os.path.join(predictions_dir, name))
+
+def compact_boltz_results(results_dir, keep_top_n=20, mode="prune", archive_dir=None, dry_run=False):
+    """
+    Consolidate Boltz results into one table and apply the retention policy.
+
+    Args:
+        results_dir: Directory containing boltz_results_* folders
+        keep_top_n: Number of best ligands (by boltz_affinity_kcalmol) whose structures are kept
+        mode: 'prune' deletes the bulky artifacts, 'archive' stores each full folder
+              as a .tar.gz in archive_dir before deleting them
+        archive_dir: Destination of the archives (default: <results_dir>/archive)
+        dry_run: Only report what would be removed
+
+    Returns:
+        DataFrame: The consolidated summary table
+    """
+    if mode not in ("prune", "archive"):
+        raise ValueError(f"Unknown compaction mode '{mode}' (use 'prune' or 'archive')")
+
+    if not os.path.exists(results_dir):
+        print(f"❌ Error: Results directory not found at {results_dir}")
+        return None
+
+    summary_path = os.path.join(results_dir, SUMMARY_FILE)
+    archive_dir = archive_dir or os.path.join(results_dir, "archive")
+
+    # ------------------------------------------------------------
+    # 1. Read the existing summary and every remaining result folder
+    # ------------------------------------------------------------
+    rows = {}
+    if os.path.exists(summary_path):
+        df_existing = pd.read_csv(summary_path)
+        rows = {row["id-num"]: row for row in df_existing.to_dict("records")}
+        print(f"📄 Loaded existing summary with {len(rows)} ligands")
+
+    folders = {}
+    for folder_name in os.listdir(results_dir):
+        if not folder_name.startswith("boltz_results_"):
+            continue
+        idx = folder_name.replace("boltz_results_", "")
+        try:
+            idx = int(idx)
+        except ValueError:
+            pass
+
+        row = summarize_result_folder(os.path.join(results_dir, folder_name), idx)
+        if row is None:
+            print(f"⚠️  Warning: No affinity results in {folder_name}, leaving it untouched")
+            continue
+        rows[idx] = {**rows.get(idx, {}), **row}
+        folders[idx] = os.path.join(results_dir, folder_name)
+
+    if not rows:
+        print("⚠️  No Boltz results found, nothing to compact")
+        return None
+
+    # ------------------------------------------------------------
+    # 2. Decide which structures to keep
+    # ------------------------------------------------------------
+    df_summary = pd.DataFrame(list(rows.values()))
+    df_summary = df_summary.sort_values("boltz_affinity_kcalmol", ascending=False, kind="stable").reset_index(drop=True)
+    keep_ids = set(df_summary["id-num"].head(keep_top_n))
+    previous_status = df_summary["retention"] if "retention" in df_summary else pd.Series(np.nan, index=df_summary.index)
+    # Folders pruned by an earlier run: their full content is already archived (or gone)
+    compacted = {idx for idx, status in zip(df_summary["id-num"], previous_status)
+                 if status in ("structures", "summary-only")}
+    df_summary["retention"] = [
+        ("structures" if idx in keep_ids else "summary-only") if idx in folders else status
+        for idx, status in zip(df_summary["id-num"], previous_status)
+    ]
+
+    # Write the summary before touching any folder (atomic replace)
+    if not dry_run:
+        tmp_path = summary_path + ".tmp"
+        df_summary.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, summary_path)
+        print(f"✅ Summary of {len(df_summary)} ligands saved to: {summary_path}")
+
+    # ------------------------------------------------------------
+    # 3. Archive and prune the per-ligand folders
+    # ------------------------------------------------------------
+    freed_bytes = 0
+    freed_files = 0
+    if mode == "archive" and not dry_run:
+        os.makedirs(archive_dir, exist_ok=True)
+
+    for idx, folder_path in folders.items():
+        bytes_before, files_before = folder_size(folder_path)
+        keep_structures = idx in keep_ids
+
+        if dry_run:
+            print(f"   [dry run] {os.path.basename(folder_path)}: "
+                  f"{'keep structures' if keep_structures else 'remove'} ({bytes_before / 1e6:.1f} MB, {files_before} files)")
+            continue
+
+        if mode == "archive":
+            archive_path = os.path.join(archive_dir, f"{os.path.basename(folder_path)}.tar.gz")
+            # Never replace the archive of a full folder by one of its pruned copy
+            if not os.path.exists(archive_path) and idx not in compacted:
+                tmp_path = archive_path + ".tmp"
+                with tarfile.open(tmp_path, "w:gz") as tar:
+                    tar.add(folder_path, arcname=os.path.basename(folder_path))
+                os.replace(tmp_path, archive_path)
+
+        prune_folder(folder_path, idx, keep_structures)
+        bytes_after, files_after = folder_size(folder_path) if keep_structures else (0, 0)
+        freed_bytes += bytes_before - bytes_after
+        freed_files += files_before - files_after
+
+    print(f"\n📊 Compaction summary ({'dry run' if dry_run else mode}):")
+    print(f"   Result folders processed: {len(folders)}")
+    print(f"   Structures kept for top:  {len(keep_ids & set(folders))}")
+    if not dry_run:
+        print(f"   Disk space freed:         {freed_bytes / 1e6:.1f} MB")
+        print(f"   Files removed:            {freed_files}")
+        if mode == "archive":
+            print(f"   Archives saved in:        {archive_dir}/")
+    return df_summary
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your retention policy here
+    # ===================================================================
+
+    # Directory containing boltz_results_* folders
+    RESULTS_DIR = "boltz-results"
+
+    # Number of best ligands whose predicted structures are kept
+    KEEP_TOP_N = 20
+
+    # 'prune' deletes the bulky files, 'archive' keeps a .tar.gz of each folder
+    MODE = "prune"
+
+    # Set to False to actually remove the files
+    DRY_RUN = True
+
+    # ===================================================================
+
+    compact_boltz_results(RESULTS_DIR, keep_top_n=KEEP_TOP_N, mode=MODE, dry_run=DRY_RUN)
@@ -1,26 +1,72 @@
 import os
+import sys
 import json
 import pandas as pd
 import numpy as np
+from pathlib import Path
 
-def analyze_boltz_results(results_dir, csv_path, output_path):
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.progress import Progress
+from workflow.runstate import RunState
+from workflow.tables import find_table, read_table, write_table, with_format
+
+def read_affinity_json(json_path):
+    """
+    Read a Boltz affinity JSON and average its three predictions.
+    
+    Args:
+        json_path: Path to an affinity_<id>.json file
+        
+    Returns:
+        tuple: (boltz_kcalmol, mean_pred_value, mean_prob_binary)
+    """
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    
+    pred_values = [
+        data["affinity_pred_value"],
+        data["affinity_pred_value1"],
+        data["affinity_pred_value2"]
+    ]
+    
+    prob_binary_values = [
+        data["affinity_probability_binary"],
+        data["affinity_probability_binary1"],
+        data["affinity_probability_binary2"]
+    ]
+    
+    mean_pred_value = np.mean(pred_values)
+    mean_prob_binary = np.mean(prob_binary_values)
+    
+    # Convert mean affinity (log10 IC50 in uM) to kcal/mol
+    boltz_kcalmol = (6 - mean_pred_value) * 1.364
+    return boltz_kcalmol, mean_pred_value, mean_prob_binary
+
+def analyze_boltz_results(results_dir, csv_path, output_path, csv_copy=False, metrics_path=None,
+                          progress_interval=10.0, state_path=None):
     """
     Analyze Boltz prediction results and merge with existing CSV
     
     Args:
         results_dir: Directory containing boltz_results_* folders
-        csv_path: Path to the original CSV with affinities
-        output_path: Path where the new CSV will be saved
+        csv_path: Path to the original table with affinities (.csv, .parquet or .arrow)
+        output_path: Path where the new table will be saved (.csv, .parquet or .arrow)
+        csv_copy: Also save a .csv copy when the output is columnar
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+        state_path: Optional run-state database (see workflow/runstate.py); the affinity
+            files are taken from it instead of listing results_dir
     """
     
     # ------------------------------------------------------------ 
     # 1. Load original CSV
     # ------------------------------------------------------------ 
-    if not os.path.exists(csv_path):
+    if find_table(csv_path) is None:
         print(f"❌ Error: CSV file not found at {csv_path}")
         return
     
-    df = pd.read_csv(csv_path)
+    df = read_table(csv_path)
     print(f"📄 Loaded CSV with {len(df)} rows")
     
     # Dictionary to store boltz data
@@ -37,75 +83,80 @@ def analyze_boltz_results(results_dir, csv_path, output_path):
     
     processed_count = 0
     missing_count = 0
-    
-    for folder_name in os.listdir(results_dir):
-        if folder_name.startswith("boltz_results_"):
-            try:
-                # Extract numeric suffix or full ID
-                idx = folder_name.replace("boltz_results_", "")
-                # Try to convert to int if possible
-                try:
-                    idx = int(idx)
-                except ValueError:
-                    # Keep as string if not a simple integer
-                    pass
-            except ValueError:
-                continue
-            
-            # Build JSON path: boltz-results/boltz_results_X/predictions/X/affinity_X.json
-            json_path = os.path.join(results_dir, folder_name, "predictions", str(idx), f"affinity_{idx}.json")
-            
-            if not os.path.exists(json_path):
-                print(f"⚠️  Warning: Missing file {json_path}")
-                missing_count += 1
-                continue
-            
-            # ------------------------------------------------------------ 
-            # 3. Read JSON and compute averages
-            # ------------------------------------------------------------ 
-            try:
-                with open(json_path, "r") as f:
-                    data = json.load(f)
-                
-                pred_values = [
-                    data["affinity_pred_value"],
-                    data["affinity_pred_value1"],
-                    data["affinity_pred_value2"]
-                ]
-                
-                prob_binary_values = [
-                    data["affinity_probability_binary"],
-                    data["affinity_probability_binary1"],
-                    data["affinity_probability_binary2"]
-                ]
-                
-                mean_pred_value = np.mean(pred_values)
-                mean_prob_binary = np.mean(prob_binary_values)
-                
-                # ------------------------------------------------------------ 
-                # 4. Convert mean affinity to kcal/mol
-                # ------------------------------------------------------------ 
-                boltz_kcalmol = (6 - mean_pred_value) * 1.364
-                boltz_affinities[idx] = boltz_kcalmol
-                avg_pred_values[idx] = mean_pred_value
-                avg_prob_binary[idx] = mean_prob_binary
-                
+    problems = []  # The first problems are listed at the end
+    
+    # Ligands compacted by boltz-compaction.py are read from the summary table
+    summary_path = os.path.join(results_dir, "boltz-summary.csv")
+    if os.path.exists(summary_path):
+        df_summary = pd.read_csv(summary_path)
+        ids = df_summary["id-num"].tolist()
+        boltz_affinities.update(zip(ids, df_summary["boltz_affinity_kcalmol"]))
+        avg_pred_values.update(zip(ids, df_summary["avg_affinity_pred_value"]))
+        avg_prob_binary.update(zip(ids, df_summary["avg_affinity_probability_binary"]))
+        processed_count += len(ids)
+        print(f"🗜️  Loaded {len(ids)} compacted results from {summary_path}")
+    
+    if state_path:
+        # Affinity files recorded by boltz-processing.py
+        json_paths = {ligand_id: artifacts['affinity']
+                      for ligand_id, artifacts in RunState(state_path).artifacts('boltz').items()}
+    else:
+        json_paths = {}
+        for folder_name in os.listdir(results_dir):
+            if folder_name.startswith("boltz_results_"):
+                # Build JSON path: boltz-results/boltz_results_X/predictions/X/affinity_X.json
+                ligand_id = folder_name.replace("boltz_results_", "")
+                json_paths[ligand_id] = os.path.join(results_dir, folder_name, "predictions", ligand_id,
+                                                     f"affinity_{ligand_id}.json")
+    
+    progress = Progress("boltz-predictions", total=len(json_paths), metrics_path=metrics_path,
+                        interval=progress_interval, unit="folders")
+    for idx, json_path in json_paths.items():
+        progress.update(1)
+        # Try to convert the ID to int if possible
+        try:
+            idx = int(idx)
+        except ValueError:
+            # Keep as string if not a simple integer
+            pass
+        
+        if not os.path.exists(json_path):
+            problems.append(f"Missing file {json_path}")
+            missing_count += 1
+            progress.count("missing")
+            continue
+        
+        # ------------------------------------------------------------ 
+        # 3. Read JSON and compute averages
+        # ------------------------------------------------------------ 
+        try:
+            boltz_kcalmol, mean_pred_value, mean_prob_binary = read_affinity_json(json_path)
+            if idx not in boltz_affinities:
                 processed_count += 1
-                print(f"✅ Processed {folder_name}: {boltz_kcalmol:.2f} kcal/mol (pred={mean_pred_value:.3f}, prob={mean_prob_binary:.3f})")
-                
-            except KeyError as e:
-                print(f"⚠️  Missing values in {json_path}: {e}")
-                missing_count += 1
-                continue
-            except json.JSONDecodeError as e:
-                print(f"⚠️  Error parsing JSON in {json_path}: {e}")
-                missing_count += 1
-                continue
-    
+            boltz_affinities[idx] = boltz_kcalmol
+            avg_pred_values[idx] = mean_pred_value
+            avg_prob_binary[idx] = mean_prob_binary
+            
+        except KeyError as e:
+            problems.append(f"Missing values in {json_path}: {e}")
+            missing_count += 1
+            progress.count("missing")
+            continue
+        except json.JSONDecodeError as e:
+            problems.append(f"Error parsing JSON in {json_path}: {e}")
+            missing_count += 1
+            progress.count("missing")
+            continue
+    progress.close()
+    
+    for problem in problems[:20]:
+        print(f"⚠️  {problem}")
+    if len(problems) > 20:
+        print(f"⚠️  ... and {len(problems) - 20} more")
     print(f"\n📊 Summary: Processed {processed_count} results, {missing_count} missing/errors")
     
     # ------------------------------------------------------------ 
-    # 5. Merge with CSV (match by ligand ID = 2nd column)
+    # 4. Merge with CSV (match by ligand ID = 2nd column)
     # ------------------------------------------------------------ 
     id_col = df.columns[1]
     print(f"🔗 Matching on column: {id_col}")
@@ -119,9 +170,9 @@ def analyze_boltz_results(results_dir, csv_path, output_path):
     print(f"🎯 Matched {matched}/{len(df)} rows with Boltz results")
     
     # ------------------------------------------------------------ 
-    # 6. Save new CSV
+    # 5. Save new CSV
     # ------------------------------------------------------------ 
-    df.to_csv(output_path, index=False)
+    write_table(df, output_path, csv_copy=csv_copy)
     print(f"\n✅ Done! New CSV saved to: {output_path}")
     print(f"📈 Added columns: boltz_affinity_kcalmol, avg_affinity_pred_value, avg_affinity_probability_binary")
     
@@ -147,6 +198,17 @@ if __name__ == "__main__":
     # Path where the new CSV with Boltz results will be saved
     OUTPUT_CSV = "list_with_affinities_boltz.csv"
     
+    # Output format: "csv", "parquet" or "arrow" (a .csv copy is kept if EXPORT_CSV)
+    TABLE_FORMAT = "csv"
+    EXPORT_CSV = True
+    
+    # Live progress metrics (counts, rate, ETA), updated during the run
+    METRICS_FILE = "boltz-predictions-metrics.json"
+    
+    # Run-state database shared by the workflow steps (None = list the boltz_results_* folders)
+    STATE_DB = None
+    
     # ===================================================================
     
-    analyze_boltz_results(RESULTS_DIR, INPUT_CSV, OUTPUT_CSV)
+    analyze_boltz_results(RESULTS_DIR, INPUT_CSV, with_format(OUTPUT_CSV, TABLE_FORMAT), csv_copy=EXPORT_CSV,
+                          metrics_path=METRICS_FILE, state_path=STATE_DB)
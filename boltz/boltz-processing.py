@@ -1,8 +1,15 @@
-import csv
 import os
-import subprocess
+import sys
 from pathlib import Path
 
+# Shared helpers of the workflow live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.profiling import profile_dir_from_argv, profiled
+from workflow.progress import Progress
+from workflow.runner import CommandRunner, ExecutableNotFound, Job, Quarantine, Step
+from workflow.runstate import RunState
+from workflow.tables import find_table, read_table
+
 # Protein sequence
 PROTEIN_SEQUENCE = "GPLGSMENFQKVEKIGEGTYGVVYKARNKLTGEVVALKKIRLDTETEGVPSTAIREISLLKELNHPNIVKLLDVIHTENKLYLVFEFLHQDLKKFMDASALTGIPLPLIKSYLFQLLQGLAFCHSHRVLHRDLKPQNLLINTEGAIKLADFGLARAFGVPVRTYTHEVVTLWYRAPEILLGCKYYSTAVDIWSLGCIFAEMVTRRALFPGDSEIDQLFRIFRTLGTPDEVVWPGVTSMPDYKPSFPKWARQDFSKVVPPLDEDGRSLLSQMLHYDPNKRISAKAALAHPFFQDVTKPVPHLRL"
 
@@ -25,65 +32,141 @@ constraints:
       contacts: [ [ A, 83 ], [ A, 134 ] ]
 """
 
-def process_ligands(csv_path, output_dir):
-    """Process all ligands from the CSV file"""
+# Sampling parameters passed to every `boltz predict` call
+BOLTZ_SAMPLING_PARAMETERS = {
+    "recycling_steps": 1,
+    "sampling_steps": 50,
+    "diffusion_samples": 3,
+    "step_scale": 1.2
+}
+
+def build_boltz_command(yaml_path, results_dir="boltz-results", sampling_parameters=None,
+                        boltz_executable="boltz", use_msa_server=True):
+    """
+    Build the `boltz predict` command line for one YAML configuration.
+    
+    Args:
+        yaml_path: Path to the ligand YAML configuration file
+        results_dir: Directory where Boltz writes the boltz_results_* folders
+        sampling_parameters: Dict overriding BOLTZ_SAMPLING_PARAMETERS
+        boltz_executable: Name or path of the boltz executable
+        use_msa_server: Whether to request the MSA from the remote server
+    """
+    parameters = dict(BOLTZ_SAMPLING_PARAMETERS)
+    if sampling_parameters:
+        parameters.update(sampling_parameters)
+    
+    cmd = [boltz_executable, "predict", str(yaml_path)]
+    if use_msa_server:
+        cmd.append("--use_msa_server")
+    cmd += ["--out_dir", str(results_dir)]
+    for name in ("recycling_steps", "sampling_steps", "diffusion_samples", "step_scale"):
+        cmd += [f"--{name}", str(parameters[name])]
+    return cmd
+
+def process_ligands(csv_path, output_dir, results_dir="boltz-results", sampling_parameters=None,
+                    boltz_executable="boltz", use_msa_server=True, metrics_path=None, progress_interval=10.0,
+                    state_path=None, hinge_table=None, workers=1, timeout=None, retries=0,
+                    quarantine_path=None, log_dir=None):
+    """
+    Process all ligands from the CSV file.
+    
+    The output of each boltz run goes to a log file and is only printed
+    (its last lines) when the run fails.
+    
+    Args:
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+        state_path: Optional run-state database (see workflow/runstate.py). The ligands of the
+            table are registered in it and only the ones without a Boltz result are predicted
+        hinge_table: Optional table with the hinge_hbond column of interaction-fingerprints.py;
+            only the ligands whose best pose H-bonds the hinge are predicted
+        workers: Number of boltz runs at the same time (one per GPU, usually)
+        timeout: Maximum seconds of one boltz run (None = no limit)
+        retries: Number of new attempts of a failed boltz run
+        quarantine_path: Optional JSON file of the ligands that keep failing; they are
+            skipped after 3 failed runs (see workflow/runner.py)
+        log_dir: Optional folder keeping the output of the failed boltz runs
+    """
     
     # Create output directory if it doesn't exist
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
     
-    # Read the CSV file
-    csv_file = Path(csv_path)
-    
-    if not csv_file.exists():
-        print(f"Error: {csv_file} not found!")
+    # Read the ligand table (only the two columns needed)
+    if find_table(csv_path) is None:
+        print(f"Error: {csv_path} not found!")
         return
     
-    with open(csv_file, 'r') as f:
-        reader = csv.DictReader(f)
-        
-        for row in reader:
-            id_num = row['id-num'].strip()
-            smile = row['smiles'].strip()
-            
-            print(f"\nProcessing ligand {id_num}...")
+    ligands = read_table(csv_path, columns=['id-num', 'smiles'])
+    if hinge_table:
+        hinge = read_table(hinge_table, columns=['id-num', 'hinge_hbond'])
+        binders = set(hinge.loc[hinge['hinge_hbond'] == True, 'id-num'].astype(str).str.strip())
+        keep = ligands['id-num'].astype(str).str.strip().isin(binders)
+        print(f"🔗 {keep.sum()}/{len(ligands)} ligands H-bond the hinge ({hinge_table}), the others are skipped")
+        ligands = ligands[keep]
+    state = RunState(state_path) if state_path else None
+    if state is not None:
+        state.register(ligands.itertuples(index=False))
+        # The database can hold ligands of other tables or left out by the hinge filter
+        selected = set(ligands['id-num'].astype(str).str.strip())
+        ligands = [(id_num, smile) for id_num, smile, _ in state.pending('boltz')
+                   if str(id_num).strip() in selected]
+    else:
+        ligands = list(ligands.itertuples(index=False))
+    print(f"Running Boltz for {len(ligands)} ligands (YAML files in {output_dir})")
+    progress = Progress("boltz-processing", total=len(ligands), metrics_path=metrics_path,
+                        interval=progress_interval)
+    
+    runner = CommandRunner(workers, timeout, retries, log_dir=log_dir,
+                           quarantine=Quarantine(quarantine_path) if quarantine_path else None)
+    
+    def boltz_jobs():
+        for id_num, smile in ligands:
+            id_num = str(id_num).strip()
+            smile = str(smile).strip()
             
             # Create YAML file
             yaml_path = output_path / f"{id_num}.yaml"
             with open(yaml_path, 'w') as yaml_file:
                 yaml_file.write(create_yaml_content(smile))
             
-            print(f"Created {yaml_path}")
-            
-            # Run Boltz prediction
-            cmd = [
-                "boltz", "predict", str(yaml_path),
-                "--use_msa_server",
-		"--out_dir", "boltz-results",
-                "--recycling_steps", "1",
-                "--sampling_steps", "50",
-                "--diffusion_samples", "3",
-                "--step_scale", "1.2"
-            ]
-            
-            print(f"Running: {' '.join(cmd)}")
-            
-            try:
-                result = subprocess.run(
-                    cmd,
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-                print(f"Success! Output:\n{result.stdout}")
-            except subprocess.CalledProcessError as e:
-                print(f"Error running Boltz for {id_num}:")
-                print(f"Return code: {e.returncode}")
-                print(f"Stdout: {e.stdout}")
-                print(f"Stderr: {e.stderr}")
-            except FileNotFoundError:
-                print("Error: 'boltz' command not found. Make sure Boltz is installed and in your PATH.")
-                return
+            # Boltz prediction
+            cmd = build_boltz_command(yaml_path, results_dir, sampling_parameters,
+                                      boltz_executable, use_msa_server)
+            if state is not None:
+                state.start('boltz', id_num)
+            yield Job(id_num, [Step("boltz", cmd)], data=(yaml_path, cmd))
+    
+    def record(result):
+        id_num = result.key
+        yaml_path, cmd = result.job.data
+        progress.add_time("boltz", result.step_seconds.get("boltz", 0.0))
+        if not result.ok:
+            print(f"Error running Boltz for {id_num}:")
+            print(f"Command: {' '.join(cmd)}")
+            print(result.error)
+            if state is not None:
+                state.fail('boltz', id_num, result.error.splitlines()[0], result.seconds)
+        elif state is not None:
+            # Boltz names its output folder after the YAML file
+            json_path = (Path(results_dir) / f"boltz_results_{id_num}" / "predictions" / id_num
+                         / f"affinity_{id_num}.json")
+            state.finish('boltz', id_num,
+                         {'yaml': str(yaml_path.resolve()), 'affinity': str(json_path.resolve())},
+                         result.seconds)
+        progress.update(1, failed=int(not result.ok))
+    
+    try:
+        counts = runner.run(boltz_jobs(), on_result=record)
+    except ExecutableNotFound:
+        print("Error: 'boltz' command not found. Make sure Boltz is installed and in your PATH.")
+        progress.close("failed")
+        return
+    if counts['quarantined']:
+        print(f"Skipped {counts['quarantined']} quarantined ligands (see {quarantine_path})")
+    
+    progress.close()
 
 if __name__ == "__main__":
     # ===================================================================
@@ -96,6 +179,29 @@ if __name__ == "__main__":
     # Path to the output directory where YAML files will be created
     OUTPUT_DIR = "boltz-configurations-files"
     
+    # Live progress metrics (counts, rate, ETA), updated during the run
+    METRICS_FILE = "boltz-processing-metrics.json"
+    
+    # Run-state database shared by the workflow steps (None = predict every ligand of CSV_FILE)
+    STATE_DB = None
+    
+    # Ranking table with the hinge_hbond column of interaction-fingerprints.py: only the
+    # ligands whose best pose H-bonds the hinge are predicted (None = all the ligands)
+    HINGE_TABLE = None  # e.g. "../Autodock-Vina/poses/list_with_affinities.csv"
+    
+    # Boltz runs at the same time, maximum seconds of one run and new attempts of a failed run
+    WORKERS = 1
+    TIMEOUT = 7200
+    RETRIES = 1
+    
+    # Ligands failing in 3 runs are skipped afterwards (None = always retried); logs of the failed runs
+    QUARANTINE_FILE = "boltz-quarantine.json"
+    LOG_DIR = "boltz-logs"
+    
     # ===================================================================
     
-    process_ligands(CSV_FILE, OUTPUT_DIR)
+    # python boltz-processing.py --profile: timing breakdown in profiles/ (see workflow/profiling.py)
+    with profiled("boltz-processing", profile_dir_from_argv()):
+        process_ligands(CSV_FILE, OUTPUT_DIR, metrics_path=METRICS_FILE, state_path=STATE_DB,
+                        hinge_table=HINGE_TABLE, workers=WORKERS, timeout=TIMEOUT, retries=RETRIES,
+                        quarantine_path=QUARANTINE_FILE, log_dir=LOG_DIR)
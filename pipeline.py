@@ -0,0 +1,513 @@
+"""
+Streaming pipeline of the whole workflow.
+
+The step scripts (ligands-preparation.py, vina-batch.py, ranking.py,
+boltz-processing.py, boltz-predictions.py, sorting.py) each process the
+full library before the next one starts. Here every ligand flows on its
+own through a small graph of stages connected by bounded queues:
+
+    list.csv -> prepare (scrub.py + mk_prepare_ligand.py) -> dock (vina)
+             -> boltz (YAML + boltz predict + affinity JSON)
+
+so ligand N is docked while ligand N+1 is prepared and ligand N-1 is in
+Boltz. With the hinge filter, boltz comes after dock instead, and only
+the ligands whose best pose H-bonds the hinge (workflow/interactions.py)
+go on to Boltz. Each stage has its own number of workers, and the affinities are
+collected as the ligands finish, which replaces the ranking and merge
+passes. Once every ligand went through, the tables are written and the
+candidates are sorted (sorting.py) and described (additional-descriptor.py).
+
+The outputs are the same files, in the same folders, as the step scripts,
+and a ligand whose outputs already exist is not computed again, so an
+interrupted run can simply be started again. With a run-state database
+(workflow/runstate.py), "already exists" is a lookup in the database,
+which also records the status, files, time and error of every ligand in
+every stage, instead of a check on disk.
+"""
+
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from workflow.gridmaps import GridMapCache
+from workflow.interactions import ReceptorPocket, read_pose_modes
+from workflow.progress import Progress
+from workflow.runner import CommandRunner, ExecutableNotFound, Job, Step
+from workflow.runstate import RunState
+from workflow.scripts import load_script
+from workflow.tables import iter_table_chunks, read_table, table_rows, write_table
+
+REPO_ROOT = Path(__file__).resolve().parent
+
+# Marks the end of the ligands in a queue
+STOP = object()
+
+class StageError(Exception):
+    """Failure of one ligand in one stage (the other ligands go on)"""
+
+class Stage:
+    """
+    One step of the pipeline, run by a pool of worker threads.
+
+    The function receives a ligand (dict with at least 'id' and 'smiles'),
+    stores its results in it and returns False when it reused existing
+    outputs instead of computing them. A ligand is passed to the downstream
+    stages once its function returned; if it raised, the ligand is recorded
+    as failed (also in the run state, if any) and stops there. A function
+    can also stop a ligand on purpose by setting ligand['filtered'] to the
+    reason. When a ligand stops (failure, filter or last stage), on_done
+    is called with it.
+
+    Args:
+        name: Name shown in the summary
+        function: Work done for one ligand
+        workers: Number of ligands processed at the same time
+        queue_size: Maximum number of ligands waiting (default: 2 * workers)
+    """
+
+    def __init__(self, name, function, workers=1, queue_size=None):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size or 2 * workers)
+        self.downstream = []
+        self.upstream = 0
+        self.closed_upstream = 0
+        self.finished_workers = 0
+        self.lock = threading.Lock()
+        self.threads = []
+        self.on_done = None
+        self.progress = None
+        self.state = None
+
+        self.done = 0
+        self.reused = 0
+        self.filtered = 0
+        self.failed = {}
+        self.busy = 0.0
+
+    def then(self, stage):
+        """Send the ligands that pass this stage to another one (returns it for chaining)"""
+        self.downstream.append(stage)
+        stage.upstream += 1
+        return stage
+
+    def put(self, ligand):
+        """Queue a ligand (blocks while the queue is full)"""
+        self.queue.put(ligand)
+
+    def close(self):
+        """Signal that one upstream stage (or the reader) will not send more ligands"""
+        with self.lock:
+            self.closed_upstream += 1
+            last = self.closed_upstream >= max(self.upstream, 1)
+        if last:
+            for _ in range(self.workers):
+                self.queue.put(STOP)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def work(self):
+        while True:
+            ligand = self.queue.get()
+            if ligand is STOP:
+                break
+
+            start = time.perf_counter()
+            try:
+                computed = self.function(ligand)
+                error = None
+            except StageError as e:
+                error = str(e)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - start
+
+            with self.lock:
+                self.busy += elapsed
+                if error is not None:
+                    self.failed[ligand['id']] = error
+                elif computed is False:
+                    self.reused += 1
+                else:
+                    self.done += 1
+                stopped = error is not None or 'filtered' in ligand
+                if error is None and 'filtered' in ligand:
+                    self.filtered += 1
+
+            if self.progress is not None:
+                self.progress.add_time(self.name, elapsed)
+                if error is not None:
+                    self.progress.count(f"{self.name}_failed")
+                elif 'filtered' in ligand:
+                    self.progress.count(f"{self.name}_filtered")
+            if self.state is not None and error is not None:
+                self.state.fail(self.name, ligand['id'], error, elapsed)
+
+            if not stopped:
+                for stage in self.downstream:
+                    stage.put(ligand)
+            elif error is not None:
+                print(f"  ✗ {self.name} failed for ligand {ligand['id']}: {error}")
+            if (stopped or not self.downstream) and self.on_done is not None:
+                self.on_done(ligand)
+
+        # The last worker to stop closes the downstream stages
+        with self.lock:
+            self.finished_workers += 1
+            last = self.finished_workers == self.workers
+        if last:
+            for stage in self.downstream:
+                stage.close()
+
+def run_command(runner, key, steps):
+    """
+    Run the commands of one ligand in a stage, raising StageError on failure.
+
+    Args:
+        runner: CommandRunner of the stage (timeout, retries and logs)
+        key: Ligand id, used in the log file names
+        steps: List of Step, run one after the other
+    """
+    results = []
+    try:
+        runner.run([Job(key, steps)], on_result=results.append)
+    except ExecutableNotFound as e:
+        raise StageError(str(e))
+    if not results[0].ok:
+        raise StageError(results[0].error)
+
+def read_ligands(list_table, chunksize=10000):
+    """Yield the ligands of the list as {'id', 'smiles'} dicts"""
+    for chunk in iter_table_chunks(list_table, chunksize, columns=['smiles', 'id-num']):
+        for smiles, id_num in chunk.itertuples(index=False):
+            smiles = str(smiles).strip()
+            id_num = str(id_num).strip()
+            if smiles and id_num:
+                yield {'id': id_num, 'smiles': smiles}
+
+def build_stages(config, state=None):
+    """
+    Create the prepare -> dock and boltz stages (prepare -> dock -> boltz with the hinge filter).
+
+    Args:
+        config: Dict of settings (see the CONFIGURATION block)
+        state: Optional RunState where the stages look up and record their work
+
+    Returns:
+        tuple: (stages in display order, stages fed by the ligand reader)
+    """
+    preparation = load_script("Autodock-Vina/ligands/ligands-preparation.py")
+    vina_batch = load_script("Autodock-Vina/vina-batch.py")
+    ranking = load_script("Autodock-Vina/poses/ranking.py")
+    boltz_processing = load_script("boltz/boltz-processing.py")
+    boltz_predictions = load_script("boltz/boltz-predictions.py")
+
+    ligands_dir = Path(config['ligands_dir'])
+    poses_dir = Path(config['poses_dir'])
+    receptor_path = str(Path(config['receptor_dir']) / config['receptor_name'])
+    box_path = str(Path(config['receptor_dir']) / config['box_config'])
+    yaml_dir = Path(config['boltz_yaml_dir'])
+    results_dir = Path(config['boltz_results_dir'])
+    poses_dir.mkdir(parents=True, exist_ok=True)
+    yaml_dir.mkdir(parents=True, exist_ok=True)
+
+    # One command at a time per stage worker, with the timeout of the stage and the retries
+    runners = {stage: CommandRunner(1, config[f'{stage}_timeout'], config['retries'], log_dir=config['log_dir'])
+               for stage in ('prepare', 'dock', 'boltz')}
+
+    # Receptor grid maps computed once (or found in the cache) for all the dockings
+    maps = None
+    if config['grid_cache_dir']:
+        maps = GridMapCache(config['grid_cache_dir'], config['vina_executable']).maps_prefix(receptor_path, box_path)
+
+    # Receptor atoms indexed once for the interaction fingerprints of the poses
+    pocket = None
+    if config['hinge_filter']:
+        pocket = ReceptorPocket(receptor_path, box_path)
+        hinge = [pocket.residue_index(residue) for residue in config['hinge_residues']]
+
+    def already_done(stage, ligand, output_path):
+        # The run state knows what was done; without one, the output file tells
+        if state is not None:
+            record = state.get(stage, ligand['id'])
+            return record is not None and record['status'] == 'done'
+        return os.path.exists(output_path)
+
+    def begin(stage, ligand):
+        if state is not None:
+            state.start(stage, ligand['id'])
+        return time.perf_counter()
+
+    def finish(stage, ligand, artifacts, started):
+        if state is not None:
+            state.finish(stage, ligand['id'], {name: str(Path(path).resolve()) for name, path in artifacts.items()},
+                         time.perf_counter() - started)
+
+    def prepare(ligand):
+        # Same file names as ligands-preparation.py, written in the ligands folder
+        sdf_name = f"{ligand['id']}-prepared.sdf"
+        pdbqt_name = f"{ligand['id']}-prepared.pdbqt"
+        ligand['pdbqt'] = str(ligands_dir / pdbqt_name)
+        if already_done('prepare', ligand, ligand['pdbqt']):
+            return False
+        started = begin('prepare', ligand)
+        run_command(runners['prepare'], ligand['id'], [
+            Step("scrub", preparation.build_scrub_command(ligand['smiles'], sdf_name, config['scrub_executable']),
+                 cwd=ligands_dir),
+            Step("mk_prepare", preparation.build_mk_prepare_command(sdf_name, pdbqt_name,
+                                                                    config['mk_prepare_executable']),
+                 cwd=ligands_dir)
+        ])
+        if not os.path.exists(ligand['pdbqt']):
+            raise StageError(f"{pdbqt_name} was not written")
+        finish('prepare', ligand, {'sdf': ligands_dir / sdf_name, 'pdbqt': ligand['pdbqt']}, started)
+
+    def dock(ligand):
+        score_path = poses_dir / f"{ligand['id']}-vina-score.txt"
+        pose_path = poses_dir / f"{ligand['id']}-vina-out.pdbqt"
+        computed = not already_done('dock', ligand, score_path)
+        if computed:
+            started = begin('dock', ligand)
+            cmd = vina_batch.build_vina_command(receptor_path, ligand['pdbqt'], box_path, str(pose_path),
+                                                config['exhaustiveness'], config['num_modes'],
+                                                config['vina_cpu'], config['vina_executable'], maps)
+            # The runner writes the score under a temporary name, so that an interrupted docking is redone
+            run_command(runners['dock'], ligand['id'], [Step("vina", cmd, stdout=score_path)])
+        ligand['vina_affinity'] = ranking.extract_best_affinity(score_path)
+        if ligand['vina_affinity'] is None:
+            raise StageError(f"no affinity in {score_path.name}")
+        if computed:
+            finish('dock', ligand, {'score': score_path, 'pose': pose_path}, started)
+        if pocket is not None:
+            bits = pocket.fingerprint(read_pose_modes(pose_path))
+            ligand['hinge_hbond'] = bool(bits['hbond'][0, hinge].any())
+            if not ligand['hinge_hbond']:
+                ligand['filtered'] = "no hinge H-bond"
+        return computed
+
+    def boltz(ligand):
+        id_num = ligand['id']
+        json_path = results_dir / f"boltz_results_{id_num}" / "predictions" / id_num / f"affinity_{id_num}.json"
+        yaml_path = yaml_dir / f"{id_num}.yaml"
+        computed = not already_done('boltz', ligand, json_path)
+        if computed:
+            started = begin('boltz', ligand)
+            with open(yaml_path, 'w') as yaml_file:
+                yaml_file.write(boltz_processing.create_yaml_content(ligand['smiles']))
+            run_command(runners['boltz'], id_num, [
+                Step("boltz", boltz_processing.build_boltz_command(yaml_path, results_dir, config['boltz_sampling'],
+                                                                   config['boltz_executable'],
+                                                                   config['use_msa_server']))
+            ])
+        try:
+            ligand['boltz'] = boltz_predictions.read_affinity_json(json_path)
+        except (OSError, KeyError, ValueError) as e:
+            raise StageError(f"unreadable {json_path.name} ({e})")
+        if computed:
+            finish('boltz', ligand, {'yaml': yaml_path, 'affinity': json_path}, started)
+        return computed
+
+    prepare_stage = Stage("prepare", prepare, config['prepare_workers'], config['queue_size'])
+    dock_stage = prepare_stage.then(Stage("dock", dock, config['dock_workers'], config['queue_size']))
+    boltz_stage = Stage("boltz", boltz, config['boltz_workers'], config['queue_size'])
+    if pocket is not None:
+        dock_stage.then(boltz_stage)
+        return [prepare_stage, dock_stage, boltz_stage], [prepare_stage]
+    return [prepare_stage, dock_stage, boltz_stage], [prepare_stage, boltz_stage]
+
+def print_stage_summary(stages, wall_time):
+    print(f"\n{'='*70}")
+    print("PIPELINE SUMMARY")
+    print(f"{'='*70}")
+    print(f"{'stage':<10}{'workers':>8}{'computed':>10}{'reused':>8}{'filtered':>10}{'failed':>8}"
+          f"{'busy (s)':>11}{'usage':>8}")
+    for stage in stages:
+        usage = stage.busy / (wall_time * stage.workers) if wall_time > 0 else 0.0
+        print(f"{stage.name:<10}{stage.workers:>8}{stage.done:>10}{stage.reused:>8}{stage.filtered:>10}"
+              f"{len(stage.failed):>8}{stage.busy:>11.1f}{usage:>8.0%}")
+    print(f"\n⏱️  Wall time: {wall_time:.1f} s")
+
+    for stage in stages:
+        if stage.failed:
+            ids = list(stage.failed)
+            print(f"\n⚠️  {stage.name} failed for {len(ids)} ligand(s): {', '.join(ids[:20])}"
+                  + (" ..." if len(ids) > 20 else ""))
+
+def write_affinity_tables(list_table, ligands, vina_output, boltz_output, csv_copy=False):
+    """Same tables as ranking.py and boltz-predictions.py, from the collected affinities"""
+    df = read_table(list_table)
+    ids = df['id-num'].astype(str).str.strip()
+
+    vina = {ligand['id']: ligand['vina_affinity'] for ligand in ligands if 'vina_affinity' in ligand}
+    df['vina_affinity'] = ids.map(vina)
+    hinge = {ligand['id']: ligand['hinge_hbond'] for ligand in ligands if 'hinge_hbond' in ligand}
+    if hinge:
+        df['hinge_hbond'] = ids.map(hinge)
+    write_table(df, vina_output, csv_copy=csv_copy)
+    print(f"✅ Saved {df['vina_affinity'].notna().sum()}/{len(df)} Vina affinities to {vina_output}")
+
+    boltz = {ligand['id']: ligand['boltz'] for ligand in ligands if 'boltz' in ligand}
+    for i, column in enumerate(["boltz_affinity_kcalmol", "avg_affinity_pred_value",
+                                "avg_affinity_probability_binary"]):
+        df[column] = ids.map({id_num: values[i] for id_num, values in boltz.items()})
+    write_table(df, boltz_output, csv_copy=csv_copy)
+    print(f"✅ Saved {df['boltz_affinity_kcalmol'].notna().sum()}/{len(df)} Boltz affinities to {boltz_output}")
+
+def run_pipeline(config):
+    """
+    Stream the ligands of config['list_table'] through all the stages.
+
+    Args:
+        config: Dict of settings (see the CONFIGURATION block)
+    """
+    state = RunState(config['state_db']) if config['state_db'] else None
+    if state is not None:
+        added = state.register((ligand['id'], ligand['smiles']) for ligand in read_ligands(config['list_table']))
+        print(f"🗃️  Run state {config['state_db']}: {added} new ligands, "
+              f"{state.counts('dock')['pending']} to dock, {state.counts('boltz')['pending']} to predict with Boltz")
+    stages, sources = build_stages(config, state)
+    progress = Progress("pipeline", total=table_rows(config['list_table']), metrics_path=config['metrics_file'],
+                        interval=config['progress_interval'])
+
+    # A ligand is done once every branch it was sent to (prepare -> dock, boltz) stopped
+    done_lock = threading.Lock()
+    def ligand_done(ligand):
+        with done_lock:
+            ligand['branches'] -= 1
+            finished = ligand['branches'] == 0
+        if finished:
+            progress.update(1)
+
+    for stage in stages:
+        stage.on_done = ligand_done
+        stage.progress = progress
+        stage.state = state
+        stage.start()
+
+    print(f"🚀 Streaming ligands from {config['list_table']}: "
+          + ", ".join(f"{stage.name} x{stage.workers}" for stage in stages))
+    start = time.perf_counter()
+    ligands = []
+    for ligand in read_ligands(config['list_table']):
+        ligand['branches'] = len(sources)
+        ligands.append(ligand)
+        for stage in sources:
+            stage.put(ligand)
+    for stage in sources:
+        stage.close()
+    for stage in stages:
+        stage.join()
+    wall_time = time.perf_counter() - start
+    progress.close()
+    print_stage_summary(stages, wall_time)
+
+    # Tables and ranking, once every ligand went through
+    print()
+    write_affinity_tables(config['list_table'], ligands, config['vina_table'], config['boltz_table'],
+                          config['csv_copy'])
+
+    sorting = load_script("sorting.py")
+    sorting.sort_candidates(config['boltz_table'], config['sorted_table'], config['best_table'],
+                            config['ranking_strategy'], config['ranking_weights'], config['top_n'],
+                            config['csv_copy'])
+
+    if config['descriptors_table']:
+        descriptors = load_script("additional-descriptor.py")
+        descriptors.compute_descriptors(config['best_table'], config['descriptors_table'])
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    CONFIG = {
+        # Ligand list (made by ligands-preparation.py from cheese*.csv)
+        'list_table': 'Autodock-Vina/ligands/list.csv',
+
+        # Workers of each stage: vina uses several cores per run, so a few
+        # dockings at a time with VINA_CPU cores each is usually the best use
+        # of the machine, while the preparation is light and single-threaded
+        'prepare_workers': 2,
+        'dock_workers': 2,
+        'boltz_workers': 1,
+
+        # Ligands waiting in front of each stage (None = 2 x workers)
+        'queue_size': None,
+
+        # Preparation
+        'ligands_dir': 'Autodock-Vina/ligands',
+        'scrub_executable': 'scrub.py',
+        'mk_prepare_executable': 'mk_prepare_ligand.py',
+
+        # Docking (same settings as vina-batch.py)
+        'receptor_dir': 'Autodock-Vina/receptor',
+        'receptor_name': '1H1Q-prepared.pdbqt',
+        'box_config': '1H1Q-prepared.box.txt',
+        'poses_dir': 'Autodock-Vina/poses',
+        'exhaustiveness': 100,
+        'num_modes': 20,
+        'vina_cpu': None,
+        'vina_executable': 'vina',
+        # Cached receptor grid maps, loaded by every docking instead of being
+        # recomputed (see workflow/gridmaps.py); None = computed by each vina run
+        'grid_cache_dir': 'Autodock-Vina/receptor/grid-maps',
+
+        # Send to Boltz only the ligands whose best pose H-bonds one of the hinge
+        # residues (see Autodock-Vina/poses/interaction-fingerprints.py); Boltz then
+        # starts after the docking of each ligand instead of at the same time
+        'hinge_filter': False,
+        'hinge_residues': ('GLU81', 'LEU83'),
+
+        # Boltz (same settings as boltz-processing.py)
+        'boltz_yaml_dir': 'boltz/boltz-configurations-files',
+        'boltz_results_dir': 'boltz/boltz-results',
+        'boltz_sampling': None,
+        'boltz_executable': 'boltz',
+        'use_msa_server': True,
+
+        # Maximum seconds of the commands of one ligand in each stage (None = no limit), new
+        # attempts of a failed or timed-out command, and logs of the failed ones
+        'prepare_timeout': 600,
+        'dock_timeout': 3600,
+        'boltz_timeout': 7200,
+        'retries': 1,
+        'log_dir': 'pipeline-logs',
+
+        # Output tables
+        'vina_table': 'Autodock-Vina/poses/list_with_affinities.csv',
+        'boltz_table': 'boltz/list_with_affinities_boltz.csv',
+        'sorted_table': 'list-sorted.csv',
+        'best_table': 'list-best10.csv',
+        'csv_copy': False,
+
+        # Ranking (see sorting.py)
+        'ranking_strategy': 'average',
+        'ranking_weights': None,
+        'top_n': 10,
+
+        # Descriptors of the best candidates (None = skip additional-descriptor.py)
+        'descriptors_table': 'candidates.csv',
+
+        # Live progress metrics (ligands done, rate, ETA, failures and time of each stage)
+        'metrics_file': 'pipeline-metrics.json',
+        'progress_interval': 10.0,
+
+        # Run-state database (status, files, time and error of every ligand in every
+        # stage); None = a ligand is skipped when its output files exist
+        'state_db': 'run-state.db'
+    }
+
+    # ===================================================================
+
+    run_pipeline(CONFIG)
@@ -0,0 +1,340 @@
+"""
+Agreement between the Vina and Boltz poses of each ligand.
+
+We rank on the Vina and Boltz affinities, but the two methods can put the
+ligand in different places of the pocket, and an affinity is less
+trustworthy when they disagree. For every ligand, this step loads all the
+modes of poses/<id>-vina-out.pdbqt and the ligand of every Boltz sample
+(<id>_model_<k>.cif), superposes each Boltz complex on the docking
+receptor (C-alpha atoms of the pocket, as the loops far from it can move
+by several Angstrom), and computes the heavy-atom RMSD of every
+(mode, sample) pair. The RMSD is symmetry-aware: it is the minimum over
+the atom permutations that map the molecule onto itself (e.g. the two
+ortho carbons of a phenyl), computed for all the pairs at once with NumPy.
+
+The columns added to the ranking table are:
+    pose_rmsd_top: RMSD between Vina mode 1 and the first Boltz sample (Angstrom)
+    pose_rmsd_best: Smallest RMSD over all (mode, sample) pairs
+    pose_best_mode / pose_best_sample: The pair of pose_rmsd_best
+    pose_consensus: Whether pose_rmsd_top is below the threshold (2 Angstrom)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, RDLogger
+from rdkit.Chem import rdDetermineBonds
+
+from workflow.gridmaps import read_box
+from workflow.progress import Progress
+from workflow.tables import read_table, write_table
+
+# Residues added in front of CDK2 in the Boltz sequence (GPLGS expression tag):
+# residue i of the Boltz model is residue i - 5 of the receptor
+BOLTZ_RESIDUE_OFFSET = 5
+
+# Residues used for the superposition: C-alpha within this distance of the box center (Angstrom)
+POCKET_RADIUS = 12.0
+
+# Maximum number of symmetry permutations tried per ligand
+MAX_PERMUTATIONS = 1000
+
+def read_receptor_ca(pdbqt_path, center=None, radius=POCKET_RADIUS):
+    """
+    C-alpha atoms of a receptor PDB/PDBQT file.
+
+    Args:
+        center: Optional point (e.g. the box center); only the C-alpha within radius of it are kept
+
+    Returns:
+        dict: {(residue number, residue name): xyz}
+    """
+    ca = {}
+    with open(pdbqt_path, 'r') as f:
+        for line in f:
+            if line.startswith("ATOM") and line[12:16].strip() == "CA":
+                xyz = np.array([float(line[30:38]), float(line[38:46]), float(line[46:54])])
+                if center is None or np.linalg.norm(xyz - center) <= radius:
+                    ca[(int(line[22:26]), line[17:20].strip())] = xyz
+    return ca
+
+def read_cif_atoms(cif_path):
+    """
+    Atoms of an mmCIF file (the _atom_site loop written by Boltz).
+
+    Returns:
+        DataFrame: One row per atom with the _atom_site columns (without prefix)
+    """
+    columns = []
+    rows = []
+    with open(cif_path, 'r') as f:
+        for line in f:
+            if line.startswith("_atom_site."):
+                columns.append(line.strip()[len("_atom_site."):])
+            elif columns and line.startswith(("ATOM", "HETATM")):
+                rows.append(line.split())
+            elif rows:
+                break
+    atoms = pd.DataFrame(rows, columns=columns)
+    for axis in ("Cartn_x", "Cartn_y", "Cartn_z"):
+        atoms[axis] = atoms[axis].astype(float)
+    return atoms
+
+def read_vina_modes(pdbqt_path):
+    """
+    Heavy-atom coordinates of every mode of a Vina output, in the atom order of its SMILES.
+
+    Meeko writes the SMILES of the ligand and the PDBQT atom of each SMILES
+    atom (REMARK SMILES IDX), so every mode is ordered like the molecule.
+
+    Returns:
+        tuple: (SMILES, array (modes, atoms, 3))
+    """
+    smiles = None
+    index_pairs = []
+    modes = []
+    with open(pdbqt_path, 'r') as f:
+        for line in f:
+            if line.startswith("MODEL"):
+                atoms = {}
+            elif line.startswith("REMARK SMILES IDX"):
+                if not modes:
+                    index_pairs += [int(value) for value in line.split()[3:]]
+            elif line.startswith("REMARK SMILES"):
+                smiles = line.split()[2]
+            elif line.startswith(("ATOM", "HETATM")):
+                atoms[int(line[6:11])] = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+            elif line.startswith("ENDMDL"):
+                modes.append(atoms)
+    if smiles is None or not index_pairs:
+        raise ValueError(f"{pdbqt_path} has no REMARK SMILES/SMILES IDX lines (not written by Meeko)")
+
+    # SMILES atom (1-based) -> PDBQT serial number, heavy atoms only
+    serial_of_atom = dict(zip(index_pairs[0::2], index_pairs[1::2]))
+    n_atoms = Chem.MolFromSmiles(smiles).GetNumAtoms()
+    serials = [serial_of_atom[i + 1] for i in range(n_atoms)]
+    return smiles, np.array([[atoms[serial] for serial in serials] for atoms in modes])
+
+def element_graph(mol):
+    """Copy of a molecule reduced to its elements and single bonds (matches any tautomer or protonation)"""
+    graph = Chem.RWMol(mol)
+    for atom in graph.GetAtoms():
+        atom.SetIsAromatic(False)
+        atom.SetFormalCharge(0)
+        atom.SetNoImplicit(True)
+        atom.SetNumExplicitHs(0)
+    for bond in graph.GetBonds():
+        bond.SetBondType(Chem.BondType.SINGLE)
+        bond.SetIsAromatic(False)
+    graph = graph.GetMol()
+    graph.UpdatePropertyCache(strict=False)
+    Chem.FastFindRings(graph)
+    return graph
+
+def boltz_ligand_coordinates(atoms, template, receptor_ca, residue_offset=BOLTZ_RESIDUE_OFFSET):
+    """
+    Ligand heavy atoms of a Boltz model, superposed on the receptor and ordered like the template.
+
+    Args:
+        atoms: Atoms of the model (read_cif_atoms)
+        template: Element graph of the ligand (element_graph of the Vina SMILES)
+        receptor_ca: C-alpha atoms of the docking pocket (read_receptor_ca)
+        residue_offset: Boltz residue number - receptor residue number
+
+    Returns:
+        array (atoms, 3), or None if the ligand does not match the template
+    """
+    # Superposition of the Boltz protein on the receptor, on the residues they share
+    ca = atoms[(atoms["label_atom_id"] == "CA") & (atoms["group_PDB"] == "ATOM")]
+    pairs = [(xyz, receptor_ca[key]) for xyz, key in zip(
+        ca[["Cartn_x", "Cartn_y", "Cartn_z"]].to_numpy(),
+        zip(ca["label_seq_id"].astype(int) - residue_offset, ca["label_comp_id"])) if key in receptor_ca]
+    if len(pairs) < 3:
+        raise ValueError("less than 3 C-alpha atoms in common with the receptor (check the residue offset)")
+    mobile, target = (np.array(side) for side in zip(*pairs))
+    rotation, translation = kabsch(mobile, target)
+
+    ligand = atoms[(atoms["group_PDB"] == "HETATM") & (atoms["type_symbol"] != "H")]
+    xyz = ligand[["Cartn_x", "Cartn_y", "Cartn_z"]].to_numpy() @ rotation.T + translation
+
+    # Boltz names the atoms in its own order: match the bonded graph to the template
+    block = "".join(f"{symbol.capitalize()} {x} {y} {z}\n" for symbol, (x, y, z) in zip(ligand["type_symbol"], xyz))
+    mol = Chem.MolFromXYZBlock(f"{len(ligand)}\n\n{block}")
+    if mol is None:
+        return None
+    rdDetermineBonds.DetermineConnectivity(mol)
+    match = element_graph(mol).GetSubstructMatch(template)
+    if len(match) != template.GetNumAtoms():
+        return None
+    return xyz[list(match)]
+
+def kabsch(mobile, target):
+    """
+    Rotation and translation that superpose mobile on target (least squares).
+
+    Returns:
+        tuple: (rotation (3, 3), translation (3,)) such that mobile @ rotation.T + translation ~ target
+    """
+    mobile_center = mobile.mean(axis=0)
+    target_center = target.mean(axis=0)
+    u, _, vt = np.linalg.svd((mobile - mobile_center).T @ (target - target_center))
+    d = np.sign(np.linalg.det(vt.T @ u.T))
+    rotation = vt.T @ np.diag([1.0, 1.0, d]) @ u.T
+    return rotation, target_center - mobile_center @ rotation.T
+
+def symmetry_permutations(template, max_permutations=MAX_PERMUTATIONS):
+    """Atom permutations that map the molecule onto itself, array (permutations, atoms)"""
+    matches = template.GetSubstructMatches(template, uniquify=False, maxMatches=max_permutations)
+    return np.array(matches, dtype=np.intp)
+
+def pairwise_rmsd(modes, samples, permutations):
+    """
+    Symmetry-aware RMSD of every (mode, sample) pair, without superposition.
+
+    Args:
+        modes: array (M, atoms, 3)
+        samples: array (S, atoms, 3)
+        permutations: array (P, atoms) of equivalent atom orders
+
+    Returns:
+        array (M, S): min over the permutations of the RMSD
+    """
+    permuted = modes[:, permutations]                                   # (M, P, atoms, 3)
+    diff = permuted[:, :, None] - samples[None, None]                   # (M, P, S, atoms, 3)
+    msd = np.einsum('mpsax,mpsax->mps', diff, diff) / modes.shape[1]    # (M, P, S)
+    return np.sqrt(msd.min(axis=1))
+
+def compare_ligand(ligand_id, vina_pose_path, boltz_cif_paths, receptor_ca, residue_offset=BOLTZ_RESIDUE_OFFSET):
+    """
+    RMSD matrix between the Vina modes and the Boltz samples of one ligand.
+
+    Returns:
+        tuple: (ligand_id, array (modes, samples) or None, error message or None)
+    """
+    try:
+        smiles, modes = read_vina_modes(vina_pose_path)
+        template = element_graph(Chem.MolFromSmiles(smiles))
+        samples = []
+        for cif_path in boltz_cif_paths:
+            xyz = boltz_ligand_coordinates(read_cif_atoms(cif_path), template, receptor_ca, residue_offset)
+            if xyz is None:
+                return ligand_id, None, f"the Boltz ligand of {Path(cif_path).name} does not match the Vina SMILES"
+            samples.append(xyz)
+        if not samples:
+            return ligand_id, None, "no Boltz structure"
+        return ligand_id, pairwise_rmsd(modes, np.array(samples), symmetry_permutations(template)), None
+    except (OSError, ValueError, KeyError) as e:
+        return ligand_id, None, str(e)
+
+def _compare_ligand_star(arguments):
+    RDLogger.DisableLog('rdApp.*')
+    return compare_ligand(*arguments)
+
+def boltz_structures(results_dir, ligand_id):
+    """Predicted structures of a ligand, sample 0 (the best ranked by Boltz) first"""
+    predictions = Path(results_dir) / f"boltz_results_{ligand_id}" / "predictions" / str(ligand_id)
+    return sorted(predictions.glob(f"{ligand_id}_model_*.cif"), key=lambda path: int(path.stem.rsplit("_", 1)[1]))
+
+def analyze_pose_agreement(input_table, output_table, poses_dir, results_dir, receptor_path, box_config,
+                           threshold=2.0, residue_offset=BOLTZ_RESIDUE_OFFSET, pocket_radius=POCKET_RADIUS,
+                           workers=None, metrics_path=None, progress_interval=10.0, csv_copy=False):
+    """
+    Add the pose agreement columns to the ranking table.
+
+    Args:
+        input_table: Table with an 'id-num' column (e.g. list_with_affinities_boltz.csv)
+        output_table: Output table (can be the input table)
+        poses_dir: Folder of the <id>-vina-out.pdbqt files
+        results_dir: Folder of the boltz_results_<id> folders
+        receptor_path: Receptor used for the docking (.pdbqt or .pdb), whose frame the poses are in
+        box_config: Vina box configuration file (its center defines the pocket)
+        threshold: pose_consensus is True when pose_rmsd_top is below this RMSD (Angstrom)
+        residue_offset: Boltz residue number - receptor residue number
+        pocket_radius: Radius of the pocket residues used for the superposition (Angstrom)
+        workers: Number of processes (None = all CPUs)
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+        csv_copy: Also save a .csv copy when the output is columnar
+    """
+    df = read_table(input_table)
+    box = read_box(box_config)
+    center = np.array([box["center_x"], box["center_y"], box["center_z"]])
+    receptor_ca = read_receptor_ca(receptor_path, center, pocket_radius)
+    print(f"📄 Loaded {len(df)} ligands and {len(receptor_ca)} pocket residues")
+
+    # Ligands with both a docked pose and Boltz structures
+    tasks = []
+    for ligand_id in df['id-num'].astype(str).str.strip():
+        vina_pose_path = os.path.join(poses_dir, f"{ligand_id}-vina-out.pdbqt")
+        cif_paths = boltz_structures(results_dir, ligand_id)
+        if cif_paths and os.path.exists(vina_pose_path):
+            tasks.append((ligand_id, vina_pose_path, [str(path) for path in cif_paths], receptor_ca, residue_offset))
+    print(f"🔍 Comparing the poses of {len(tasks)} ligands with both Vina and Boltz structures")
+
+    results = {}
+    errors = {}
+    progress = Progress("pose-agreement", total=len(tasks), metrics_path=metrics_path, interval=progress_interval)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for ligand_id, rmsd, error in executor.map(_compare_ligand_star, tasks, chunksize=16):
+            if rmsd is None:
+                errors[ligand_id] = error
+            else:
+                results[ligand_id] = rmsd
+            progress.update(1, failed=int(rmsd is None))
+    progress.close()
+
+    for ligand_id, error in list(errors.items())[:20]:
+        print(f"⚠️  Ligand {ligand_id}: {error}")
+    if len(errors) > 20:
+        print(f"⚠️  ... and {len(errors) - 20} more")
+
+    summary = {}
+    for ligand_id, rmsd in results.items():
+        best_mode, best_sample = np.unravel_index(np.argmin(rmsd), rmsd.shape)
+        summary[ligand_id] = (rmsd[0, 0], rmsd[best_mode, best_sample], best_mode + 1, best_sample)
+    ids = df['id-num'].astype(str).str.strip()
+    for i, column in enumerate(["pose_rmsd_top", "pose_rmsd_best", "pose_best_mode", "pose_best_sample"]):
+        df[column] = ids.map({ligand_id: values[i] for ligand_id, values in summary.items()})
+    df["pose_rmsd_top"] = df["pose_rmsd_top"].round(3)
+    df["pose_rmsd_best"] = df["pose_rmsd_best"].round(3)
+    df["pose_best_mode"] = df["pose_best_mode"].astype("Int64")
+    df["pose_best_sample"] = df["pose_best_sample"].astype("Int64")
+    df["pose_consensus"] = (df["pose_rmsd_top"] < threshold).where(df["pose_rmsd_top"].notna())
+
+    write_table(df, output_table, csv_copy=csv_copy)
+    n_consensus = int((df["pose_consensus"] == True).sum())
+    print(f"\n✅ Saved the pose agreement of {len(results)} ligands to {output_table}")
+    print(f"🎯 Vina mode 1 and Boltz sample 0 agree (RMSD < {threshold} Å) for {n_consensus}/{len(results)} ligands")
+    return df
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    # Ranking table, with the columns added in place (sorting.py keeps them)
+    INPUT_TABLE = 'boltz/list_with_affinities_boltz.csv'
+    OUTPUT_TABLE = 'boltz/list_with_affinities_boltz.csv'
+
+    # Vina poses, Boltz results and the receptor the poses were docked in
+    POSES_DIR = 'Autodock-Vina/poses'
+    RESULTS_DIR = 'boltz/boltz-results'
+    RECEPTOR = 'Autodock-Vina/receptor/1H1Q-prepared.pdbqt'
+    BOX_CONFIG = 'Autodock-Vina/receptor/1H1Q-prepared.box.txt'
+
+    # RMSD below which the two methods agree (Angstrom)
+    THRESHOLD = 2.0
+
+    # Processes (None = all CPUs)
+    WORKERS = None
+
+    # Live progress metrics (counts, rate, ETA), updated during the run
+    METRICS_FILE = 'pose-agreement-metrics.json'
+
+    # ===================================================================
+
+    analyze_pose_agreement(INPUT_TABLE, OUTPUT_TABLE, POSES_DIR, RESULTS_DIR, RECEPTOR, BOX_CONFIG, THRESHOLD,
+                           workers=WORKERS, metrics_path=METRICS_FILE)
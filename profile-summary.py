@@ -0,0 +1,101 @@
+"""
+Combined timing breakdown of the profiled workflow steps.
+
+Every step run with --profile writes profiles/<step>-profile.json in the
+folder it runs from (workflow/profiling.py). This script collects them
+all, prints one row per step with where its wall time went (waiting for
+subprocesses, I/O, console, Python) and its CPU times, the totals of the
+run, and the functions that took the most time in the slowest steps, and
+saves the table to profile-summary.csv.
+"""
+
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# Timing columns of the breakdowns, in display order
+TIMING_COLUMNS = ['wall_s', 'subprocess_wait_s', 'io_s', 'console_s', 'python_s', 'python_cpu_s',
+                  'subprocess_cpu_s']
+
+def find_profiles(root_dir, profile_dir_name='profiles'):
+    """All the <step>-profile.json files under root_dir"""
+    return sorted(Path(root_dir).rglob(f"{profile_dir_name}/*-profile.json"))
+
+def load_profiles(paths):
+    """
+    Load the breakdowns; when a step was profiled in several folders, the latest run is kept.
+
+    Returns:
+        list: The breakdown dicts, with their 'path'
+    """
+    profiles = {}
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                profile = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Skipping {path}: {e}")
+            continue
+        profile['path'] = str(path)
+        previous = profiles.get(profile['name'])
+        if previous is None or profile.get('created_at', 0) > previous.get('created_at', 0):
+            profiles[profile['name']] = profile
+    return list(profiles.values())
+
+def summarize_profiles(profiles):
+    """
+    One row per step and a TOTAL row.
+
+    Returns:
+        DataFrame: step, the timing columns and the share of the wall time spent waiting for subprocesses
+    """
+    df = pd.DataFrame([{'step': profile['name'], **{column: profile.get(column, 0.0) for column in TIMING_COLUMNS}}
+                       for profile in profiles])
+    df = df.sort_values('wall_s', ascending=False, ignore_index=True)
+    total = df[TIMING_COLUMNS].sum().to_frame().T
+    total.insert(0, 'step', 'TOTAL')
+    df = pd.concat([df, total], ignore_index=True)
+    df['subprocess_share'] = (df['subprocess_wait_s'] / df['wall_s'].where(df['wall_s'] > 0)).round(3)
+    df[TIMING_COLUMNS] = df[TIMING_COLUMNS].round(2)
+    return df
+
+def print_top_functions(profiles, n_steps=3, n_functions=8):
+    """Functions with the largest cumulative time in the slowest steps"""
+    for profile in sorted(profiles, key=lambda profile: profile.get('wall_s', 0.0), reverse=True)[:n_steps]:
+        print(f"\n🔎 {profile['name']} ({profile['wall_s']:.1f} s, {profile['path']})")
+        for function in profile.get('top_functions', [])[:n_functions]:
+            print(f"   {function['cumulative_s']:10.3f} s cumulative {function['own_s']:10.3f} s own "
+                  f"[{function['category']}] {function['function']}")
+
+def summarize(root_dir='.', output_csv='profile-summary.csv'):
+    """Print and save the combined breakdown of the profiles found under root_dir"""
+    profiles = load_profiles(find_profiles(root_dir))
+    if not profiles:
+        print(f"❌ No profile found under {root_dir} (run the steps with --profile)")
+        return None
+    df = summarize_profiles(profiles)
+
+    print(f"⏱️  Timing breakdown of {len(profiles)} profiled steps (seconds)\n")
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(df.to_string(index=False))
+    print_top_functions(profiles)
+
+    df.to_csv(output_csv, index=False)
+    print(f"\n✅ Saved the summary to {output_csv}")
+    return df
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    # Folder searched (recursively) for the profiles/ folders of the steps
+    ROOT_DIR = '.'
+
+    # Combined table
+    OUTPUT_CSV = 'profile-summary.csv'
+
+    # ===================================================================
+
+    summarize(ROOT_DIR, OUTPUT_CSV)
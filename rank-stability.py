@@ -0,0 +1,325 @@
+"""
+Stability of the top-K of the ranking, by bootstrap resampling.
+
+list-best10.csv is a hard cut on (vina_affinity - boltz_affinity_kcalmol) / 2,
+and both affinities are summaries of several noisy values: vina_affinity is
+the best of the docking modes of <id>-vina-score.txt, and
+boltz_affinity_kcalmol the mean of the three affinity_pred_value* samples of
+Boltz. This step resamples, for every ligand, its modes and its Boltz
+samples with replacement, recomputes the two summaries and the combined
+score, and counts how often the ligand is in the top-K over thousands of
+resamplings. A ligand at p_top_k = 1 stays in whatever the noise; the
+borderline ones (e.g. between 0.1 and 0.9) are those worth re-docking or
+predicting again.
+
+Everything is vectorized over the whole table:
+- The best of m modes drawn with replacement among m sorted modes is the
+  mode of index floor(m * (1 - U^(1/m))) for a uniform U, so one random
+  number per ligand gives its resampled Vina affinity.
+- A ligand whose best possible score (best mode, best Boltz sample) is
+  above the K-th smallest worst possible score can never enter the top-K:
+  it gets p_top_k = 0 without being resampled. Only the remaining
+  candidates (usually a few thousand of a large library) are resampled,
+  by batches of iterations.
+
+The modes and samples are first collected from the score files and the
+Boltz results into a samples table (score-samples.csv), which is reused by
+the next runs.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from workflow.progress import Progress
+from workflow.tables import find_table, read_table, with_format, write_table
+
+# Boltz affinity (log10 IC50 in uM) to kcal/mol, as in boltz-predictions.py
+KCAL_PER_LOG10 = 1.364
+BOLTZ_SAMPLE_COLUMNS = ['affinity_pred_value', 'affinity_pred_value1', 'affinity_pred_value2']
+
+# Rows of the affinity table of a vina-score.txt file: "   1       -9.723          0          0"
+VINA_MODE_PATTERN = re.compile(r'^\s*\d+\s+(-?\d+\.\d+)\s+', re.MULTILINE)
+
+# Number of resampled scores held in memory at once
+BATCH_ELEMENTS = 4_000_000
+
+def read_vina_modes(score_path):
+    """Affinities of all the modes of a vina-score.txt file (empty list if none)"""
+    with open(score_path, 'r') as f:
+        content = f.read()
+    # The mode table follows the -----+------- line
+    table_start = content.find('-----+')
+    if table_start < 0:
+        return []
+    return [float(value) for value in VINA_MODE_PATTERN.findall(content, table_start)]
+
+def boltz_kcalmol(pred_values):
+    return (6 - np.asarray(pred_values, dtype=float)) * KCAL_PER_LOG10
+
+def read_boltz_samples(results_dir):
+    """
+    Boltz affinity samples of every ligand, in kcal/mol.
+
+    Ligands compacted by boltz-compaction.py are read from boltz-summary.csv,
+    the others from their affinity_<id>.json.
+
+    Returns:
+        dict: {ligand id (str): list of kcal/mol values}
+    """
+    samples = {}
+    summary_path = os.path.join(results_dir, "boltz-summary.csv")
+    if os.path.exists(summary_path):
+        df_summary = pd.read_csv(summary_path)
+        columns = [column for column in BOLTZ_SAMPLE_COLUMNS if column in df_summary.columns]
+        values = boltz_kcalmol(df_summary[columns].to_numpy(dtype=float))
+        for ligand_id, row in zip(df_summary["id-num"].astype(str), values):
+            samples[ligand_id] = row[~np.isnan(row)].tolist()
+
+    if os.path.isdir(results_dir):
+        for folder_name in os.listdir(results_dir):
+            if not folder_name.startswith("boltz_results_"):
+                continue
+            ligand_id = folder_name.replace("boltz_results_", "")
+            json_path = os.path.join(results_dir, folder_name, "predictions", ligand_id, f"affinity_{ligand_id}.json")
+            try:
+                with open(json_path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            values = [data[column] for column in BOLTZ_SAMPLE_COLUMNS if column in data]
+            if values:
+                samples[ligand_id] = boltz_kcalmol(values).tolist()
+    return samples
+
+def padded(rows, width):
+    """List of lists to a float array padded with NaN"""
+    array = np.full((len(rows), max(width, 1)), np.nan)
+    for i, row in enumerate(rows):
+        array[i, :len(row)] = row[:width]
+    return array
+
+def collect_score_samples(ranking_table, poses_dir, results_dir, samples_table, max_modes=20, csv_copy=False,
+                          metrics_path=None, progress_interval=10.0):
+    """
+    Gather the Vina modes and Boltz samples of the ligands that have both affinities.
+
+    A ligand without its score file (or Boltz samples) keeps its single value
+    from the ranking table, so it is not resampled on that side.
+
+    Args:
+        ranking_table: Table with vina_affinity and boltz_affinity_kcalmol (list_with_affinities_boltz.csv)
+        poses_dir: Folder of the <id>-vina-score.txt files
+        results_dir: Folder of the boltz_results_<id> folders (and boltz-summary.csv)
+        samples_table: Output table with vina_mode_<i> and boltz_sample_<j> columns (kcal/mol)
+        max_modes: Maximum number of Vina modes kept
+        csv_copy: Also save a .csv copy when the output is columnar
+        metrics_path: Optional JSON file with the live progress metrics (see workflow/progress.py)
+        progress_interval: Seconds between two progress lines
+
+    Returns:
+        DataFrame: The samples table
+    """
+    df = read_table(ranking_table, columns=['id-num', 'vina_affinity', 'boltz_affinity_kcalmol'])
+    df = df[df['vina_affinity'].notna() & df['boltz_affinity_kcalmol'].notna()].reset_index(drop=True)
+    ids = df['id-num'].astype(str).str.strip()
+    print(f"📄 Loaded {len(df)} ligands with both affinities from {ranking_table}")
+
+    boltz_samples = read_boltz_samples(results_dir)
+    vina_rows = []
+    boltz_rows = []
+    progress = Progress("rank-stability", total=len(df), metrics_path=metrics_path, interval=progress_interval,
+                        unit="ligands")
+    for ligand_id, vina_affinity, boltz_affinity in zip(ids, df['vina_affinity'], df['boltz_affinity_kcalmol']):
+        try:
+            modes = read_vina_modes(os.path.join(poses_dir, f"{ligand_id}-vina-score.txt"))
+        except OSError:
+            modes = []
+        if not modes:
+            progress.count("single_vina_value")
+        vina_rows.append(sorted(modes)[:max_modes] or [vina_affinity])
+        samples = boltz_samples.get(ligand_id)
+        if not samples:
+            progress.count("single_boltz_value")
+        boltz_rows.append(samples or [boltz_affinity])
+        progress.update(1)
+    progress.close()
+
+    vina = padded(vina_rows, max(map(len, vina_rows), default=1))
+    boltz = padded(boltz_rows, max(map(len, boltz_rows), default=1))
+    df_samples = pd.concat([
+        df[['id-num']],
+        pd.DataFrame(vina, columns=[f"vina_mode_{i + 1}" for i in range(vina.shape[1])]),
+        pd.DataFrame(boltz, columns=[f"boltz_sample_{j + 1}" for j in range(boltz.shape[1])])
+    ], axis=1)
+    write_table(df_samples, samples_table, csv_copy=csv_copy)
+    print(f"✅ Saved the modes and samples of {len(df_samples)} ligands to {samples_table}")
+    return df_samples
+
+def bootstrap_top_k(vina_modes, boltz_samples, top_k=10, iterations=2000, seed=0):
+    """
+    Probability of every ligand to be in the top-K of (vina - boltz) / 2 under resampling.
+
+    Args:
+        vina_modes: (ligands, modes) affinities, NaN-padded, at least one value per row
+        boltz_samples: (ligands, samples) Boltz kcal/mol values, NaN-padded, at least one value per row
+        top_k: Size of the top (lower score is better)
+        iterations: Number of bootstrap resamplings
+        seed: Seed of the random generator
+
+    Returns:
+        dict: observed_score, p_top_k, score_mean and score_sd (NaN for the ligands
+              that cannot enter the top-K), arrays over the ligands, and the
+              number of resampled candidates
+    """
+    vina_modes = np.sort(np.asarray(vina_modes, dtype=float), axis=1)  # NaN last
+    boltz_samples = np.asarray(boltz_samples, dtype=float)
+    n_ligands = len(vina_modes)
+    n_modes = np.count_nonzero(~np.isnan(vina_modes), axis=1)
+    n_samples = np.count_nonzero(~np.isnan(boltz_samples), axis=1)
+
+    observed = (vina_modes[:, 0] - np.nanmean(boltz_samples, axis=1)) / 2
+    p_top = np.zeros(n_ligands)
+    score_mean = np.full(n_ligands, np.nan)
+    score_sd = np.full(n_ligands, np.nan)
+    if top_k >= n_ligands:
+        p_top[:] = 1.0
+        return {"observed_score": observed, "p_top_k": p_top, "score_mean": score_mean, "score_sd": score_sd,
+                "candidates": 0}
+
+    # Bounds of the resampled score: only the ligands that can beat the K-th worst case are resampled
+    best = (vina_modes[:, 0] - np.nanmax(boltz_samples, axis=1)) / 2
+    worst = (vina_modes[np.arange(n_ligands), n_modes - 1] - np.nanmin(boltz_samples, axis=1)) / 2
+    threshold = np.partition(worst, top_k - 1)[top_k - 1]
+    candidates = np.flatnonzero(best <= threshold)
+
+    modes = vina_modes[candidates]
+    m = n_modes[candidates].astype(float)
+    samples = np.nan_to_num(boltz_samples[candidates])
+    s = n_samples[candidates]
+    # The draws beyond the number of samples of a ligand are masked out of its mean
+    sample_mask = np.arange(samples.shape[1]) < s[:, None]
+
+    rng = np.random.default_rng(seed)
+    n_candidates = len(candidates)
+    counts = np.zeros(n_candidates)
+    total = np.zeros(n_candidates)
+    total_squares = np.zeros(n_candidates)
+    batch = max(1, min(iterations, BATCH_ELEMENTS // max(n_candidates * samples.shape[1], 1)))
+    rows = np.arange(n_candidates)
+    for start in range(0, iterations, batch):
+        b = min(batch, iterations - start)
+        # Best of m modes drawn with replacement
+        mode_index = np.minimum((m * (1 - rng.random((b, n_candidates)) ** (1 / m))).astype(int), m.astype(int) - 1)
+        vina = modes[rows, mode_index]
+        # Mean of s Boltz samples drawn with replacement
+        draws = (rng.random((b, n_candidates, samples.shape[1])) * s[:, None]).astype(int)
+        boltz = (np.take_along_axis(np.broadcast_to(samples, draws.shape), draws, axis=2) * sample_mask).sum(axis=2) / s
+        scores = (vina - boltz) / 2
+
+        kth = np.partition(scores, top_k - 1, axis=1)[:, top_k - 1:top_k]
+        counts += (scores <= kth).sum(axis=0)
+        total += scores.sum(axis=0)
+        total_squares += (scores ** 2).sum(axis=0)
+
+    p_top[candidates] = counts / iterations
+    score_mean[candidates] = total / iterations
+    score_sd[candidates] = np.sqrt(np.maximum(total_squares / iterations - score_mean[candidates] ** 2, 0.0))
+    return {"observed_score": observed, "p_top_k": p_top, "score_mean": score_mean, "score_sd": score_sd,
+            "candidates": n_candidates}
+
+def analyze_rank_stability(samples_table, output_table, top_k=10, iterations=2000, seed=0,
+                           borderline=(0.1, 0.9), csv_copy=False):
+    """
+    Bootstrap the top-K of the samples table and save the ligands that can enter it.
+
+    Args:
+        samples_table: Table written by collect_score_samples
+        output_table: Output table, one row per ligand with p_top_k > 0 or in the observed top-K
+        top_k: Size of the top (10 for list-best10.csv)
+        iterations: Number of bootstrap resamplings
+        seed: Seed of the random generator
+        borderline: p_top_k range of the ligands worth re-docking
+        csv_copy: Also save a .csv copy when the output is columnar
+
+    Returns:
+        DataFrame: The output table
+    """
+    df = read_table(samples_table)
+    vina_columns = [column for column in df.columns if column.startswith('vina_mode_')]
+    boltz_columns = [column for column in df.columns if column.startswith('boltz_sample_')]
+    print(f"📄 Loaded {len(df)} ligands ({len(vina_columns)} Vina modes, {len(boltz_columns)} Boltz samples)")
+
+    result = bootstrap_top_k(df[vina_columns].to_numpy(dtype=float), df[boltz_columns].to_numpy(dtype=float),
+                             top_k, iterations, seed)
+    print(f"🎲 {iterations} resamplings of {result['candidates']} ligands that can enter the top {top_k} "
+          f"(the {len(df) - result['candidates']} others never can)")
+
+    df_out = pd.DataFrame({
+        'id-num': df['id-num'],
+        'combined_score': result['observed_score'].round(4),
+        'p_top_k': result['p_top_k'].round(4),
+        'score_mean': result['score_mean'].round(4),
+        'score_sd': result['score_sd'].round(4)
+    })
+    df_out['observed_rank'] = df_out['combined_score'].rank(method='first').astype(int)
+    df_out['borderline'] = df_out['p_top_k'].between(*borderline, inclusive='neither')
+    df_out = df_out[(df_out['p_top_k'] > 0) | (df_out['observed_rank'] <= top_k)]
+    df_out = df_out.sort_values(['p_top_k', 'observed_rank'], ascending=[False, True], ignore_index=True)
+    write_table(df_out, output_table, csv_copy=csv_copy)
+
+    stable = df_out[df_out['p_top_k'] >= borderline[1]]
+    to_redock = df_out[df_out['borderline']]
+    unstable_top = df_out[(df_out['observed_rank'] <= top_k) & (df_out['p_top_k'] < borderline[1])]
+    print(f"\n✅ Saved {len(df_out)} ligands to {output_table}")
+    print(f"🔒 {len(stable)} ligands are in the top {top_k} in at least {borderline[1]:.0%} of the resamplings")
+    print(f"⚠️  {len(unstable_top)} ligands of the observed top {top_k} are not")
+    if len(to_redock):
+        print(f"\n🔁 Borderline ligands worth re-docking ({borderline[0]:.0%} < p_top_k < {borderline[1]:.0%}):")
+        print(to_redock[['id-num', 'observed_rank', 'combined_score', 'score_sd', 'p_top_k']].to_string(index=False))
+    return df_out
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths here
+    # ===================================================================
+
+    # Ranking table with Vina and Boltz affinities, and where their modes and samples are
+    RANKING_TABLE = 'boltz/list_with_affinities_boltz.csv'
+    POSES_DIR = 'Autodock-Vina/poses'
+    RESULTS_DIR = 'boltz/boltz-results'
+
+    # Modes and samples collected once; set REBUILD_SAMPLES after new dockings or predictions
+    SAMPLES_TABLE = 'score-samples.csv'
+    REBUILD_SAMPLES = False
+
+    # Output table
+    OUTPUT_TABLE = 'rank-stability.csv'
+
+    # Size of the top (10 for list-best10.csv), resamplings and seed
+    TOP_K = 10
+    ITERATIONS = 2000
+    SEED = 0
+
+    # p_top_k range of the borderline ligands worth re-docking
+    BORDERLINE = (0.1, 0.9)
+
+    # Output format: "csv", "parquet" or "arrow" (a .csv copy is kept if EXPORT_CSV)
+    TABLE_FORMAT = 'csv'
+    EXPORT_CSV = True
+
+    # Live progress metrics of the collection of the samples
+    METRICS_FILE = 'rank-stability-metrics.json'
+
+    # ===================================================================
+
+    samples_table = find_table(with_format(SAMPLES_TABLE, TABLE_FORMAT))
+    if samples_table is None or REBUILD_SAMPLES:
+        samples_table = with_format(SAMPLES_TABLE, TABLE_FORMAT)
+        collect_score_samples(RANKING_TABLE, POSES_DIR, RESULTS_DIR, samples_table, csv_copy=EXPORT_CSV,
+                              metrics_path=METRICS_FILE)
+    analyze_rank_stability(samples_table, with_format(OUTPUT_TABLE, TABLE_FORMAT), TOP_K, ITERATIONS, SEED,
+                           BORDERLINE, csv_copy=EXPORT_CSV)
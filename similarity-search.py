@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Similarity search over the compound library for hit expansion.
+
+The library is indexed once as bit-packed Morgan fingerprints (one row of
+uint64 words per molecule) in a memory-mapped file, sorted by number of set
+bits. Queries compute Tanimoto similarities with a vectorized popcount and
+return the top-k nearest analogs of each hit and/or all the analogs above a
+similarity threshold. Since Tanimoto(a, b) <= min(|a|, |b|) / max(|a|, |b|),
+only the popcount ranges that can still beat the current k-th best (or the
+threshold) are scanned. The result (smiles, id-num) can be passed directly
+to the ligand preparation.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, RDLogger
+from rdkit.Chem import rdFingerprintGenerator
+
+from workflow.tables import TableWriter, iter_table_chunks, read_table, write_table
+
+# Files of an index directory
+FINGERPRINTS_FILE = "fingerprints.u64"
+POPCOUNTS_FILE = "popcounts.u16"
+POSITIONS_FILE = "positions.i64"
+MOLECULES_FILE = "molecules.csv"
+METADATA_FILE = "metadata.json"
+
+def morgan_generator(radius, n_bits):
+    return rdFingerprintGenerator.GetMorganGenerator(radius=radius, fpSize=n_bits)
+
+def pack_fingerprints(smiles_list, generator, n_bits):
+    """
+    Bit-packed fingerprints of a list of SMILES.
+
+    Returns:
+        tuple: (uint64 array of shape (n, n_bits // 64), bool array of valid molecules)
+    """
+    packed = np.zeros((len(smiles_list), n_bits // 8), dtype=np.uint8)
+    valid = np.zeros(len(smiles_list), dtype=bool)
+    for i, smiles in enumerate(smiles_list):
+        mol = Chem.MolFromSmiles(smiles) if isinstance(smiles, str) else None
+        if mol is None:
+            continue
+        packed[i] = np.packbits(generator.GetFingerprintAsNumPy(mol).astype(bool))
+        valid[i] = True
+    return packed.view(np.uint64), valid
+
+def popcount(words):
+    """Number of set bits of each row of a uint64 array"""
+    return np.bitwise_count(words).sum(axis=-1, dtype=np.uint16)
+
+def build_index(library_table, index_dir, radius=2, n_bits=2048, chunksize=100000):
+    """
+    Fingerprint the whole library into an index directory.
+
+    Args:
+        library_table: Table with 'smiles' and 'id-num' columns (.csv, .parquet or .arrow)
+        index_dir: Output directory
+        radius: Morgan radius
+        n_bits: Fingerprint size (multiple of 64)
+        chunksize: Number of molecules fingerprinted at a time
+
+    Returns:
+        dict: Index metadata
+    """
+    if n_bits % 64:
+        raise ValueError("n_bits must be a multiple of 64")
+    os.makedirs(index_dir, exist_ok=True)
+    generator = morgan_generator(radius, n_bits)
+
+    # Invalid SMILES keep an empty fingerprint (never returned as analogs)
+    RDLogger.DisableLog('rdApp.*')
+    n_molecules = 0
+    n_invalid = 0
+    unsorted_path = os.path.join(index_dir, FINGERPRINTS_FILE + ".unsorted")
+    popcounts = []
+    with open(unsorted_path, 'wb') as fingerprints, \
+         TableWriter(os.path.join(index_dir, MOLECULES_FILE)) as molecules:
+        for chunk in iter_table_chunks(library_table, chunksize, columns=['smiles', 'id-num']):
+            words, valid = pack_fingerprints(chunk['smiles'].tolist(), generator, n_bits)
+            fingerprints.write(words.tobytes())
+            popcounts.append(popcount(words))
+            molecules.write(chunk)
+            n_molecules += len(chunk)
+            n_invalid += int((~valid).sum())
+            print(f"   {n_molecules} molecules indexed")
+    RDLogger.EnableLog('rdApp.*')
+
+    # Sort the fingerprints by popcount (positions maps back to the library order)
+    popcounts = np.concatenate(popcounts) if popcounts else np.empty(0, dtype=np.uint16)
+    order = np.argsort(popcounts, kind='stable').astype(np.int64)
+    unsorted = np.memmap(unsorted_path, dtype=np.uint64, mode='r', shape=(n_molecules, n_bits // 64))
+    with open(os.path.join(index_dir, FINGERPRINTS_FILE), 'wb') as fingerprints:
+        for start in range(0, n_molecules, chunksize):
+            fingerprints.write(np.asarray(unsorted[order[start:start + chunksize]]).tobytes())
+    del unsorted
+    os.remove(unsorted_path)
+    popcounts[order].tofile(os.path.join(index_dir, POPCOUNTS_FILE))
+    order.tofile(os.path.join(index_dir, POSITIONS_FILE))
+
+    metadata = {
+        "library": os.path.abspath(library_table),
+        "library_mtime": os.path.getmtime(library_table),
+        "n_molecules": n_molecules,
+        "radius": radius,
+        "n_bits": n_bits
+    }
+    with open(os.path.join(index_dir, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"✅ Indexed {n_molecules} molecules ({n_invalid} invalid SMILES) in {index_dir}/")
+    return metadata
+
+def load_index(index_dir):
+    """
+    Memory-map an index (nothing is read until the fingerprints are scanned).
+
+    Returns:
+        tuple: (metadata dict, fingerprints memmap (n, words), popcounts memmap (n,),
+                library positions memmap (n,)), all sorted by popcount
+    """
+    with open(os.path.join(index_dir, METADATA_FILE), 'r') as f:
+        metadata = json.load(f)
+    n_words = metadata["n_bits"] // 64
+    fingerprints = np.memmap(os.path.join(index_dir, FINGERPRINTS_FILE), dtype=np.uint64, mode='r',
+                             shape=(metadata["n_molecules"], n_words))
+    popcounts = np.memmap(os.path.join(index_dir, POPCOUNTS_FILE), dtype=np.uint16, mode='r',
+                          shape=(metadata["n_molecules"],))
+    positions = np.memmap(os.path.join(index_dir, POSITIONS_FILE), dtype=np.int64, mode='r',
+                          shape=(metadata["n_molecules"],))
+    return metadata, fingerprints, popcounts, positions
+
+def index_is_current(index_dir, library_table):
+    """Whether the index exists and was built from the current library file"""
+    metadata_path = os.path.join(index_dir, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return False
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+    return (metadata["library"] == os.path.abspath(library_table)
+            and metadata["library_mtime"] == os.path.getmtime(library_table))
+
+def search_one(query, fingerprints, positions, bucket_starts, top_k, threshold, block_size):
+    """
+    Analogs of one packed query fingerprint in a popcount-sorted index.
+
+    The popcount buckets are visited by decreasing Tanimoto upper bound and
+    the scan stops as soon as no remaining bucket can reach the threshold or
+    the current k-th best similarity.
+
+    Returns:
+        tuple: (library positions, similarities) sorted by decreasing
+               similarity, ties in library order
+    """
+    query_count = int(popcount(query))
+    best_positions = np.empty(0, dtype=np.int64)
+    best_similarities = np.empty(0, dtype=np.float32)
+    if query_count == 0:
+        return best_positions, best_similarities
+
+    counts = np.arange(1, len(bucket_starts) - 1)
+    bounds = np.minimum(counts, query_count) / np.maximum(counts, query_count)
+    for bucket in np.argsort(-bounds, kind='stable'):
+        count, bound = counts[bucket], bounds[bucket]
+        if threshold is not None and bound < threshold:
+            break
+        full = top_k is not None and len(best_similarities) == top_k
+        if full and bound < best_similarities[-1]:
+            break
+
+        for start in range(bucket_starts[count], bucket_starts[count + 1], block_size):
+            stop = min(start + block_size, bucket_starts[count + 1])
+            common = popcount(np.asarray(fingerprints[start:stop]) & query).astype(np.float32)
+            similarities = common / np.float32(count + query_count - common)
+
+            keep = similarities >= threshold if threshold is not None else similarities > 0
+            if full:
+                keep &= similarities >= best_similarities[-1]
+            if not keep.any():
+                continue
+            best_positions = np.concatenate([best_positions, positions[start:stop][keep]])
+            best_similarities = np.concatenate([best_similarities, similarities[keep]])
+
+            # Highest similarity first, ties in library order
+            order = np.lexsort((best_positions, -best_similarities))[:top_k]
+            best_positions, best_similarities = best_positions[order], best_similarities[order]
+            full = top_k is not None and len(best_similarities) == top_k
+    return best_positions, best_similarities
+
+def search(index_dir, query_smiles, top_k=1000, threshold=None, block_size=20000):
+    """
+    Find the analogs of each query molecule in the library.
+
+    Args:
+        index_dir: Index built by build_index
+        query_smiles: List of query SMILES
+        top_k: Number of nearest analogs kept per query (None = no limit)
+        threshold: Minimum Tanimoto similarity (None = no threshold)
+        block_size: Number of library molecules scanned at a time
+
+    Returns:
+        list: For each query, (library positions, similarities) sorted by
+              decreasing similarity
+    """
+    if top_k is None and threshold is None:
+        raise ValueError("Give top_k and/or threshold")
+    metadata, fingerprints, popcounts, positions = load_index(index_dir)
+    generator = morgan_generator(metadata["radius"], metadata["n_bits"])
+    queries, _ = pack_fingerprints(list(query_smiles), generator, metadata["n_bits"])
+
+    # First row of each popcount value in the sorted index
+    bucket_starts = np.searchsorted(popcounts, np.arange(metadata["n_bits"] + 2))
+    return [search_one(query, fingerprints, positions, bucket_starts, top_k, threshold, block_size)
+            for query in queries]
+
+def read_rows(molecules_table, positions, chunksize=1000000):
+    """Rows of the index molecule table at the given positions (in position order)"""
+    wanted = np.unique(positions)
+    rows = []
+    offset = 0
+    for chunk in iter_table_chunks(molecules_table, chunksize):
+        inside = wanted[(wanted >= offset) & (wanted < offset + len(chunk))]
+        if len(inside):
+            rows.append(chunk.iloc[inside - offset])
+        offset += len(chunk)
+    return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=['smiles', 'id-num'])
+
+def find_analogs(library_table, index_dir, query_table, output_table, top_k=1000, threshold=None,
+                 exclude_queries=True, block_size=20000):
+    """
+    Search the analogs of the hits of query_table and save them as a ligand list.
+
+    Each analog is listed once, with its best similarity and the hit it is
+    closest to. The output starts with the smiles and id-num columns, as
+    expected by the ligand preparation.
+
+    Args:
+        library_table: Library with 'smiles' and 'id-num' (the index is (re)built if needed)
+        index_dir: Directory of the fingerprint index
+        query_table: Hits with 'smiles' and 'id-num' (e.g. list-best10.csv)
+        output_table: Output list of analogs (.csv, .parquet or .arrow)
+        top_k: Number of nearest analogs per hit (None = no limit)
+        threshold: Minimum Tanimoto similarity (None = no threshold)
+        exclude_queries: Do not list the hits themselves
+        block_size: Number of library molecules scanned at a time
+
+    Returns:
+        DataFrame: The analogs, by decreasing similarity
+    """
+    if not index_is_current(index_dir, library_table):
+        print(f"📇 Building the fingerprint index of {library_table}")
+        build_index(library_table, index_dir)
+
+    df_queries = read_table(query_table, columns=['smiles', 'id-num'])
+    print(f"🔎 Searching analogs of {len(df_queries)} hits "
+          f"(top {top_k if top_k is not None else 'all'}, threshold {threshold})")
+    results = search(index_dir, df_queries['smiles'].tolist(), top_k, threshold, block_size)
+
+    hits = pd.concat([
+        pd.DataFrame({'position': positions, 'tanimoto': similarities, 'query_id': query_id})
+        for (positions, similarities), query_id in zip(results, df_queries['id-num'])
+    ], ignore_index=True)
+
+    # One row per analog: keep the closest hit
+    hits = hits.sort_values(['tanimoto', 'position'], ascending=[False, True], kind='stable')
+    hits = hits.drop_duplicates('position').reset_index(drop=True)
+
+    molecules = read_rows(os.path.join(index_dir, MOLECULES_FILE), hits['position'].to_numpy(), block_size)
+    molecules.index = np.unique(hits['position'].to_numpy())
+    df_analogs = molecules.loc[hits['position']].reset_index(drop=True)
+    df_analogs['query_id'] = hits['query_id'].to_numpy()
+    df_analogs['tanimoto'] = hits['tanimoto'].round(4).to_numpy()
+
+    if exclude_queries:
+        df_analogs = df_analogs[~df_analogs['id-num'].isin(df_queries['id-num'])].reset_index(drop=True)
+
+    write_table(df_analogs, output_table)
+    print(f"✅ Saved {len(df_analogs)} analogs to {output_table}")
+    return df_analogs
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths and search here
+    # ===================================================================
+
+    # Compound library (smiles, id-num) and the directory of its fingerprint index
+    LIBRARY_TABLE = 'Autodock-Vina/ligands/list.csv'
+    INDEX_DIR = 'similarity-index'
+
+    # Hits whose analogs are searched
+    QUERY_TABLE = 'list-best10.csv'
+
+    # Nearest analogs kept per hit and/or minimum Tanimoto similarity (None to disable)
+    TOP_K = 1000
+    THRESHOLD = None
+
+    # List of analogs, ready for ligands-preparation.py
+    OUTPUT_TABLE = 'analogs.csv'
+
+    # ===================================================================
+
+    find_analogs(LIBRARY_TABLE, INDEX_DIR, QUERY_TABLE, OUTPUT_TABLE, top_k=TOP_K, threshold=THRESHOLD)
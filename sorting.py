@@ -1,99 +1,471 @@
+import heapq
+import os
+import tempfile
+from bisect import bisect_right
+
 import pandas as pd
 import numpy as np
 
-# Load the CSV
-df = pd.read_csv('boltz/list_with_affinities_boltz.csv')
+from workflow.profiling import profile_dir_from_argv, profiled
+from workflow.tables import TableWriter, iter_table_chunks, read_table, table_columns, write_table, with_format
 
-# Select columns to keep
-columns_to_keep = ['smiles', 'id-num', 'vina_affinity', 'boltz_affinity_kcalmol', 
+# Columns written to list-sorted.csv and list-best10.csv
+columns_to_keep = ['smiles', 'id-num', 'vina_affinity', 'boltz_affinity_kcalmol',
                    'avg_affinity_pred_value', 'avg_affinity_probability_binary']
-df_filtered = df[columns_to_keep].copy()
-
-print(f"Total molecules: {len(df)}")
-print(f"Molecules with Vina affinity: {df['vina_affinity'].notna().sum()}")
-print(f"Molecules with Boltz affinity: {df['boltz_affinity_kcalmol'].notna().sum()}")
-print(f"Molecules with both affinities: {(df['vina_affinity'].notna() & df['boltz_affinity_kcalmol'].notna()).sum()}")
-
-# Filter molecules that have both affinities
-df_both = df_filtered[(df_filtered['vina_affinity'].notna()) & 
-                      (df_filtered['boltz_affinity_kcalmol'].notna())].copy()
-
-# Calculate combined score by averaging
-if len(df_both) > 0:
-    vina_min = df_both['vina_affinity'].min()
-    vina_max = df_both['vina_affinity'].max()
-    boltz_min = df_both['boltz_affinity_kcalmol'].min()
-    boltz_max = df_both['boltz_affinity_kcalmol'].max()
-    
-    # For Vina: more negative is better, so we invert it
-    # For Boltz: higher is better, so we keep it positive
-    # Average them: (vina_affinity + (-boltz_affinity)) / 2
-    # This means: lower (more negative) combined score is better
-    df_both['combined_score'] = (df_both['vina_affinity'] - df_both['boltz_affinity_kcalmol']) / 2
-    
-    # Sort by combined score (lowest/most negative = best)
-    df_both_sorted = df_both.sort_values('combined_score')
-    
-    # Get molecules without both affinities
-    df_missing = df_filtered[~((df_filtered['vina_affinity'].notna()) & 
-                               (df_filtered['boltz_affinity_kcalmol'].notna()))].copy()
-    
-    # Combine sorted and missing
-    df_sorted = pd.concat([df_both_sorted, df_missing], ignore_index=True)
-else:
-    df_sorted = df_filtered.copy()
-
-# Get top 10
-df_best10 = df_sorted.head(10)[columns_to_keep].copy()
-
-# Save results
-df_sorted.to_csv('list-sorted.csv', index=False)
-df_best10.to_csv('list-best10.csv', index=False)
-
-print(f"\n✓ Saved sorted list with {len(df_sorted)} molecules to 'list-sorted.csv'")
-print(f"✓ Saved top 10 molecules to 'list-best10.csv'")
-
-# Print data ranges
-if len(df_both) > 0:
-    print("\n=== DATA RANGES ===")
-    print(f"Vina affinity range: {vina_min:.3f} to {vina_max:.3f}")
-    print(f"Boltz affinity range: {boltz_min:.3f} to {boltz_max:.3f}")
-
-print("\n=== SORTING FORMULA EXPLANATION ===")
-print("SIMPLE AVERAGING METHOD:\n")
-print("1. Vina affinity: More negative = better binding (e.g., -9.5 is better than -8.0)")
-print("2. Boltz affinity: Higher values = better binding (e.g., 8.0 is better than 6.5)")
-print()
-print("3. Combined score formula:")
-print("   combined_score = (vina_affinity - boltz_affinity_kcalmol) / 2")
-print()
-print("   Why subtract Boltz?")
-print("   - We want to reward LOW vina (e.g., -9.5)")
-print("   - We want to reward HIGH boltz (e.g., 8.0)")
-print("   - Subtracting high boltz makes the score MORE negative (better)")
-print()
-print("   Example:")
-print("   - Molecule A: Vina=-9.5, Boltz=8.0 → Score=(-9.5-8.0)/2 = -8.75")
-print("   - Molecule B: Vina=-8.0, Boltz=6.5 → Score=(-8.0-6.5)/2 = -7.25")
-print("   - Molecule A wins (more negative score)")
-print()
-print("4. Molecules are sorted by combined score (most negative = best)")
-print("5. Molecules missing either value are placed at the end")
-
-print("\n=== TOP 10 MOLECULES ===")
-pd.set_option('display.max_colwidth', None)
-pd.set_option('display.width', None)
-print(df_best10[columns_to_keep].to_string(index=True))
-
-# Show statistics of the top 10
-if len(df_both) > 0:
-    print("\n=== STATISTICS OF TOP 10 ===")
-    molecules_with_both = df_both_sorted.head(10)
-    print(f"Total molecules with both affinities: {len(df_both)}")
-    print(f"Best combined score: {molecules_with_both['combined_score'].iloc[0]:.3f}")
-    if len(molecules_with_both) >= 10:
-        print(f"10th best combined score: {molecules_with_both['combined_score'].iloc[9]:.3f}")
-    print(f"Average Vina in top 10: {molecules_with_both['vina_affinity'].mean():.3f}")
-    print(f"Average Boltz in top 10: {molecules_with_both['boltz_affinity_kcalmol'].mean():.3f}")
-    print(f"Average pred_value in top 10: {molecules_with_both['avg_affinity_pred_value'].mean():.3f}")
-    print(f"Average probability in top 10: {molecules_with_both['avg_affinity_probability_binary'].mean():.3f}")
+
+# Columns also written when the input table has them (pose-agreement.py, interaction-fingerprints.py)
+optional_columns = ['pose_rmsd_top', 'pose_consensus', 'hinge_hbond']
+
+def kept_columns(input_csv):
+    """columns_to_keep and the optional columns present in the input table"""
+    present = set(table_columns(input_csv))
+    return columns_to_keep + [column for column in optional_columns if column in present]
+
+# Direction of each objective: +1 if lower is better, -1 if higher is better
+OBJECTIVE_DIRECTIONS = {
+    'vina_affinity': 1,
+    'boltz_affinity_kcalmol': -1,
+    'avg_affinity_probability_binary': -1
+}
+
+# Default weights of the fusion strategies (rank, zscore, robust, weighted)
+DEFAULT_WEIGHTS = {
+    'vina_affinity': 1.0,
+    'boltz_affinity_kcalmol': 1.0
+}
+DEFAULT_WEIGHTED_SUM = {
+    'vina_affinity': 1.0,
+    'boltz_affinity_kcalmol': 1.0,
+    'avg_affinity_probability_binary': 0.5
+}
+
+def oriented(df, column):
+    """Objective values as a float array where lower is always better"""
+    return OBJECTIVE_DIRECTIONS[column] * df[column].to_numpy(dtype=float)
+
+def fuse(df, weights, scale):
+    """
+    Weighted mean of the scaled, oriented objectives.
+
+    Args:
+        df: DataFrame with the objective columns
+        weights: Dict {column: weight}
+        scale: Function mapping an oriented array to a comparable scale
+    """
+    total = np.zeros(len(df))
+    weight_sum = np.zeros(len(df))
+    for column, weight in weights.items():
+        values = scale(oriented(df, column))
+        # A missing value (e.g. no probability) is left out of the mean of its row, since
+        # no constant stands for "average" on every scale (0 for z-scores, 0.5 for ranks)
+        present = ~np.isnan(values)
+        total += weight * np.where(present, values, 0.0)
+        weight_sum += weight * present
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / weight_sum
+
+def zscore(values):
+    std = np.nanstd(values)
+    return (values - np.nanmean(values)) / (std if std > 0 else 1.0)
+
+def robust_scale(values):
+    median = np.nanmedian(values)
+    mad = 1.4826 * np.nanmedian(np.abs(values - median))
+    return (values - median) / (mad if mad > 0 else 1.0)
+
+def rank_scale(values):
+    # Average rank of ties, normalized to (0, 1]
+    return pd.Series(values).rank(method='average').to_numpy() / np.count_nonzero(~np.isnan(values))
+
+def score_average(df, weights=None):
+    """Simple averaging: (vina_affinity - boltz_affinity_kcalmol) / 2"""
+    return ((df['vina_affinity'] - df['boltz_affinity_kcalmol']) / 2).to_numpy()
+
+def score_rank(df, weights=None):
+    """Rank averaging of the objectives"""
+    return fuse(df, weights or DEFAULT_WEIGHTS, rank_scale)
+
+def score_zscore(df, weights=None):
+    """Z-score fusion of the objectives"""
+    return fuse(df, weights or DEFAULT_WEIGHTS, zscore)
+
+def score_robust(df, weights=None):
+    """Robust-scaled (median/MAD) fusion of the objectives"""
+    return fuse(df, weights or DEFAULT_WEIGHTS, robust_scale)
+
+def score_weighted(df, weights=None):
+    """Weighted sum of z-scores, including avg_affinity_probability_binary"""
+    return fuse(df, weights or DEFAULT_WEIGHTED_SUM, zscore)
+
+def pareto_fronts(f1, f2):
+    """
+    Non-dominated sorting of two objectives (both minimized) in O(n log n).
+
+    Points are visited by increasing f1; a point dominated by a front is
+    always dominated by its last member, and the last f2 of the fronts is
+    increasing with the front index, so the front of each point is found
+    by binary search.
+
+    Returns:
+        ndarray: Front index of every point (0 = non-dominated)
+    """
+    f1 = np.asarray(f1, dtype=float)
+    f2 = np.asarray(f2, dtype=float)
+    order = np.lexsort((f2, f1))
+    s1 = f1[order]
+    s2 = f2[order]
+
+    # Identical points do not dominate each other: only new points open a slot
+    is_new = np.ones(len(order), dtype=bool)
+    is_new[1:] = (s1[1:] != s1[:-1]) | (s2[1:] != s2[:-1])
+
+    fronts_sorted = np.empty(len(order), dtype=int)
+    last_f2 = []
+    k = 0
+    for i, (value, new_point) in enumerate(zip(s2.tolist(), is_new.tolist())):
+        if new_point:
+            k = bisect_right(last_f2, value)
+            if k == len(last_f2):
+                last_f2.append(value)
+            else:
+                last_f2[k] = value
+        fronts_sorted[i] = k
+
+    fronts = np.empty(len(order), dtype=int)
+    fronts[order] = fronts_sorted
+    return fronts
+
+def score_pareto(df, weights=None):
+    """Pareto fronts of Vina and Boltz (adds pareto_front), ties broken by the simple average"""
+    df['pareto_front'] = pareto_fronts(oriented(df, 'vina_affinity'),
+                                       oriented(df, 'boltz_affinity_kcalmol')) + 1
+    return score_average(df)
+
+RANKING_STRATEGIES = {
+    'average': score_average,
+    'rank': score_rank,
+    'zscore': score_zscore,
+    'robust': score_robust,
+    'weighted': score_weighted,
+    'pareto': score_pareto
+}
+
+def rank_molecules(df_both, strategy='average', weights=None):
+    """
+    Score and sort the molecules that have both affinities.
+
+    Args:
+        df_both: DataFrame with vina_affinity and boltz_affinity_kcalmol present
+        strategy: Name of the consensus strategy (see RANKING_STRATEGIES)
+        weights: Optional dict {column: weight} for the fusion strategies
+
+    Returns:
+        DataFrame: Molecules sorted from best to worst, with a combined_score
+                   column (lower is better) and pareto_front for 'pareto'
+    """
+    if strategy not in RANKING_STRATEGIES:
+        raise ValueError(f"Unknown ranking strategy '{strategy}'. Choose from: {', '.join(RANKING_STRATEGIES)}")
+
+    df_both = df_both.copy()
+    df_both['combined_score'] = RANKING_STRATEGIES[strategy](df_both, weights)
+
+    # Stable sort: ties keep the order of the input table
+    if strategy == 'pareto':
+        order = np.lexsort((df_both['combined_score'].to_numpy(), df_both['pareto_front'].to_numpy()))
+    else:
+        order = np.argsort(df_both['combined_score'].to_numpy(), kind='stable')
+    return df_both.iloc[order]
+
+def print_formula_explanation(strategy, weights):
+    print("\n=== SORTING FORMULA EXPLANATION ===")
+    if strategy != 'average':
+        print(f"{strategy.upper()} CONSENSUS METHOD:\n")
+        print(f"   {RANKING_STRATEGIES[strategy].__doc__}")
+        if strategy in ('rank', 'zscore', 'robust', 'weighted'):
+            used = weights or (DEFAULT_WEIGHTED_SUM if strategy == 'weighted' else DEFAULT_WEIGHTS)
+            print(f"   Weights: {used}")
+        print("   combined_score: lower = better")
+        if strategy == 'pareto':
+            print("   pareto_front: 1 = non-dominated (no molecule has both a better Vina and Boltz)")
+        print("\nMolecules missing either value are placed at the end")
+        return
+
+    print("SIMPLE AVERAGING METHOD:\n")
+    print("1. Vina affinity: More negative = better binding (e.g., -9.5 is better than -8.0)")
+    print("2. Boltz affinity: Higher values = better binding (e.g., 8.0 is better than 6.5)")
+    print()
+    print("3. Combined score formula:")
+    print("   combined_score = (vina_affinity - boltz_affinity_kcalmol) / 2")
+    print()
+    print("   Why subtract Boltz?")
+    print("   - We want to reward LOW vina (e.g., -9.5)")
+    print("   - We want to reward HIGH boltz (e.g., 8.0)")
+    print("   - Subtracting high boltz makes the score MORE negative (better)")
+    print()
+    print("   Example:")
+    print("   - Molecule A: Vina=-9.5, Boltz=8.0 → Score=(-9.5-8.0)/2 = -8.75")
+    print("   - Molecule B: Vina=-8.0, Boltz=6.5 → Score=(-8.0-6.5)/2 = -7.25")
+    print("   - Molecule A wins (more negative score)")
+    print()
+    print("4. Molecules are sorted by combined score (most negative = best)")
+    print("5. Molecules missing either value are placed at the end")
+
+def print_input_counts(n_total, n_vina, n_boltz, n_both):
+    print(f"Total molecules: {n_total}")
+    print(f"Molecules with Vina affinity: {n_vina}")
+    print(f"Molecules with Boltz affinity: {n_boltz}")
+    print(f"Molecules with both affinities: {n_both}")
+
+def print_ranking_report(df_best10, top_both, n_both, ranges, strategy, weights, top_n):
+    """
+    Print the data ranges, the formula and the statistics of the top N.
+
+    Args:
+        df_best10: The top_n rows of the sorted list
+        top_both: The top_n rows among the molecules with both affinities
+        n_both: Number of molecules with both affinities
+        ranges: (vina_min, vina_max, boltz_min, boltz_max) of those molecules
+    """
+    if n_both > 0:
+        vina_min, vina_max, boltz_min, boltz_max = ranges
+        print("\n=== DATA RANGES ===")
+        print(f"Vina affinity range: {vina_min:.3f} to {vina_max:.3f}")
+        print(f"Boltz affinity range: {boltz_min:.3f} to {boltz_max:.3f}")
+
+    print_formula_explanation(strategy, weights)
+
+    print(f"\n=== TOP {top_n} MOLECULES ===")
+    pd.set_option('display.max_colwidth', None)
+    pd.set_option('display.width', None)
+    print(df_best10.to_string(index=True))
+
+    # Show statistics of the top N
+    if n_both > 0:
+        print(f"\n=== STATISTICS OF TOP {top_n} ===")
+        molecules_with_both = top_both
+        print(f"Total molecules with both affinities: {n_both}")
+        print(f"Best combined score: {molecules_with_both['combined_score'].iloc[0]:.3f}")
+        if len(molecules_with_both) >= top_n:
+            print(f"{top_n}th best combined score: {molecules_with_both['combined_score'].iloc[top_n - 1]:.3f}")
+        print(f"Average Vina in top {top_n}: {molecules_with_both['vina_affinity'].mean():.3f}")
+        print(f"Average Boltz in top {top_n}: {molecules_with_both['boltz_affinity_kcalmol'].mean():.3f}")
+        print(f"Average pred_value in top {top_n}: {molecules_with_both['avg_affinity_pred_value'].mean():.3f}")
+        print(f"Average probability in top {top_n}: {molecules_with_both['avg_affinity_probability_binary'].mean():.3f}")
+
+def sort_candidates(input_csv, sorted_csv, best_csv, strategy='average', weights=None, top_n=10,
+                    csv_copy=False):
+    """
+    Rank all molecules and save the sorted list and the best candidates.
+
+    Args:
+        input_csv: Table with Vina and Boltz affinities
+        sorted_csv: Output path of the full sorted list
+        best_csv: Output path of the top_n molecules
+        strategy: Name of the consensus strategy (see RANKING_STRATEGIES)
+        weights: Optional dict {column: weight} for the fusion strategies
+        top_n: Number of molecules saved in best_csv
+        csv_copy: Also save .csv copies when the outputs are columnar
+    """
+    # Load only the columns used for the ranking (.csv, .parquet or .arrow)
+    columns = kept_columns(input_csv)
+    df = read_table(input_csv, columns=columns)
+
+    # Filter molecules that have both affinities
+    has_both = (df['vina_affinity'].notna()) & (df['boltz_affinity_kcalmol'].notna())
+    print_input_counts(len(df), df['vina_affinity'].notna().sum(), df['boltz_affinity_kcalmol'].notna().sum(),
+                       has_both.sum())
+    df_both = df[has_both]
+
+    # Calculate combined score with the selected strategy
+    ranges = None
+    df_both_sorted = None
+    if len(df_both) > 0:
+        ranges = (df_both['vina_affinity'].min(), df_both['vina_affinity'].max(),
+                  df_both['boltz_affinity_kcalmol'].min(), df_both['boltz_affinity_kcalmol'].max())
+
+        df_both_sorted = rank_molecules(df_both, strategy, weights)
+
+        # Combine sorted and molecules without both affinities
+        df_sorted = pd.concat([df_both_sorted, df[~has_both]], ignore_index=True)
+    else:
+        df_sorted = df
+
+    # Get top N
+    df_best10 = df_sorted.head(top_n)[columns].copy()
+
+    # Save results
+    write_table(df_sorted, sorted_csv, csv_copy=csv_copy)
+    write_table(df_best10, best_csv, csv_copy=csv_copy)
+
+    print(f"\n✓ Saved sorted list with {len(df_sorted)} molecules to '{sorted_csv}'")
+    print(f"✓ Saved top {top_n} molecules to '{best_csv}'")
+
+    top_both = df_both_sorted.head(top_n) if df_both_sorted is not None else None
+    print_ranking_report(df_best10, top_both, len(df_both), ranges, strategy, weights, top_n)
+    return df_sorted
+
+# Strategies whose score only depends on the row itself (no statistics of the whole library)
+OUT_OF_CORE_STRATEGIES = ('average',)
+
+def spill_sorted_runs(input_csv, spill_dir, chunksize, strategy='average', columns=None):
+    """
+    First pass of the out-of-core sort: score each chunk and spill it as a sorted run.
+
+    Every row keeps its position in the input table, so that the merge can
+    break ties exactly like the stable in-memory sort. Molecules missing an
+    affinity are appended, in input order, to a separate file.
+
+    Returns:
+        tuple: (run paths, path of the missing rows, counts dict, ranges or None)
+    """
+    runs = []
+    missing_path = os.path.join(spill_dir, 'missing.csv')
+    counts = {'total': 0, 'vina': 0, 'boltz': 0, 'both': 0, 'missing': 0}
+    ranges = None
+    position = 0
+
+    for chunk in iter_table_chunks(input_csv, chunksize, columns=columns or columns_to_keep):
+        chunk = chunk.reset_index(drop=True)
+        has_vina = chunk['vina_affinity'].notna()
+        has_boltz = chunk['boltz_affinity_kcalmol'].notna()
+        has_both = has_vina & has_boltz
+        counts['total'] += len(chunk)
+        counts['vina'] += int(has_vina.sum())
+        counts['boltz'] += int(has_boltz.sum())
+        counts['both'] += int(has_both.sum())
+
+        df_both = chunk[has_both].copy()
+        if len(df_both) > 0:
+            chunk_ranges = (df_both['vina_affinity'].min(), df_both['vina_affinity'].max(),
+                            df_both['boltz_affinity_kcalmol'].min(), df_both['boltz_affinity_kcalmol'].max())
+            ranges = chunk_ranges if ranges is None else (
+                min(ranges[0], chunk_ranges[0]), max(ranges[1], chunk_ranges[1]),
+                min(ranges[2], chunk_ranges[2]), max(ranges[3], chunk_ranges[3]))
+
+            df_both['combined_score'] = RANKING_STRATEGIES[strategy](df_both)
+            df_both['position'] = position + np.flatnonzero(has_both.to_numpy())
+            df_both = df_both.iloc[np.argsort(df_both['combined_score'].to_numpy(), kind='stable')]
+            run_path = os.path.join(spill_dir, f'run-{len(runs):05d}.csv')
+            df_both.to_csv(run_path, index=False)
+            runs.append(run_path)
+
+        df_missing = chunk[~has_both]
+        if len(df_missing) > 0:
+            df_missing.to_csv(missing_path, mode='a', header=counts['missing'] == 0, index=False)
+            counts['missing'] += len(df_missing)
+        position += len(chunk)
+
+    return runs, missing_path, counts, ranges
+
+def iter_run_rows(run_path, chunksize):
+    """Rows of a spilled run as tuples, read back chunk by chunk without loss of precision"""
+    for chunk in pd.read_csv(run_path, chunksize=chunksize, float_precision='round_trip'):
+        yield from chunk.itertuples(index=False, name=None)
+
+def sort_candidates_out_of_core(input_csv, sorted_csv, best_csv, strategy='average', top_n=10,
+                                chunksize=100000, spill_dir=None, csv_copy=False):
+    """
+    Same ranking as sort_candidates for tables larger than the memory.
+
+    The table is read in chunks, each chunk is scored and spilled to disk
+    as a sorted run, and the runs are merged (k-way) into the output. At
+    most about chunksize rows are held in memory, and the output order is
+    identical to the in-memory sort (ties keep the input order).
+
+    Args:
+        input_csv: Table with Vina and Boltz affinities
+        sorted_csv: Output path of the full sorted list
+        best_csv: Output path of the top_n molecules
+        strategy: Consensus strategy, one of OUT_OF_CORE_STRATEGIES
+        top_n: Number of molecules saved in best_csv
+        chunksize: Number of rows read, sorted and written at a time
+        spill_dir: Directory for the temporary runs (default: system temp directory)
+        csv_copy: Also save .csv copies when the outputs are columnar
+    """
+    if strategy not in OUT_OF_CORE_STRATEGIES:
+        raise ValueError(f"Strategy '{strategy}' needs the whole table in memory. "
+                         f"Out-of-core sorting supports: {', '.join(OUT_OF_CORE_STRATEGIES)}")
+
+    with tempfile.TemporaryDirectory(prefix='sorting-', dir=spill_dir) as tmp_dir:
+        columns = kept_columns(input_csv)
+        runs, missing_path, counts, ranges = spill_sorted_runs(input_csv, tmp_dir, chunksize, strategy, columns)
+        print_input_counts(counts['total'], counts['vina'], counts['boltz'], counts['both'])
+        print(f"Spilled {len(runs)} sorted runs of up to {chunksize} molecules")
+
+        # The merge reads every run at the same time: share the chunk size between them
+        merge_chunksize = max(1, chunksize // max(1, len(runs)))
+        output_columns = columns + ['combined_score'] if counts['both'] > 0 else columns
+        merged_columns = columns + ['combined_score', 'position']
+        score_idx = merged_columns.index('combined_score')
+        position_idx = merged_columns.index('position')
+
+        top_rows = []
+        with TableWriter(sorted_csv, csv_copy=csv_copy) as writer:
+            # k-way merge of the sorted runs on (score, input position)
+            merged = heapq.merge(*(iter_run_rows(run, merge_chunksize) for run in runs),
+                                 key=lambda row: (row[score_idx], row[position_idx]))
+            buffer = []
+            for row in merged:
+                buffer.append(row)
+                if len(top_rows) < top_n:
+                    top_rows.append(row)
+                if len(buffer) >= chunksize:
+                    writer.write(pd.DataFrame(buffer, columns=merged_columns)[output_columns])
+                    buffer = []
+            if buffer or writer.rows == 0:
+                writer.write(pd.DataFrame(buffer, columns=merged_columns)[output_columns])
+
+            # Molecules missing either value are placed at the end
+            if counts['missing'] > 0:
+                for chunk in pd.read_csv(missing_path, chunksize=chunksize, float_precision='round_trip'):
+                    writer.write(chunk.reindex(columns=output_columns))
+
+        top_both = pd.DataFrame(top_rows, columns=merged_columns).drop(columns='position')
+        df_best10 = top_both[columns]
+        if len(df_best10) < top_n and counts['missing'] > 0:
+            df_missing_head = pd.read_csv(missing_path, nrows=top_n - len(df_best10), float_precision='round_trip')
+            df_best10 = pd.concat([df_best10, df_missing_head], ignore_index=True) if len(df_best10) else df_missing_head
+        write_table(df_best10, best_csv, csv_copy=csv_copy)
+
+    print(f"\n✓ Saved sorted list with {writer.rows} molecules to '{sorted_csv}'")
+    print(f"✓ Saved top {top_n} molecules to '{best_csv}'")
+
+    print_ranking_report(df_best10, top_both, counts['both'], ranges, strategy, None, top_n)
+    return writer.rows
+
+if __name__ == "__main__":
+    # ===================================================================
+    # CONFIGURATION - Specify your file paths and ranking strategy here
+    # ===================================================================
+
+    # Table with Vina and Boltz affinities
+    INPUT_CSV = 'boltz/list_with_affinities_boltz.csv'
+
+    # Output tables
+    SORTED_CSV = 'list-sorted.csv'
+    BEST_CSV = 'list-best10.csv'
+
+    # One of: 'average', 'rank', 'zscore', 'robust', 'weighted', 'pareto'
+    RANKING_STRATEGY = 'average'
+
+    # Optional weights {column: weight} for 'rank', 'zscore', 'robust' and 'weighted'
+    RANKING_WEIGHTS = None
+
+    # Output format: "csv", "parquet" or "arrow" (a .csv copy is kept if EXPORT_CSV)
+    TABLE_FORMAT = 'csv'
+    EXPORT_CSV = True
+
+    # Sort tables larger than the memory chunk by chunk ('average' strategy only)
+    OUT_OF_CORE = False
+    CHUNK_SIZE = 100000
+
+    # ===================================================================
+
+    # python sorting.py --profile: timing breakdown in profiles/ (see workflow/profiling.py)
+    with profiled('sorting', profile_dir_from_argv()):
+        if OUT_OF_CORE:
+            sort_candidates_out_of_core(INPUT_CSV, with_format(SORTED_CSV, TABLE_FORMAT), with_format(BEST_CSV, TABLE_FORMAT),
+                                        RANKING_STRATEGY, chunksize=CHUNK_SIZE, csv_copy=EXPORT_CSV)
+        else:
+            sort_candidates(INPUT_CSV, with_format(SORTED_CSV, TABLE_FORMAT), with_format(BEST_CSV, TABLE_FORMAT),
+                            RANKING_STRATEGY, RANKING_WEIGHTS, csv_copy=EXPORT_CSV)
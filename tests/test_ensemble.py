@@ -0,0 +1,78 @@
+"""
+Ensemble docking with the run state, followed by ranking.py, with the stand-in vina.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.runstate import RunState
+from workflow.scripts import REPO_ROOT, load_script
+from workflow.tables import read_table
+
+BOX = "center_x = 0\ncenter_y = 0\ncenter_z = 0\nsize_x = 20\nsize_y = 20\nsize_z = 20\n"
+
+@pytest.fixture
+def docked_ensemble(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(REPO_ROOT / "benchmarks" / "stand-ins") + os.pathsep + os.environ["PATH"])
+    (tmp_path / "receptor").mkdir()
+    (tmp_path / "ligands").mkdir()
+    for receptor in ("a", "b"):
+        (tmp_path / "receptor" / f"{receptor}.pdbqt").write_text("REMARK stand-in receptor\n")
+        (tmp_path / "receptor" / f"{receptor}.box.txt").write_text(BOX)
+
+    smiles = ["CCO", "c1ccccc1O", "CC(=O)Nc1ccc(O)cc1"]
+    pd.DataFrame({"smiles": smiles, "id-num": range(len(smiles))}).to_csv(tmp_path / "ligands" / "list.csv",
+                                                                          index=False)
+    state_path = str(tmp_path / "run-state.db")
+    state = RunState(state_path)
+    state.register((str(i), smile) for i, smile in enumerate(smiles))
+    for i, smile in enumerate(smiles):
+        pdbqt_path = tmp_path / "ligands" / f"{i}-prepared.pdbqt"
+        pdbqt_path.write_text(f"REMARK SMILES {smile}\n")
+        state.finish('prepare', str(i), {'pdbqt': str(pdbqt_path)})
+    state.close()
+
+    vina_batch = load_script("Autodock-Vina/vina-batch.py")
+    vina_batch.run_vina_docking(
+        ligands_dir=str(tmp_path / "ligands"), receptor_dir=str(tmp_path / "receptor"),
+        receptor_name="a.pdbqt", config_file="a.box.txt", exhaustiveness=8, num_modes=3,
+        poses_dir=str(tmp_path / "poses"), state_path=state_path,
+        receptors=[("a.pdbqt", "a.box.txt"), ("b.pdbqt", "b.box.txt")])
+    return tmp_path, state_path
+
+def test_ranking_reads_the_ensemble_affinities_of_the_run_state(docked_ensemble):
+    tmp_path, state_path = docked_ensemble
+    ranking = load_script("Autodock-Vina/poses/ranking.py")
+    df = ranking.process_vina_scores(poses_dir=str(tmp_path / "poses"),
+                                     ligands_csv=str(tmp_path / "ligands" / "list.csv"),
+                                     output_csv=str(tmp_path / "poses" / "list_with_affinities.csv"),
+                                     state_path=state_path)
+
+    ensemble = read_table(tmp_path / "poses" / "ensemble_affinities.csv")
+    assert df is not None
+    assert df.set_index("id-num")["vina_affinity"].to_dict() == \
+        ensemble.set_index("id-num")["vina_affinity"].to_dict()
+
+def test_best_receptor_poses_are_copied_to_the_poses_folder(docked_ensemble):
+    tmp_path, _ = docked_ensemble
+    ensemble = read_table(tmp_path / "poses" / "ensemble_affinities.csv")
+    for ligand_id, receptor in zip(ensemble["id-num"], ensemble["best_receptor"]):
+        for suffix in ("vina-score.txt", "vina-out.pdbqt"):
+            copy = tmp_path / "poses" / f"{ligand_id}-{suffix}"
+            assert copy.read_text() == (tmp_path / "poses" / receptor / f"{ligand_id}-{suffix}").read_text()
+
+def test_ranking_asks_for_the_ensemble_table_when_missing(docked_ensemble, capsys):
+    tmp_path, state_path = docked_ensemble
+    os.remove(tmp_path / "poses" / "ensemble_affinities.csv")
+    ranking = load_script("Autodock-Vina/poses/ranking.py")
+    df = ranking.process_vina_scores(poses_dir=str(tmp_path / "poses"),
+                                     ligands_csv=str(tmp_path / "ligands" / "list.csv"),
+                                     output_csv=str(tmp_path / "poses" / "list_with_affinities.csv"),
+                                     state_path=state_path)
+    assert df is None
+    assert "ENSEMBLE_TABLE" in capsys.readouterr().out
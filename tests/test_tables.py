@@ -0,0 +1,49 @@
+"""
+Columnar tables assembled from chunks whose columns are all missing in some of them.
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from workflow.scripts import REPO_ROOT, load_script
+from workflow.tables import TableWriter, read_table, unified_schema, write_table
+
+pytest.importorskip("pyarrow")
+
+def test_table_writer_with_all_missing_first_part(tmp_path):
+    parts = [pd.DataFrame({"id-num": [0, 1], "label": [None, None]}),
+             pd.DataFrame({"id-num": [2, 3], "label": ["Yes", "No"]})]
+    part_paths = []
+    for i, part in enumerate(parts):
+        part_paths.append(tmp_path / f"part-{i}.parquet")
+        write_table(part, part_paths[-1])
+
+    output = tmp_path / "out.parquet"
+    with TableWriter(output, schema=unified_schema(part_paths)) as writer:
+        for part_path in part_paths:
+            writer.write(read_table(part_path))
+
+    df = read_table(output)
+    assert df["id-num"].tolist() == [0, 1, 2, 3]
+    assert df["label"].isna().tolist() == [True, True, False, False]
+    assert df["label"].iloc[2:].tolist() == ["Yes", "No"]
+
+def test_parallel_descriptors_with_invalid_first_chunk(tmp_path):
+    pytest.importorskip("rdkit")
+    additional_descriptor = load_script("additional-descriptor.py")
+    smiles = ["xx1", "yy2", "zz3", "qq4", "CCO", "c1ccccc1O", "CC(=O)Nc1ccc(O)cc1", "CCN"]
+    pd.DataFrame({"smiles": smiles, "id-num": range(len(smiles))}).to_csv(tmp_path / "in.csv", index=False)
+
+    output = tmp_path / "out.parquet"
+    rows = additional_descriptor.compute_descriptors_parallel(
+        str(tmp_path / "in.csv"), str(output), chunksize=4, workers=2, admet=False, cache_path=None,
+        rules_path=str(REPO_ROOT / "property-rules.json"))
+
+    df = read_table(output)
+    assert rows == len(smiles) == len(df)
+    assert df["lipinski_pass"].iloc[:4].isna().all()
+    assert df["lipinski_pass"].iloc[4:].notna().all()
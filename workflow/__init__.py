@@ -0,0 +1,6 @@
+"""
+Shared helpers of the CADD workflow scripts.
+
+The workflow steps stay independent scripts (one per folder and
+environment); this package only holds the code they have in common.
+"""
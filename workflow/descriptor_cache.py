@@ -0,0 +1,116 @@
+"""
+Persistent cache of molecular descriptors.
+
+Descriptors are stored in a SQLite file, keyed by canonical SMILES and by a
+namespace that identifies how they were computed (RDKit version and
+descriptor set), so a change of either never returns stale values. The
+cache is bounded: once it holds more than max_entries molecules, the least
+recently used ones are evicted.
+
+Several processes can share the same file (SQLite WAL mode); each process
+opens its own connection.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS descriptors (
+    namespace TEXT NOT NULL,
+    smiles TEXT NOT NULL,
+    value TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (namespace, smiles)
+);
+CREATE INDEX IF NOT EXISTS descriptors_last_used ON descriptors (last_used);
+"""
+
+# SQLite limits the number of parameters of one statement
+BATCH_SIZE = 500
+
+class DescriptorCache:
+    """
+    Descriptor values (JSON-serializable dicts) of canonical SMILES.
+
+    Args:
+        path: SQLite file (created if needed)
+        namespace: Identifies the descriptor set and toolkit version
+        max_entries: Maximum number of molecules kept in the file (all namespaces)
+    """
+
+    def __init__(self, path, namespace, max_entries=1000000):
+        self.path = str(path)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pid = None
+        self._connection = None
+
+    @property
+    def connection(self):
+        # A connection must not be shared with forked worker processes
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def get_many(self, smiles_list):
+        """
+        Cached values of the given canonical SMILES.
+
+        Returns:
+            dict: {smiles: value} for the molecules found in the cache
+        """
+        keys = list(dict.fromkeys(smiles_list))
+        found = {}
+        with self.connection as connection:
+            for start in range(0, len(keys), BATCH_SIZE):
+                batch = keys[start:start + BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT smiles, value FROM descriptors WHERE namespace = ? AND smiles IN ({placeholders})",
+                    [self.namespace, *batch]).fetchall()
+                found.update((smiles, json.loads(value)) for smiles, value in rows)
+
+            # Mark the hits as recently used
+            now = time.time()
+            connection.executemany(
+                "UPDATE descriptors SET last_used = ? WHERE namespace = ? AND smiles = ?",
+                [(now, self.namespace, smiles) for smiles in found])
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, values):
+        """
+        Store {smiles: value} and evict the least recently used molecules beyond max_entries.
+        """
+        if not values:
+            return
+        now = time.time()
+        with self.connection as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO descriptors (namespace, smiles, value, last_used) VALUES (?, ?, ?, ?)",
+                [(self.namespace, smiles, json.dumps(value), now) for smiles, value in values.items()])
+
+            excess = connection.execute("SELECT COUNT(*) FROM descriptors").fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM descriptors WHERE rowid IN "
+                    "(SELECT rowid FROM descriptors ORDER BY last_used LIMIT ?)", (excess,))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM descriptors WHERE namespace = ?",
+                                       (self.namespace,)).fetchone()[0]
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
@@ -0,0 +1,149 @@
+"""
+Cache of the receptor grid maps used by AutoDock Vina.
+
+Vina starts every docking by computing the affinity maps of the receptor
+in the box, which is the same work for every ligand of a run (and of every
+rerun). The maps are computed once with `vina --write_maps` and stored in
+a directory named after a hash of everything they depend on: the receptor
+file content, the box center and size, the grid spacing and the scoring
+function. The dockings then load them with `vina --maps` instead of the
+receptor.
+
+    maps = GridMapCache("grid-maps").maps_prefix("receptor/1H1Q-prepared.pdbqt",
+                                                 "receptor/1H1Q-prepared.box.txt")
+    build_vina_command(..., maps=maps)
+
+The cache can be shared by several workers and nodes (e.g. on a network
+file system): the maps are written to a temporary directory that is then
+renamed, so a worker never sees incomplete maps, and when two workers
+compute the same maps, the first rename wins.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+# File name prefix of the maps inside each cache entry
+MAPS_NAME = "receptor"
+METADATA_FILE = "metadata.json"
+
+# Default grid spacing of Vina (Angstrom)
+DEFAULT_SPACING = 0.375
+
+# Scoring functions whose maps `vina --write_maps` can compute
+MAP_SCORING_FUNCTIONS = ("vina", "vinardo")
+
+def read_box(config_path):
+    """
+    Box of a Vina configuration file (center_x = ..., size_x = ...).
+
+    Returns:
+        dict: center_x, center_y, center_z, size_x, size_y, size_z (and spacing if set)
+    """
+    box = {}
+    with open(config_path, 'r') as f:
+        for line in f:
+            name, _, value = line.partition("=")
+            name = name.strip()
+            if name in ("center_x", "center_y", "center_z", "size_x", "size_y", "size_z", "spacing"):
+                box[name] = float(value.split("#")[0])
+    missing = {"center_x", "center_y", "center_z", "size_x", "size_y", "size_z"} - set(box)
+    if missing:
+        raise ValueError(f"{config_path} does not define {', '.join(sorted(missing))}")
+    return box
+
+def grid_key(receptor_path, box, spacing=DEFAULT_SPACING, scoring="vina"):
+    """Hash of everything the maps depend on"""
+    digest = hashlib.sha256()
+    with open(receptor_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    parameters = {name: round(box[name], 4) for name in
+                  ("center_x", "center_y", "center_z", "size_x", "size_y", "size_z")}
+    parameters.update(spacing=round(spacing, 4), scoring=scoring)
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()[:32]
+
+class GridMapCache:
+    """
+    Directory of precomputed grid maps, one subdirectory per key.
+
+    Args:
+        cache_dir: Cache directory (created if needed)
+        vina_executable: Name or path of the vina executable used to compute the maps
+    """
+
+    def __init__(self, cache_dir, vina_executable="vina"):
+        self.cache_dir = Path(cache_dir)
+        self.vina_executable = vina_executable
+        self.hits = 0
+        self.builds = 0
+
+    def maps_prefix(self, receptor_path, config_path, spacing=None, scoring="vina"):
+        """
+        Path prefix of the maps of a receptor and box (for `vina --maps`), computed if needed.
+
+        Args:
+            receptor_path: Receptor PDBQT file
+            config_path: Vina configuration file with the box
+            spacing: Grid spacing (None = spacing of the configuration file, or 0.375)
+            scoring: Scoring function ('vina' or 'vinardo')
+        """
+        if scoring not in MAP_SCORING_FUNCTIONS:
+            raise ValueError(f"Vina cannot write maps for the '{scoring}' scoring function "
+                             f"(use {' or '.join(MAP_SCORING_FUNCTIONS)})")
+        box = read_box(config_path)
+        if spacing is None:
+            spacing = box.get("spacing", DEFAULT_SPACING)
+        entry = self.cache_dir / grid_key(receptor_path, box, spacing, scoring)
+
+        if (entry / METADATA_FILE).exists():
+            self.hits += 1
+        else:
+            self._build(entry, receptor_path, config_path, box, spacing, scoring)
+            self.builds += 1
+        return str(entry / MAPS_NAME)
+
+    def _build(self, entry, receptor_path, config_path, box, spacing, scoring):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        building = Path(tempfile.mkdtemp(prefix=f"{entry.name}.", suffix=".tmp", dir=self.cache_dir))
+        try:
+            start = time.perf_counter()
+            # .map files need an even number of voxels per side
+            cmd = [self.vina_executable, "--receptor", str(receptor_path), "--config", str(config_path),
+                   "--spacing", str(spacing), "--scoring", scoring,
+                   "--write_maps", str(building / MAPS_NAME), "--force_even_voxels"]
+            try:
+                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            except FileNotFoundError:
+                raise RuntimeError(f"'{self.vina_executable}' not found. Check your PATH.") from None
+            if result.returncode != 0 or not any(building.glob(f"{MAPS_NAME}*.map")):
+                raise RuntimeError(f"vina could not write the grid maps of {receptor_path}:\n"
+                                   + "\n".join(result.stdout.strip().splitlines()[-10:]))
+
+            metadata = {
+                "receptor": os.path.abspath(receptor_path),
+                "box": {name: value for name, value in box.items() if name != "spacing"},
+                "spacing": spacing,
+                "scoring": scoring,
+                "seconds": round(time.perf_counter() - start, 3),
+                "created_at": time.time()
+            }
+            with open(building / METADATA_FILE, 'w') as f:
+                json.dump(metadata, f, indent=2)
+
+            try:
+                os.rename(building, entry)
+                print(f"🧊 Grid maps of {Path(receptor_path).name} computed in {metadata['seconds']:.1f} s "
+                      f"and cached in {entry}")
+            except OSError:
+                # Another worker stored the same maps first
+                if not (entry / METADATA_FILE).exists():
+                    raise
+        finally:
+            shutil.rmtree(building, ignore_errors=True)
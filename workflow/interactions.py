@@ -0,0 +1,323 @@
+"""
+Protein-ligand interaction fingerprints of docked poses.
+
+The receptor is read once: its atoms are binned in a uniform grid (cells
+as large as the longest distance cutoff), so the atoms close to a point
+are found by looking at its 27 neighbouring cells instead of the whole
+protein. All the modes of a Vina output are then processed at once: every
+ligand atom of every mode is looked up in the grid in a single vectorized
+query, and the interactions are reduced to one bit per (mode, residue):
+
+    receptor = ReceptorPocket("receptor/1H1Q-prepared.pdbqt", "receptor/1H1Q-prepared.box.txt")
+    bits = receptor.fingerprint(read_pose_modes("poses/0-vina-out.pdbqt"))
+    bits["hbond"][:, receptor.residue_index("LEU83")]   # H-bond to Leu83, for every mode
+
+The interactions, computed with the atom types of the PDBQT files:
+    contact: a ligand heavy atom within 4 Angstrom of a heavy atom of the residue
+    hbond: a polar hydrogen (HD) within 2.8 Angstrom of an acceptor (OA, NA) of the
+           other molecule, with a donor-H...acceptor angle of at least 120 degrees
+    aromatic: an aromatic ring of the ligand within 5.5 Angstrom (centroids) of a ring
+              of the residue, stacked face to face (< 30 degrees) or edge to face (> 60 degrees)
+"""
+
+import numpy as np
+from rdkit import Chem
+
+from workflow.gridmaps import read_box
+
+CONTACT_CUTOFF = 4.0
+# H...A distance: loose enough for the rigid-receptor poses of Vina, the angle test keeps it specific
+HBOND_DISTANCE = 2.8
+HBOND_ANGLE = 120.0
+AROMATIC_DISTANCE = 5.5
+
+ACCEPTOR_TYPES = ("OA", "NA")
+DONOR_HYDROGEN_TYPE = "HD"
+
+# Ring atoms of the aromatic side chains
+AROMATIC_RINGS = {
+    "PHE": [("CG", "CD1", "CD2", "CE1", "CE2", "CZ")],
+    "TYR": [("CG", "CD1", "CD2", "CE1", "CE2", "CZ")],
+    "TRP": [("CG", "CD1", "NE1", "CE2", "CD2"), ("CD2", "CE2", "CE3", "CZ2", "CZ3", "CH2")],
+    "HIS": [("CG", "ND1", "CD2", "CE1", "NE2")]
+}
+
+INTERACTIONS = ("contact", "hbond", "aromatic")
+
+# The 27 cells around (and including) a cell
+NEIGHBOUR_CELLS = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)])
+
+class AtomGrid:
+    """
+    Uniform grid of points for fixed-radius neighbour queries.
+
+    Args:
+        coordinates: array (atoms, 3)
+        cell_size: Edge of a cell, the largest cutoff of the queries
+    """
+
+    def __init__(self, coordinates, cell_size):
+        self.coordinates = np.asarray(coordinates, dtype=float)
+        self.cell_size = cell_size
+        self.origin = self.coordinates.min(axis=0)
+        cells = self._cells(self.coordinates)
+        # One empty layer of cells on each side, so that neighbours never wrap around
+        self.shape = cells.max(axis=0) + 3
+        keys = self._keys(cells)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+
+    def _cells(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells):
+        shifted = cells + 1
+        return (shifted[:, 0] * self.shape[1] + shifted[:, 1]) * self.shape[2] + shifted[:, 2]
+
+    def pairs(self, points, cutoff):
+        """
+        All (point, atom) pairs closer than cutoff.
+
+        Returns:
+            tuple: (point indices, atom indices, distances), 1D arrays
+        """
+        if cutoff > self.cell_size:
+            raise ValueError(f"cutoff {cutoff} is larger than the grid cells ({self.cell_size})")
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        cells = self._cells(points)
+        point_indices = []
+        atom_indices = []
+        for offset in NEIGHBOUR_CELLS:
+            neighbours = cells + offset
+            inside = np.all((neighbours >= -1) & (neighbours <= self.shape - 2), axis=1)
+            candidates = np.flatnonzero(inside)
+            keys = self._keys(neighbours[candidates])
+            start = np.searchsorted(self.sorted_keys, keys, side="left")
+            counts = np.searchsorted(self.sorted_keys, keys, side="right") - start
+            # Expand each (point, range of atoms) into one entry per atom
+            total = counts.sum()
+            if total == 0:
+                continue
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            positions = np.arange(total) - first + np.repeat(start, counts)
+            point_indices.append(np.repeat(candidates, counts))
+            atom_indices.append(self.order[positions])
+        if not point_indices:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, np.array([], dtype=float)
+        point_indices = np.concatenate(point_indices)
+        atom_indices = np.concatenate(atom_indices)
+        distances = np.linalg.norm(points[point_indices] - self.coordinates[atom_indices], axis=1)
+        close = distances <= cutoff
+        return point_indices[close], atom_indices[close], distances[close]
+
+def read_pdbqt_atoms(pdbqt_path):
+    """
+    Atoms of a receptor PDBQT file.
+
+    Returns:
+        dict of arrays: name, residue (e.g. 'LEU83'), residue_name, type (AutoDock type), xyz (atoms, 3)
+    """
+    names, residues, residue_names, types, xyz = [], [], [], [], []
+    with open(pdbqt_path, 'r') as f:
+        for line in f:
+            if line.startswith(("ATOM", "HETATM")):
+                names.append(line[12:16].strip())
+                residue_names.append(line[17:20].strip())
+                residues.append(f"{line[17:20].strip()}{int(line[22:26])}")
+                types.append(line[77:79].strip())
+                xyz.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    return {"name": np.array(names), "residue": np.array(residues), "residue_name": np.array(residue_names),
+            "type": np.array(types), "xyz": np.array(xyz)}
+
+def read_pose_modes(pdbqt_path):
+    """
+    All the modes of a Vina output.
+
+    The aromatic rings are taken from the SMILES written by Meeko (REMARK
+    SMILES and SMILES IDX); without them, the ligand has no aromatic ring.
+
+    Returns:
+        dict: type (atoms,), xyz (modes, atoms, 3), rings (list of atom index arrays)
+    """
+    smiles = None
+    index_pairs = []
+    serials = []
+    types = []
+    modes = []
+    with open(pdbqt_path, 'r') as f:
+        for line in f:
+            if line.startswith("MODEL"):
+                xyz = []
+            elif line.startswith("REMARK SMILES IDX"):
+                if not modes:
+                    index_pairs += [int(value) for value in line.split()[3:]]
+            elif line.startswith("REMARK SMILES"):
+                fields = line.split()
+                smiles = fields[2] if len(fields) > 2 else None
+            elif line.startswith(("ATOM", "HETATM")):
+                if not modes:
+                    serials.append(int(line[6:11]))
+                    types.append(line[77:79].strip())
+                xyz.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+            elif line.startswith("ENDMDL"):
+                modes.append(xyz)
+    if not modes or not serials:
+        raise ValueError(f"{pdbqt_path} has no MODEL with ligand atoms")
+
+    rings = []
+    if smiles is not None and index_pairs:
+        mol = Chem.MolFromSmiles(smiles)
+        position = {serial: i for i, serial in enumerate(serials)}
+        serial_of_atom = dict(zip(index_pairs[0::2], index_pairs[1::2]))
+        for ring in mol.GetRingInfo().AtomRings():
+            if all(mol.GetAtomWithIdx(atom).GetIsAromatic() for atom in ring):
+                rings.append(np.array([position[serial_of_atom[atom + 1]] for atom in ring]))
+    return {"type": np.array(types), "xyz": np.array(modes), "rings": rings}
+
+def hydrogen_parents(types, xyz):
+    """Index of the heavy atom bonded to every polar hydrogen (nearest heavy atom), -1 for the other atoms"""
+    hydrogens = np.flatnonzero(types == DONOR_HYDROGEN_TYPE)
+    heavy = np.flatnonzero(~np.char.startswith(types.astype(str), "H"))
+    parents = np.full(len(types), -1)
+    if len(hydrogens) and len(heavy):
+        distances = np.linalg.norm(xyz[hydrogens, None] - xyz[None, heavy], axis=2)
+        parents[hydrogens] = heavy[distances.argmin(axis=1)]
+    return parents
+
+def ring_geometry(xyz, rings):
+    """
+    Centroids and normals of rings, for coordinates of shape (..., atoms, 3).
+
+    Returns:
+        tuple: (centroids (..., rings, 3), unit normals (..., rings, 3))
+    """
+    centroids = []
+    normals = []
+    for ring in rings:
+        points = xyz[..., ring, :]
+        centroid = points.mean(axis=-2)
+        # Normal of the ring plane from two of its diagonals
+        normal = np.cross(points[..., 2, :] - points[..., 0, :], points[..., -1, :] - points[..., 1, :])
+        centroids.append(centroid)
+        normals.append(normal / np.linalg.norm(normal, axis=-1, keepdims=True))
+    return np.stack(centroids, axis=-2), np.stack(normals, axis=-2)
+
+def hbond_angle_ok(donor, hydrogen, acceptor):
+    """Whether the donor-H...acceptor angles (rows of the three arrays) are wide enough"""
+    to_donor = donor - hydrogen
+    to_acceptor = acceptor - hydrogen
+    cosine = np.einsum('ij,ij->i', to_donor, to_acceptor) / (
+        np.linalg.norm(to_donor, axis=1) * np.linalg.norm(to_acceptor, axis=1))
+    return cosine <= np.cos(np.radians(HBOND_ANGLE))
+
+class ReceptorPocket:
+    """
+    Receptor atoms indexed once for the fingerprints of many poses.
+
+    The residues of the fingerprint (the pocket) are the ones with a heavy
+    atom inside the docking box.
+
+    Args:
+        receptor_path: Receptor PDBQT file (with its polar hydrogens)
+        box_config: Vina box configuration file
+    """
+
+    def __init__(self, receptor_path, box_config):
+        atoms = read_pdbqt_atoms(receptor_path)
+        box = read_box(box_config)
+        center = np.array([box["center_x"], box["center_y"], box["center_z"]])
+        half_size = np.array([box["size_x"], box["size_y"], box["size_z"]]) / 2
+
+        heavy = ~np.char.startswith(atoms["type"], "H")
+        in_box = np.all(np.abs(atoms["xyz"] - center) <= half_size, axis=1)
+        self.residues = list(dict.fromkeys(atoms["residue"][heavy & in_box]))
+        index = {residue: i for i, residue in enumerate(self.residues)}
+
+        # Only the atoms of the pocket residues can interact with a pose in the box
+        keep = np.isin(atoms["residue"], self.residues)
+        self.atoms = {name: values[keep] for name, values in atoms.items()}
+        self.residue_of_atom = np.array([index[residue] for residue in self.atoms["residue"]])
+        self.heavy = ~np.char.startswith(self.atoms["type"], "H")
+        self.acceptor = np.isin(self.atoms["type"], ACCEPTOR_TYPES)
+        self.hydrogen = self.atoms["type"] == DONOR_HYDROGEN_TYPE
+        self.parents = hydrogen_parents(self.atoms["type"], self.atoms["xyz"])
+        self.grid = AtomGrid(self.atoms["xyz"], max(CONTACT_CUTOFF, HBOND_DISTANCE))
+
+        # Aromatic rings of the side chains
+        rings = []
+        self.ring_residues = []
+        for residue in self.residues:
+            residue_atoms = np.flatnonzero(self.atoms["residue"] == residue)
+            names = list(self.atoms["name"][residue_atoms])
+            for ring in AROMATIC_RINGS.get(self.atoms["residue_name"][residue_atoms[0]], []):
+                if all(name in names for name in ring):
+                    rings.append(residue_atoms[[names.index(name) for name in ring]])
+                    self.ring_residues.append(index[residue])
+        self.ring_residues = np.array(self.ring_residues, dtype=int)
+        if rings:
+            self.ring_centroids, self.ring_normals = ring_geometry(self.atoms["xyz"], rings)
+
+    def residue_index(self, residue):
+        """Column of a residue (e.g. 'LEU83') in the fingerprint arrays"""
+        return self.residues.index(residue)
+
+    def aromatic_residues(self):
+        """Residues with an aromatic side chain"""
+        return [self.residues[i] for i in dict.fromkeys(self.ring_residues.tolist())]
+
+    def fingerprint(self, ligand):
+        """
+        Interaction bits of every mode of a ligand with every pocket residue.
+
+        Args:
+            ligand: Modes of a ligand (read_pose_modes)
+
+        Returns:
+            dict: {interaction: bool array (modes, residues)} for contact, hbond and aromatic
+        """
+        xyz = ligand["xyz"]
+        n_modes, n_atoms = xyz.shape[:2]
+        types = ligand["type"]
+        points = xyz.reshape(-1, 3)
+        mode_of_point = np.repeat(np.arange(n_modes), n_atoms)
+        atom_of_point = np.tile(np.arange(n_atoms), n_modes)
+        bits = {name: np.zeros((n_modes, len(self.residues)), dtype=bool) for name in INTERACTIONS}
+
+        # Contacts: heavy atoms of both sides
+        ligand_heavy = ~np.char.startswith(types.astype(str), "H")
+        point, atom, _ = self.grid.pairs(points[ligand_heavy[atom_of_point]], CONTACT_CUTOFF)
+        point = np.flatnonzero(ligand_heavy[atom_of_point])[point]
+        keep = self.heavy[atom]
+        bits["contact"][mode_of_point[point[keep]], self.residue_of_atom[atom[keep]]] = True
+
+        # H-bonds donated by the ligand: ligand polar H -> receptor acceptor
+        ligand_parents = hydrogen_parents(types, xyz[0])
+        donor_points = np.flatnonzero((types == DONOR_HYDROGEN_TYPE)[atom_of_point])
+        point, atom, _ = self.grid.pairs(points[donor_points], HBOND_DISTANCE)
+        point = donor_points[point]
+        keep = self.acceptor[atom]
+        point, atom = point[keep], atom[keep]
+        donor = xyz[mode_of_point[point], ligand_parents[atom_of_point[point]]]
+        keep = hbond_angle_ok(donor, points[point], self.atoms["xyz"][atom])
+        bits["hbond"][mode_of_point[point[keep]], self.residue_of_atom[atom[keep]]] = True
+
+        # H-bonds accepted by the ligand: receptor polar H -> ligand acceptor
+        acceptor_points = np.flatnonzero(np.isin(types, ACCEPTOR_TYPES)[atom_of_point])
+        point, atom, _ = self.grid.pairs(points[acceptor_points], HBOND_DISTANCE)
+        point = acceptor_points[point]
+        keep = self.hydrogen[atom]
+        point, atom = point[keep], atom[keep]
+        keep = hbond_angle_ok(self.atoms["xyz"][self.parents[atom]], self.atoms["xyz"][atom], points[point])
+        bits["hbond"][mode_of_point[point[keep]], self.residue_of_atom[atom[keep]]] = True
+
+        # Aromatic stacking: every ligand ring of every mode against every receptor ring
+        if ligand["rings"] and len(self.ring_residues):
+            centroids, normals = ring_geometry(xyz, ligand["rings"])               # (modes, rings, 3)
+            distances = np.linalg.norm(centroids[:, :, None] - self.ring_centroids[None, None], axis=3)
+            cosine = np.abs(np.einsum('mlx,rx->mlr', normals, self.ring_normals))
+            angle = np.degrees(np.arccos(np.clip(cosine, 0.0, 1.0)))
+            stacked = (distances <= AROMATIC_DISTANCE) & ((angle < 30.0) | (angle > 60.0))
+            mode, _, ring = np.nonzero(stacked)
+            bits["aromatic"][mode, self.ring_residues[ring]] = True
+        return bits
@@ -0,0 +1,155 @@
+"""
+Profiling of the workflow steps.
+
+When a step is slow, the question is where the time goes: waiting for
+the external tools (vina, boltz, scrub.py...), Python code, reading and
+writing tables, or printing. Every step script accepts --profile
+(or --profile=<folder>, default profiles/):
+
+    python vina-batch.py --profile
+
+The step then runs under cProfile and writes, in the profile folder:
+
+    <step>.prof: the cProfile statistics (pstats format, e.g. for snakeviz)
+    <step>-profile.json: the timing breakdown and the top functions
+
+The breakdown splits the wall time of the step by the functions the time
+was spent in (their own time, so nothing is counted twice):
+
+    subprocess_wait_s: waiting for subprocesses and worker processes
+    io_s: files, tables (pandas, pyarrow, csv, json) and SQLite
+    console_s: printing
+    python_s: everything else (parsing, RDKit, NumPy, pandas computations...)
+
+with the CPU time of the step's process (python_cpu_s) and of the
+subprocesses it waited for (subprocess_cpu_s). profile-summary.py
+combines the breakdowns of all the steps. Only the main thread is
+profiled; the time of worker threads shows up as waiting.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_PROFILE_DIR = "profiles"
+
+# Number of functions listed in the JSON breakdown
+TOP_FUNCTIONS = 25
+
+# Substrings of the cProfile function keys (file name and function name) of each category
+SUBPROCESS_MARKERS = ("subprocess.py", "selectors.py", "select.epoll", "select.poll", "select.select",
+                      "posix.waitpid", "_posixsubprocess", "_thread.lock", "time.sleep", "concurrent/futures",
+                      "multiprocessing/")
+IO_MARKERS = ("/pandas/io/", "pandas._libs.parsers", "/pyarrow/", "pyarrow.lib", "pyarrow._", "/json/",
+              "_csv.", "sqlite3.", "_io.", "io.open", "posix.stat", "posix.listdir", "posix.scandir",
+              "posix.replace", "posix.remove", "posix.rename", "posix.unlink", "posix.mkdir", "/pathlib.py",
+              "/genericpath.py", "/shutil.py", "/glob.py", "/tempfile.py")
+CONSOLE_MARKERS = ("builtins.print",)
+
+def profile_dir_from_argv(argv=None):
+    """
+    Profile folder requested on the command line.
+
+    Returns:
+        str: The folder of --profile=<folder>, profiles for --profile, None without the option
+    """
+    for argument in sys.argv[1:] if argv is None else argv:
+        if argument == "--profile":
+            return DEFAULT_PROFILE_DIR
+        if argument.startswith("--profile="):
+            return argument.split("=", 1)[1] or DEFAULT_PROFILE_DIR
+    return None
+
+def function_label(key):
+    """Readable name of a cProfile function key (file, line, name)"""
+    filename, line, name = key
+    if filename == "~":
+        return name
+    return f"{Path(filename).name}:{line}({name})"
+
+def categorize(key):
+    """Category of a cProfile function key: subprocess, io, console or python"""
+    text = f"{key[0]} {key[2]}"
+    for category, markers in (("console", CONSOLE_MARKERS), ("subprocess", SUBPROCESS_MARKERS),
+                              ("io", IO_MARKERS)):
+        if any(marker in text for marker in markers):
+            return category
+    return "python"
+
+def breakdown(stats, wall_time, cpu_time, children_cpu_time):
+    """
+    Timing breakdown of a profiled run.
+
+    Args:
+        stats: pstats.Stats of the run
+        wall_time, cpu_time, children_cpu_time: Measured around the run (seconds)
+
+    Returns:
+        dict: The *_s timings and the top functions by cumulative time
+    """
+    own_time = {"subprocess": 0.0, "io": 0.0, "console": 0.0, "python": 0.0}
+    for key, (_, _, total_time, _, _) in stats.stats.items():
+        own_time[categorize(key)] += total_time
+    # The profiler overhead inflates the function times: scale them to the wall time
+    profiled = sum(own_time.values())
+    scale = wall_time / profiled if profiled > 0 else 0.0
+
+    top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return {
+        "wall_s": round(wall_time, 3),
+        "subprocess_wait_s": round(own_time["subprocess"] * scale, 3),
+        "io_s": round(own_time["io"] * scale, 3),
+        "console_s": round(own_time["console"] * scale, 3),
+        "python_s": round(own_time["python"] * scale, 3),
+        "python_cpu_s": round(cpu_time, 3),
+        "subprocess_cpu_s": round(children_cpu_time, 3),
+        "top_functions": [
+            {"function": function_label(key), "category": categorize(key), "calls": calls,
+             "own_s": round(total_time, 4), "cumulative_s": round(cumulative_time, 4)}
+            for key, (_, calls, total_time, cumulative_time, _) in top
+        ]
+    }
+
+@contextmanager
+def profiled(name, profile_dir=None):
+    """
+    Profile a block and write <name>.prof and <name>-profile.json in profile_dir.
+
+    Does nothing when profile_dir is None, so that the scripts can always
+    wrap their main call: with profiled("sorting", profile_dir_from_argv()): ...
+    """
+    if profile_dir is None:
+        yield
+        return
+
+    profile_dir = Path(profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+    times = os.times()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.process_time() - cpu_start
+        end_times = os.times()
+        children_cpu_time = (end_times.children_user - times.children_user
+                             + end_times.children_system - times.children_system)
+
+        profiler.dump_stats(profile_dir / f"{name}.prof")
+        result = {"name": name, "created_at": time.time(), "argv": sys.argv}
+        result.update(breakdown(pstats.Stats(profiler), wall_time, cpu_time, children_cpu_time))
+        with open(profile_dir / f"{name}-profile.json", 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n⏱️  Profile of {name}: {result['wall_s']:.2f} s wall = "
+              f"{result['subprocess_wait_s']:.2f} s subprocesses + {result['io_s']:.2f} s I/O + "
+              f"{result['console_s']:.2f} s console + {result['python_s']:.2f} s Python "
+              f"({profile_dir / f'{name}.prof'})")
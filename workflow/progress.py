@@ -0,0 +1,155 @@
+"""
+Progress reporting of the long workflow steps.
+
+Instead of printing lines for every ligand, a step updates a Progress
+object, which prints one line at most every few seconds (count, rate, ETA
+and counters) and keeps a JSON metrics file up to date:
+
+    {"name": "vina-batch", "status": "running", "done": 1200, "total": 50000,
+     "rate_per_s": 3.1, "eta_s": 15741.9, "counters": {"failed": 2},
+     "timings_s": {"vina": 380.2}, ...}
+
+The file is replaced atomically, so it can be read (or scraped by a
+monitoring tool) at any time while the run is in progress. Progress is
+thread-safe.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+def format_duration(seconds):
+    """Compact duration, e.g. 42s, 3m05s, 2h07m"""
+    if seconds is None:
+        return "?"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+class Progress:
+    """
+    Rate-limited progress lines and metrics file of one step.
+
+    Args:
+        name: Name of the step, shown in the progress lines
+        total: Expected number of items (None = unknown, no ETA)
+        metrics_path: JSON metrics file (None = no file)
+        interval: Minimum number of seconds between two progress lines
+        unit: Name of the items in the progress lines
+    """
+
+    def __init__(self, name, total=None, metrics_path=None, interval=10.0, unit="ligands"):
+        self.name = name
+        self.total = total
+        self.metrics_path = str(metrics_path) if metrics_path else None
+        self.interval = interval
+        self.unit = unit
+        self.done = 0
+        self.counters = {}
+        self.timings = {}
+        self.status = "running"
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._lock = threading.Lock()
+        self._write_metrics()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close("failed" if exc_type is not None else "finished")
+
+    def update(self, n=1, **counters):
+        """Count n more items done, and add to named counters (e.g. failed=1)"""
+        with self._lock:
+            self.done += n
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self._maybe_report()
+
+    def count(self, name, n=1):
+        """Add to a named counter without counting items done"""
+        self.update(0, **{name: n})
+
+    def add_time(self, name, seconds):
+        """Add seconds to a named timing (e.g. time spent in one external program)"""
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, name):
+        """Time a block and add it to a named timing"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Seconds left at the current rate (None if unknown)"""
+        rate = self.rate()
+        if self.total is None or rate == 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def line(self):
+        """Progress line: count, rate, ETA and counters"""
+        count = f"{self.done}/{self.total}" if self.total is not None else f"{self.done}"
+        percent = f" ({100 * self.done / self.total:.1f}%)" if self.total else ""
+        eta = f" | ETA {format_duration(self.eta())}" if self.total is not None else ""
+        counters = "".join(f" | {name}: {value}" for name, value in self.counters.items())
+        return (f"⏳ {self.name}: {count} {self.unit}{percent} | {self.rate():.1f}/s"
+                f" | {format_duration(self.elapsed())} elapsed{eta}{counters}")
+
+    def metrics(self):
+        """Current metrics as a JSON-serializable dict"""
+        eta = self.eta()
+        return {
+            "name": self.name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            "elapsed_s": round(self.elapsed(), 3),
+            "done": self.done,
+            "total": self.total,
+            "rate_per_s": round(self.rate(), 3),
+            "eta_s": round(eta, 1) if eta is not None else None,
+            "counters": dict(self.counters),
+            "timings_s": {name: round(seconds, 3) for name, seconds in self.timings.items()}
+        }
+
+    def close(self, status="finished"):
+        """Print the last line and write the final metrics"""
+        with self._lock:
+            self.status = status
+            print(self.line())
+            self._write_metrics()
+
+    def _maybe_report(self):
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            print(self.line(), flush=True)
+            self._write_metrics()
+
+    def _write_metrics(self):
+        if self.metrics_path is None:
+            return
+        # Written next to the file, then renamed: readers never see a partial file
+        partial_path = f"{self.metrics_path}.partial"
+        with open(partial_path, "w") as f:
+            json.dump(self.metrics(), f, indent=2)
+        os.replace(partial_path, self.metrics_path)
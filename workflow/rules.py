@@ -0,0 +1,162 @@
+"""
+Declarative property rules evaluated over whole descriptor tables.
+
+Scores and classifications (Lipinski pass, QED class, kinase score, ADMET
+labels, ...) are written as data instead of per-molecule if chains, for
+example in a JSON file:
+
+    {
+      "lipinski_violations": {
+        "type": "score",
+        "terms": [{"when": {"molecular_weight": {"gt": 500}}, "weight": 1},
+                  {"when": {"logP": {"gt": 5}}, "weight": 1}]
+      },
+      "lipinski_pass": {
+        "type": "classify",
+        "cases": [{"when": {"lipinski_violations": {"le": 1}}, "label": "Yes"}],
+        "default": "No"
+      }
+    }
+
+Each rule creates the column of its name, in file order, so a rule can use
+the columns created by the rules above it. A condition maps column names to
+comparisons (gt, ge, lt, le, eq, ne); all must hold. Rule types:
+
+    score:    sum of the weights of the terms whose condition holds
+    classify: label of the first case whose condition holds, else default
+    linear:   intercept + sum of coefficient * column
+
+Rows where a column used by the rule is missing get the rule's "missing"
+value (default: empty). Rules with "keep": false are only intermediate
+values and are dropped from the result. Every rule compiles to a few
+vectorized pandas/NumPy operations over the whole table, so re-evaluating
+millions of rows under new thresholds takes milliseconds.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+RULE_TYPES = ("score", "classify", "linear")
+
+COMPARISONS = {
+    "gt": lambda values, threshold: values > threshold,
+    "ge": lambda values, threshold: values >= threshold,
+    "lt": lambda values, threshold: values < threshold,
+    "le": lambda values, threshold: values <= threshold,
+    "eq": lambda values, threshold: values == threshold,
+    "ne": lambda values, threshold: values != threshold
+}
+
+def load_rules(path):
+    """Read a rule file (JSON object of rules, see the module documentation)"""
+    with open(path, "r") as f:
+        return json.load(f)
+
+def rule_columns(rule):
+    """Columns a rule reads"""
+    if rule["type"] == "score":
+        conditions = [term["when"] for term in rule["terms"]]
+    elif rule["type"] == "classify":
+        conditions = [case["when"] for case in rule["cases"]]
+    else:
+        return list(rule["coefficients"])
+    return list(dict.fromkeys(column for condition in conditions for column in condition))
+
+def validate_rules(rules):
+    """Raise ValueError for an unknown rule type or comparison"""
+    for name, rule in rules.items():
+        if rule.get("type") not in RULE_TYPES:
+            raise ValueError(f"Rule '{name}': unknown type {rule.get('type')!r} (use {', '.join(RULE_TYPES)})")
+        conditions = ([term["when"] for term in rule.get("terms", [])]
+                      + [case["when"] for case in rule.get("cases", [])])
+        for condition in conditions:
+            for column, comparisons in condition.items():
+                unknown = set(comparisons) - set(COMPARISONS)
+                if unknown:
+                    raise ValueError(f"Rule '{name}', column '{column}': unknown comparison "
+                                     f"{', '.join(sorted(unknown))} (use {', '.join(COMPARISONS)})")
+
+def column_values(series):
+    """Column as a NumPy array: float (NaN when missing) for numbers and flags, object otherwise"""
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=float, na_value=np.nan)
+    return series.to_numpy(dtype=object)
+
+def evaluate_condition(columns, condition, n_rows):
+    """Boolean array: rows where every comparison of the condition holds (missing values never do)"""
+    mask = np.ones(n_rows, dtype=bool)
+    for column, comparisons in condition.items():
+        values = columns[column]
+        for op, threshold in comparisons.items():
+            mask &= np.asarray(COMPARISONS[op](values, threshold), dtype=bool)
+    return mask
+
+def evaluate_rule(columns, rule, index):
+    """
+    Values of one rule over the whole table.
+
+    Args:
+        columns: {column: NumPy array} of the columns the rule reads
+        rule: Rule definition
+        index: Index of the table
+
+    Returns:
+        Series: One value per row
+    """
+    n_rows = len(index)
+    if rule["type"] == "score":
+        values = np.zeros(n_rows)
+        for term in rule["terms"]:
+            values += np.where(evaluate_condition(columns, term["when"], n_rows), term.get("weight", 1), 0)
+    elif rule["type"] == "classify":
+        masks = [evaluate_condition(columns, case["when"], n_rows) for case in rule["cases"]]
+        labels = np.array([case["label"] for case in rule["cases"]] + [rule.get("default")], dtype=object)
+        values = labels[np.select(masks, np.arange(len(masks)), len(masks))]
+    else:
+        values = np.full(n_rows, float(rule.get("intercept", 0.0)))
+        for column, coefficient in rule["coefficients"].items():
+            values = values + coefficient * columns[column]
+
+    missing = np.zeros(n_rows, dtype=bool)
+    for values_read in columns.values():
+        missing |= np.isnan(values_read) if values_read.dtype == float else pd.isna(values_read)
+    if missing.any():
+        fill = rule.get("missing")
+        if rule["type"] != "classify" and fill is not None:
+            values = values.astype(object)
+        elif fill is None and rule["type"] != "classify":
+            fill = np.nan  # Numeric rules stay numeric
+        values[missing] = fill
+    return pd.Series(values, index=index, dtype=values.dtype)
+
+def apply_rules(df, rules, only=None):
+    """
+    Evaluate rules over a descriptor table.
+
+    Args:
+        df: Table holding the columns the rules read
+        rules: Dict of rules, in evaluation order
+        only: Optional list of rule names to evaluate (the others are skipped)
+
+    Returns:
+        DataFrame: A copy of df with one column per kept rule
+    """
+    validate_rules(rules)
+    created = {}
+    temporary = []
+    for name, rule in rules.items():
+        if only is not None and name not in only:
+            continue
+        absent = [column for column in rule_columns(rule) if column not in created and column not in df]
+        if absent:
+            raise ValueError(f"Rule '{name}' needs the column(s) {', '.join(absent)}")
+        columns = {column: column_values(created[column] if column in created else df[column])
+                   for column in rule_columns(rule)}
+        created[name] = evaluate_rule(columns, rule, df.index)
+        if not rule.get("keep", True):
+            temporary.append(name)
+
+    kept = {name: values for name, values in created.items() if name not in temporary}
+    return df.assign(**kept)
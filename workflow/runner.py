@@ -0,0 +1,299 @@
+"""
+Shared runner of the external tools (scrub.py, mk_prepare_ligand.py, vina, boltz).
+
+Each step script used to call subprocess.run in a loop: one tool at a
+time, no timeout (a hung vina or boltz stalls the whole batch) and the
+output buffered in memory. The runner executes jobs with asyncio:
+
+    runner = CommandRunner(concurrency=4, timeout=3600, retries=2, log_dir="logs",
+                           quarantine=Quarantine("quarantine.json"))
+    jobs = (Job(ligand_id, [Step("vina", cmd, stdout=score_path)]) for ligand_id, cmd, score_path in ...)
+    runner.run(jobs, on_result=lambda result: print(result.key, result.status))
+
+- At most `concurrency` jobs run at the same time; the jobs are pulled
+  from the iterable as slots free up, so a generator over a large
+  library is never held in memory.
+- The steps of a job run one after the other. A step that exits with an
+  error or runs longer than `timeout` seconds (its whole process group is
+  then killed) is retried up to `retries` times, waiting backoff, 2 x
+  backoff, 4 x backoff... seconds in between.
+- stdout and stderr go straight to files: stdout to the step's output
+  file (written as <file>.partial and renamed on success, so an
+  interrupted run never leaves a truncated output), stderr to
+  <log_dir>/<key>-<step>.log, which is removed when the step succeeds
+  (temporary files without log_dir). An error message ends with the last
+  lines of the log.
+- A job that still fails after its retries counts as a failure of its key
+  in the quarantine file; the keys that failed in `max_failures` runs are
+  skipped (status 'quarantined') until they are removed from the file.
+
+A missing executable stops the whole run (ExecutableNotFound), since no
+job can succeed.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import tempfile
+import time
+from pathlib import Path
+
+class ExecutableNotFound(RuntimeError):
+    """The program of a step is not installed or not in the PATH"""
+
+class Step:
+    """
+    One command of a job.
+
+    Args:
+        name: Name of the tool, used for the log file and the timings (e.g. 'vina')
+        cmd: Command line (list of arguments)
+        stdout: Optional file receiving the standard output (else it goes to the log)
+        cwd: Optional working directory
+    """
+
+    def __init__(self, name, cmd, stdout=None, cwd=None):
+        self.name = name
+        self.cmd = [str(argument) for argument in cmd]
+        self.stdout = stdout
+        self.cwd = cwd
+
+class Job:
+    """
+    Steps run one after the other for one key (usually a ligand id).
+
+    Args:
+        key: Identifier of the job in the results, logs and quarantine
+        steps: List of Step
+        data: Anything the caller wants back in the result
+    """
+
+    def __init__(self, key, steps, data=None):
+        self.key = str(key)
+        self.steps = steps
+        self.data = data
+
+class JobResult:
+    """
+    Outcome of a job.
+
+    Attributes:
+        job: The Job
+        status: 'done', 'failed' or 'quarantined'
+        error: Error message of the failed step (None if done)
+        attempts: Number of command executions (retries included)
+        seconds: Wall time of the job
+        step_seconds: {step name: seconds spent in it}
+    """
+
+    def __init__(self, job, status, error=None, attempts=0, seconds=0.0, step_seconds=None):
+        self.job = job
+        self.status = status
+        self.error = error
+        self.attempts = attempts
+        self.seconds = seconds
+        self.step_seconds = step_seconds or {}
+
+    @property
+    def key(self):
+        return self.job.key
+
+    @property
+    def ok(self):
+        return self.status == "done"
+
+class Quarantine:
+    """
+    Keys that keep failing, stored in a JSON file.
+
+    Args:
+        path: JSON file (created when the first failure is recorded)
+        max_failures: Number of failed runs after which a key is skipped
+    """
+
+    def __init__(self, path, max_failures=3):
+        self.path = str(path)
+        self.max_failures = max_failures
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        self._changed = False
+
+    def __contains__(self, key):
+        entry = self.entries.get(str(key))
+        return entry is not None and entry["failures"] >= self.max_failures
+
+    def failed(self, key, error):
+        entry = self.entries.setdefault(str(key), {"failures": 0})
+        entry.update(failures=entry["failures"] + 1, error=error, updated_at=time.time())
+        self._changed = True
+
+    def succeeded(self, key):
+        if self.entries.pop(str(key), None) is not None:
+            self._changed = True
+
+    def quarantined(self):
+        """Keys skipped by the runner"""
+        return [key for key in self.entries if key in self]
+
+    def save(self):
+        if not self._changed:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(temporary, self.path)
+        self._changed = False
+
+def log_tail(log_file, lines=10):
+    """Last lines of a log file object"""
+    log_file.flush()
+    log_file.seek(0)
+    return "\n".join(log_file.read().decode(errors="replace").strip().splitlines()[-lines:])
+
+class CommandRunner:
+    """
+    Run jobs of external commands with bounded concurrency, timeouts and retries.
+
+    Args:
+        concurrency: Maximum number of jobs running at the same time
+        timeout: Maximum seconds of one command (None = no limit)
+        retries: Number of new attempts of a failed command
+        backoff: Seconds before the first retry (doubled at each retry)
+        log_dir: Folder of the stderr logs (None = temporary files)
+        quarantine: Optional Quarantine of the keys that keep failing
+    """
+
+    def __init__(self, concurrency=1, timeout=None, retries=0, backoff=5.0, log_dir=None, quarantine=None):
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.log_dir = Path(log_dir) if log_dir else None
+        self.quarantine = quarantine
+
+    def run(self, jobs, on_result=None):
+        """
+        Run all the jobs; on_result is called with each JobResult as soon as it is known.
+
+        Returns:
+            dict: Number of jobs by status
+        """
+        counts = {"done": 0, "failed": 0, "quarantined": 0}
+        if self.log_dir is not None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            asyncio.run(self._run_all(iter(jobs), on_result, counts))
+        finally:
+            if self.quarantine is not None:
+                self.quarantine.save()
+        return counts
+
+    async def _run_all(self, jobs, on_result, counts):
+        async def worker():
+            # Each worker pulls the next job when it is free
+            for job in jobs:
+                if self.quarantine is not None and job.key in self.quarantine:
+                    result = JobResult(job, "quarantined", error="quarantined after repeated failures")
+                else:
+                    result = await self.run_job(job)
+                    if self.quarantine is not None:
+                        if result.ok:
+                            self.quarantine.succeeded(job.key)
+                        else:
+                            self.quarantine.failed(job.key, result.error)
+                counts[result.status] += 1
+                if on_result is not None:
+                    on_result(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+    async def run_job(self, job):
+        """Run the steps of a job in order, retrying each one, and stop at the first failure"""
+        started = time.perf_counter()
+        attempts = 0
+        step_seconds = {}
+        for step in job.steps:
+            for attempt in range(self.retries + 1):
+                if attempt > 0:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                attempts += 1
+                step_started = time.perf_counter()
+                error = await self.run_step(job, step)
+                step_seconds[step.name] = step_seconds.get(step.name, 0.0) + time.perf_counter() - step_started
+                if error is None:
+                    break
+            if error is not None:
+                return JobResult(job, "failed", f"{step.name} {error}", attempts, time.perf_counter() - started,
+                                 step_seconds)
+        return JobResult(job, "done", None, attempts, time.perf_counter() - started, step_seconds)
+
+    async def run_step(self, job, step):
+        """
+        Run one command once.
+
+        Returns:
+            str: Error message, or None if the command succeeded
+        """
+        if self.log_dir is not None:
+            log_path = self.log_dir / f"{job.key}-{step.name}.log"
+            log_file = open(log_path, 'w+b')
+        else:
+            log_path = None
+            log_file = tempfile.TemporaryFile()
+        partial = f"{step.stdout}.partial" if step.stdout is not None else None
+        output = open(partial, 'wb') if partial is not None else log_file
+        error = "interrupted"
+
+        try:
+            try:
+                # Own session: a timeout kills the tool and the processes it started
+                process = await asyncio.create_subprocess_exec(
+                    *step.cmd, stdin=asyncio.subprocess.DEVNULL, stdout=output, stderr=log_file,
+                    cwd=step.cwd, start_new_session=True)
+            except FileNotFoundError:
+                raise ExecutableNotFound(f"'{step.cmd[0]}' not found. Check your PATH.") from None
+
+            try:
+                returncode = await asyncio.wait_for(process.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                kill_process_group(process)
+                await process.wait()
+                error = f"timed out after {self.timeout:g} s"
+            except asyncio.CancelledError:
+                kill_process_group(process)
+                raise
+            else:
+                error = None if returncode == 0 else f"exited with code {returncode}"
+
+            if error is not None:
+                tail = log_tail(log_file)
+                return error + (f"\n{tail}" if tail else "")
+            if partial is not None:
+                output.close()
+                os.replace(partial, step.stdout)
+            return None
+        finally:
+            if partial is not None:
+                output.close()
+                if os.path.exists(partial):
+                    os.remove(partial)
+            log_file.close()
+            # The log is only kept for the failed attempts
+            if log_path is not None and error is None:
+                log_path.unlink()
+
+def kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
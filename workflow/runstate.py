@@ -0,0 +1,222 @@
+"""
+Persistent state of a workflow run.
+
+Without it, the state of a run is only visible in the file names
+(<id>-prepared.pdbqt, <id>-vina-score.txt, boltz_results_<id>), and each
+step recovers it by listing large directories. The run state is a SQLite
+file holding, for every ligand and stage, the status (running, done or
+failed), the paths of the files written, the time spent, the number of
+attempts and the last error:
+
+    state = RunState("run-state.db")
+    state.register(zip(ids, smiles))
+    for ligand_id, smiles, upstream in state.pending("dock", after="prepare"):
+        state.start("dock", ligand_id)
+        ...
+        state.finish("dock", ligand_id, {"score": score_path}, seconds)
+
+"What is left to do" is an indexed query, and every update is its own
+transaction, so an interrupted run loses at most the ligands in progress.
+Several processes and threads can share the file (SQLite WAL mode); each
+thread opens its own connection.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ligands (
+    id TEXT PRIMARY KEY,
+    smiles TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    stage TEXT NOT NULL,
+    ligand_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    artifacts TEXT,
+    seconds REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (stage, ligand_id)
+);
+CREATE INDEX IF NOT EXISTS stages_status ON stages (stage, status);
+"""
+
+# Ligands inserted or read per statement
+BATCH_SIZE = 1000
+
+class RunState:
+    """
+    Per-ligand, per-stage status of a run.
+
+    Args:
+        path: SQLite file (created if needed)
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # A connection must not be shared between threads or with forked processes
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=60)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.execute("PRAGMA synchronous=NORMAL")
+            local.connection.executescript(SCHEMA)
+            local.pid = os.getpid()
+        return local.connection
+
+    def register(self, ligands):
+        """
+        Add ligands to the run (the ones already known are kept as they are).
+
+        Args:
+            ligands: Iterable of (id, smiles)
+
+        Returns:
+            int: Number of new ligands
+        """
+        batch = []
+        with self.connection as connection:
+            before = connection.total_changes
+            for ligand_id, smiles in ligands:
+                batch.append((str(ligand_id).strip(), str(smiles).strip()))
+                if len(batch) == BATCH_SIZE:
+                    connection.executemany("INSERT OR IGNORE INTO ligands (id, smiles) VALUES (?, ?)", batch)
+                    batch = []
+            if batch:
+                connection.executemany("INSERT OR IGNORE INTO ligands (id, smiles) VALUES (?, ?)", batch)
+            added = connection.total_changes - before
+        return added
+
+    def pending(self, stage, after=None):
+        """
+        Yield the ligands not done yet in a stage, in registration order.
+
+        Ligands that failed or were interrupted (still 'running') are
+        pending again. With after, only the ligands done in that upstream
+        stage are returned, with the artifacts it recorded.
+
+        Yields:
+            tuple: (ligand_id, smiles, artifacts of the upstream stage or {})
+        """
+        if after is None:
+            query = ("SELECT l.rowid, l.id, l.smiles, NULL FROM ligands l "
+                     "LEFT JOIN stages s ON s.stage = ? AND s.ligand_id = l.id "
+                     "WHERE l.rowid > ? AND (s.status IS NULL OR s.status != 'done') "
+                     "ORDER BY l.rowid LIMIT ?")
+            parameters = (stage,)
+        else:
+            query = ("SELECT l.rowid, l.id, l.smiles, u.artifacts FROM ligands l "
+                     "JOIN stages u ON u.stage = ? AND u.ligand_id = l.id AND u.status = 'done' "
+                     "LEFT JOIN stages s ON s.stage = ? AND s.ligand_id = l.id "
+                     "WHERE l.rowid > ? AND (s.status IS NULL OR s.status != 'done') "
+                     "ORDER BY l.rowid LIMIT ?")
+            parameters = (after, stage)
+
+        # Read by pages, so that the caller can update the stage while iterating
+        last_rowid = 0
+        while True:
+            rows = self.connection.execute(query, (*parameters, last_rowid, BATCH_SIZE)).fetchall()
+            for rowid, ligand_id, smiles, artifacts in rows:
+                yield ligand_id, smiles, json.loads(artifacts) if artifacts else {}
+            if len(rows) < BATCH_SIZE:
+                return
+            last_rowid = rows[-1][0]
+
+    def count_pending(self, stage, after=None):
+        """Number of ligands pending() would yield"""
+        if after is None:
+            query = ("SELECT COUNT(*) FROM ligands l "
+                     "LEFT JOIN stages s ON s.stage = ? AND s.ligand_id = l.id "
+                     "WHERE s.status IS NULL OR s.status != 'done'")
+            parameters = (stage,)
+        else:
+            query = ("SELECT COUNT(*) FROM stages u "
+                     "LEFT JOIN stages s ON s.stage = ? AND s.ligand_id = u.ligand_id "
+                     "WHERE u.stage = ? AND u.status = 'done' AND (s.status IS NULL OR s.status != 'done')")
+            parameters = (stage, after)
+        return self.connection.execute(query, parameters).fetchone()[0]
+
+    def get(self, stage, ligand_id):
+        """
+        Record of one ligand in one stage.
+
+        Returns:
+            dict: status, artifacts, seconds, attempts and error (None if never started)
+        """
+        row = self.connection.execute(
+            "SELECT status, artifacts, seconds, attempts, error FROM stages WHERE stage = ? AND ligand_id = ?",
+            (stage, str(ligand_id))).fetchone()
+        if row is None:
+            return None
+        status, artifacts, seconds, attempts, error = row
+        return {"status": status, "artifacts": json.loads(artifacts) if artifacts else {},
+                "seconds": seconds, "attempts": attempts, "error": error}
+
+    def start(self, stage, ligand_id):
+        """Mark a ligand as running in a stage (counts one more attempt)"""
+        with self.connection as connection:
+            connection.execute(
+                "INSERT INTO stages (stage, ligand_id, status, attempts, updated_at) VALUES (?, ?, 'running', 1, ?) "
+                "ON CONFLICT (stage, ligand_id) DO UPDATE SET status = 'running', error = NULL, "
+                "attempts = attempts + 1, updated_at = excluded.updated_at",
+                (stage, str(ligand_id), time.time()))
+
+    def finish(self, stage, ligand_id, artifacts=None, seconds=None):
+        """Mark a ligand as done in a stage, with the paths of the files it wrote"""
+        self._set(stage, ligand_id, "done", artifacts, seconds, None)
+
+    def fail(self, stage, ligand_id, error, seconds=None):
+        """Mark a ligand as failed in a stage (it is pending again in the next run)"""
+        self._set(stage, ligand_id, "failed", None, seconds, str(error))
+
+    def artifacts(self, stage):
+        """
+        Artifacts of the ligands done in a stage.
+
+        Returns:
+            dict: {ligand_id: {name: path}}
+        """
+        rows = self.connection.execute(
+            "SELECT ligand_id, artifacts FROM stages WHERE stage = ? AND status = 'done'", (stage,))
+        return {ligand_id: json.loads(artifacts) if artifacts else {} for ligand_id, artifacts in rows}
+
+    def counts(self, stage):
+        """
+        Number of ligands of a stage by status.
+
+        Returns:
+            dict: {'pending', 'running', 'done', 'failed'} counts, pending
+                  being all the ligands not done (running and failed included)
+        """
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update(self.connection.execute(
+            "SELECT status, COUNT(*) FROM stages WHERE stage = ? GROUP BY status", (stage,)).fetchall())
+        total = self.connection.execute("SELECT COUNT(*) FROM ligands").fetchone()[0]
+        counts["pending"] = total - counts["done"]
+        return counts
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+        self._local.connection = None
+
+    def _set(self, stage, ligand_id, status, artifacts, seconds, error):
+        with self.connection as connection:
+            connection.execute(
+                "INSERT INTO stages (stage, ligand_id, status, artifacts, seconds, attempts, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT (stage, ligand_id) DO UPDATE SET status = excluded.status, "
+                "artifacts = excluded.artifacts, seconds = excluded.seconds, error = excluded.error, "
+                "updated_at = excluded.updated_at",
+                (stage, str(ligand_id), status, json.dumps(artifacts) if artifacts else None, seconds, error,
+                 time.time()))
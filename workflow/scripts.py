@@ -0,0 +1,32 @@
+"""
+Access to the workflow scripts from other scripts.
+
+The steps are stored as hyphenated files (e.g. boltz-predictions.py), which
+cannot be imported with a regular import statement.
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+# Repository root, used to locate the scripts from any working directory
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def load_script(path):
+    """
+    Load a workflow script as a module without running its __main__ block.
+
+    Args:
+        path: Path of the script, absolute or relative to the repository root
+    """
+    path = Path(path)
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    module_name = path.stem.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered like an imported module, so its functions can be pickled
+    # (e.g. sent to the process pool of additional-descriptor.py)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
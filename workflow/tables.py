@@ -0,0 +1,285 @@
+"""
+Reading and writing the ligand tables exchanged between the workflow steps.
+
+CSV stays the default and human-readable format. Parquet (.parquet) and
+Arrow IPC (.arrow / .feather) files keep the column types (no float
+re-stringification between steps), can be read column by column, and are
+memory-mapped when read. pyarrow is only needed for the columnar formats.
+"""
+
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# File suffix of each supported table format
+TABLE_SUFFIXES = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "arrow": ".arrow"
+}
+
+FORMAT_OF_SUFFIX = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow"
+}
+
+def _pyarrow():
+    """Import pyarrow only when a columnar file is used"""
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet/Arrow tables need pyarrow - install with: pip install pyarrow") from None
+    return pyarrow
+
+def table_format(path):
+    """Format name ('csv', 'parquet' or 'arrow') from the file suffix"""
+    suffix = Path(path).suffix.lower()
+    if suffix not in FORMAT_OF_SUFFIX:
+        raise ValueError(f"Unknown table format for {path} (use {', '.join(FORMAT_OF_SUFFIX)})")
+    return FORMAT_OF_SUFFIX[suffix]
+
+def with_format(path, fmt):
+    """Same path with the suffix of another format, e.g. list.csv -> list.parquet"""
+    if fmt not in TABLE_SUFFIXES:
+        raise ValueError(f"Unknown table format '{fmt}' (use {', '.join(TABLE_SUFFIXES)})")
+    return str(Path(path).with_suffix(TABLE_SUFFIXES[fmt]))
+
+def find_table(path):
+    """
+    Locate a table, accepting any supported format.
+
+    The same name with the other table suffixes is also looked up, so a step
+    configured for list.csv also reads list.parquet. When several formats
+    exist, the most recently written one is used, and a columnar file is
+    preferred over its .csv copy (write_table gives the copy the same
+    modification time), so a stale table of an earlier run is never read.
+
+    Returns:
+        str: Path of the existing table, or None
+    """
+    candidates = [Path(path)] + [Path(path).with_suffix(suffix) for suffix in TABLE_SUFFIXES.values()]
+    found = None
+    for candidate in candidates:
+        if not candidate.exists():
+            continue
+        key = (candidate.stat().st_mtime, candidate.suffix.lower() != ".csv")
+        if found is None or key > found[0]:
+            found = (key, candidate)
+    return str(found[1]) if found is not None else None
+
+def mark_csv_copy(csv_path, path):
+    """Give a .csv copy the modification time of its columnar file (see find_table)"""
+    stat = os.stat(path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+def table_columns(path):
+    """Column names of a table, reading only its header or schema"""
+    path = find_table(path) or path
+    fmt = table_format(path)
+    if fmt == "csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    pa = _pyarrow()
+    if fmt == "parquet":
+        return pa.parquet.read_schema(path).names
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).schema.names
+
+def table_rows(path):
+    """Number of rows of a table, without parsing it (used for progress and ETA)"""
+    found = find_table(path)
+    if found is None:
+        raise FileNotFoundError(f"Table not found: {path}")
+    fmt = table_format(found)
+    if fmt == "csv":
+        # Line count minus the header (quoted multi-line fields are counted twice)
+        lines = 0
+        last = b"\n"
+        with open(found, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+        return lines + (last != b"\n") - 1
+    pa = _pyarrow()
+    if fmt == "parquet":
+        return pa.parquet.ParquetFile(found).metadata.num_rows
+    with pa.memory_map(str(found)) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+def read_table(path, columns=None):
+    """
+    Read a ligand table as a DataFrame.
+
+    Args:
+        path: Table path (.csv, .parquet, .arrow); other formats of the same
+              name are used if this file does not exist
+        columns: Optional list of columns to load (others are never parsed)
+    """
+    found = find_table(path)
+    if found is None:
+        raise FileNotFoundError(f"Table not found: {path}")
+
+    fmt = table_format(found)
+    if fmt == "csv":
+        df = pd.read_csv(found, usecols=columns)
+        return df[columns] if columns is not None else df
+
+    pa = _pyarrow()
+    if fmt == "parquet":
+        table = pa.parquet.read_table(found, columns=columns, memory_map=True)
+    else:
+        table = pa.feather.read_table(found, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+def write_table(df, path, csv_copy=False):
+    """
+    Write a ligand table in the format given by the path suffix.
+
+    Args:
+        df: DataFrame to write (the index is not saved)
+        path: Output path (.csv, .parquet, .arrow)
+        csv_copy: Also write a human-readable .csv next to a columnar file
+
+    Returns:
+        list: Paths written
+    """
+    fmt = table_format(path)
+    written = [str(path)]
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return written
+
+    pa = _pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == "parquet":
+        pa.parquet.write_table(table, path)
+    else:
+        # Uncompressed IPC files can be memory-mapped without a copy
+        pa.feather.write_feather(table, path, compression="uncompressed")
+
+    if csv_copy:
+        csv_path = with_format(path, "csv")
+        df.to_csv(csv_path, index=False)
+        mark_csv_copy(csv_path, path)
+        written.append(csv_path)
+    return written
+
+def iter_table_chunks(path, chunksize, columns=None):
+    """
+    Read a ligand table in DataFrames of at most chunksize rows.
+
+    Only one chunk is held in memory at a time, whatever the table size.
+
+    Args:
+        path: Table path (.csv, .parquet, .arrow)
+        chunksize: Maximum number of rows per chunk
+        columns: Optional list of columns to load
+    """
+    found = find_table(path)
+    if found is None:
+        raise FileNotFoundError(f"Table not found: {path}")
+
+    fmt = table_format(found)
+    if fmt == "csv":
+        for chunk in pd.read_csv(found, usecols=columns, chunksize=chunksize):
+            yield chunk[columns] if columns is not None else chunk
+        return
+
+    pa = _pyarrow()
+    if fmt == "parquet":
+        parquet_file = pa.parquet.ParquetFile(found, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    with pa.memory_map(str(found)) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            # Record batches can be larger than the requested chunks
+            for start in range(0, batch.num_rows, chunksize):
+                yield batch.slice(start, chunksize).to_pandas()
+
+def unified_schema(paths):
+    """
+    Schema that fits all the given columnar tables.
+
+    A column that is all missing in one table has the null type there; it
+    gets the type it has in the others (e.g. string), so that the tables
+    can be written one after the other with a TableWriter.
+    """
+    pa = _pyarrow()
+    schemas = []
+    for path in paths:
+        if table_format(path) == "parquet":
+            schemas.append(pa.parquet.read_schema(path))
+        else:
+            with pa.memory_map(str(path)) as source:
+                schemas.append(pa.ipc.open_file(source).schema)
+    return pa.unify_schemas(schemas, promote_options="permissive").remove_metadata()
+
+class TableWriter:
+    """
+    Write a ligand table chunk by chunk (use as a context manager).
+
+    The format is given by the path suffix, as in write_table; with
+    csv_copy a .csv copy is written next to a columnar file. The columnar
+    schema is the one of the first chunk, unless a schema is given (see
+    unified_schema): a column that is all missing in the first chunk would
+    otherwise be written with the null type and the next chunks rejected.
+    """
+
+    def __init__(self, path, csv_copy=False, schema=None):
+        self.path = str(path)
+        self.format = table_format(path)
+        self.csv_path = with_format(path, "csv") if csv_copy and self.format != "csv" else None
+        self.rows = 0
+        self._schema = schema
+        self._writer = None
+        self._header_written = False
+
+    def write(self, df):
+        """Append the rows of a DataFrame (same columns for every call)"""
+        if self.format == "csv":
+            df.to_csv(self.path, mode="a" if self._header_written else "w",
+                      header=not self._header_written, index=False)
+        else:
+            pa = _pyarrow()
+            if self._schema is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._schema = table.schema
+            else:
+                # Same types in every chunk (e.g. for a column all missing in some chunks)
+                table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                if self.format == "parquet":
+                    self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(table)
+            if self.csv_path is not None:
+                df.to_csv(self.csv_path, mode="a" if self._header_written else "w",
+                          header=not self._header_written, index=False)
+        self._header_written = True
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            if self.csv_path is not None:
+                mark_csv_copy(self.csv_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()